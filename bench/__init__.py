@@ -0,0 +1,7 @@
+"""
+Offline benchmarks for Slurp.
+
+These run Slurp's real pipeline against local stand-ins for the services it normally talks to, so that performance
+work can be compared over time without depending on YouTube, the BBC or a Cobalt instance being reachable.
+See the "Benchmarks" section of the README for usage.
+"""
@@ -0,0 +1,316 @@
+"""
+End-to-end pipeline benchmark.
+
+Runs slurp.create_fetch / slurp.fetch eagerly (in-process, no broker) against a fake Cobalt server and a fake
+get_iplayer binary, then reports job throughput, per-stage timings, per-event overhead and finaliser throughput.
+
+Usage:
+    python -m bench.pipeline --fakeredis
+    python -m bench.pipeline --redis-url redis://localhost:6379/0 --jobs 50 --concurrency 4 --json results.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from bench import stubs
+
+_MiB = 1024 * 1024
+
+# Scenario name -> (URL template, cobalt mode).
+_SCENARIOS = {
+    "cobalt-tunnel": ("https://bench.invalid/watch?v={n}", "tunnel"),
+    "cobalt-redirect": ("https://bench.invalid/watch?v={n}", "redirect"),
+    "iplayer": ("https://www.bbc.co.uk/iplayer/episode/b{n:07d}", None),
+}
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct), len(values) - 1)]
+
+
+def _summarise(values: list[float]) -> dict[str, float]:
+    return {
+        "mean": statistics.fmean(values) if values else 0.0,
+        "p50": _percentile(values, 0.5),
+        "p95": _percentile(values, 0.95),
+    }
+
+
+def _timed(fn: Callable[[], object], iterations: int) -> float:
+    """_timed returns the mean wall time of fn in seconds."""
+    ts_start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - ts_start) / iterations
+
+
+def run_scenario(app, cobalt: stubs.FakeCobalt, name: str, args) -> dict:
+    from slurp.fetchers.types import Format
+    from slurp.models import Fetch
+    from slurp.tasks import create_fetch
+
+    url_template, mode = _SCENARIOS[name]
+    if mode is not None:
+        cobalt.mode = mode
+    target = app.config["OUTPUTS"][0]
+
+    def one(n: int) -> str:
+        result = create_fetch.apply(
+            kwargs={
+                "url": url_template.format(n=n),
+                "fmt": Format.VIDEO_AUDIO.value,
+                "target": target,
+                "slug": f"bench-{name}-{n}",
+            }
+        )
+        return result.get(disable_sync_subtasks=False)
+
+    # Count writes to the Celery result backend separately, as they don't go through our Redis in fakeredis mode.
+    # Backends are per-thread, so patch the class.
+    backend = type(app.extensions["celery"].backend)
+    store_result = backend.store_result
+    backend_writes = 0
+
+    def _store_result(*a, **kw):
+        nonlocal backend_writes
+        backend_writes += 1
+        return store_result(*a, **kw)
+
+    backend.store_result = _store_result
+    ts_start = time.perf_counter()
+    try:
+        with (
+            ThreadPoolExecutor(max_workers=args.concurrency) as pool,
+            stubs.RedisCounter() as redis,
+        ):
+            pks = list(pool.map(one, range(args.jobs)))
+    finally:
+        backend.store_result = store_result
+    elapsed = time.perf_counter() - ts_start
+
+    stages: dict[str, list[float]] = defaultdict(list)
+    throughputs: list[float] = []
+    succeeded = 0
+    for pk in pks:
+        fetch = Fetch.get(pk)
+        if fetch.status == Fetch.TaskStatus.success:
+            succeeded += 1
+        for stage in fetch.stages:
+            stages[stage.name].append(stage.duration)
+        if fetch.throughput:
+            throughputs.append(fetch.throughput)
+
+    # Clear out the output, so repeated runs don't fill the disk.
+    for entry in os.scandir(target):
+        if entry.name.startswith(f"bench-{name}-"):
+            os.unlink(entry.path)
+
+    return {
+        "jobs": args.jobs,
+        "succeeded": succeeded,
+        "elapsed": elapsed,
+        "jobs_per_second": args.jobs / elapsed,
+        "redis_commands_per_job": redis.commands / args.jobs,
+        "redis_round_trips_per_job": redis.round_trips / args.jobs,
+        "backend_writes_per_job": backend_writes / args.jobs,
+        "stages": {k: _summarise(v) for k, v in stages.items()},
+        "throughput": _summarise(throughputs),
+    }
+
+
+def run_event_overhead(app, args) -> dict:
+    """run_event_overhead measures the cost of a single progress event, as tasks.fetch would emit it."""
+    from slurp.models import Fetch
+    from slurp.progress import ProgressReporter
+    from slurp.tasks import fetch
+
+    task = Fetch(url="https://bench.invalid/", slug="bench-events", target="/")
+    task.worker_id = task.pk
+    task.save()
+    # There's no task request here, so the state is written against the fetch's (stand-in) worker_id.
+    progress = ProgressReporter(
+        fetch, task, app.config["PROGRESS_STATE_INTERVAL"], task_id=task.worker_id
+    )
+    event = _timed(
+        lambda: progress.event("log", "info", "[download] 42.0% of 10.00MiB"),
+        args.events,
+    )
+    emit = _timed(
+        lambda: task.emit_event("log", "info", "[download] 42.0% of 10.00MiB"),
+        args.events,
+    )
+    update_state = _timed(
+        lambda: fetch.update_state(task_id=task.pk, state="PROGRESS", meta={"n": 1}),
+        args.events,
+    )
+    save = _timed(task.save, args.events)
+    save_fields = _timed(lambda: task.save_fields("status"), args.events)
+    return {
+        "emit_event_us": emit * 1e6,
+        "update_state_us": update_state * 1e6,
+        "save_us": save * 1e6,
+        "save_fields_us": save_fields * 1e6,
+        "total_us": event * 1e6,
+    }
+
+
+def run_finalise(app, args) -> dict:
+    """run_finalise measures how quickly the finaliser validates and moves media into a target."""
+    from slurp.finaliser import finalise
+
+    target = app.config["OUTPUTS"][0]
+    size = args.size * _MiB
+    elapsed = 0.0
+    with tempfile.TemporaryDirectory(dir=app.config["OUTPUT_TEMP"]) as tmp:
+        for n in range(args.finalise_runs):
+            src = os.path.join(tmp, f"bench-finalise-{n}.mp4")
+            with open(src, "wb") as f:
+                f.truncate(size)
+            ts_start = time.perf_counter()
+            for _ in finalise(src, target):
+                pass
+            elapsed += time.perf_counter() - ts_start
+            os.unlink(os.path.join(target, os.path.basename(src)))
+    return {
+        "runs": args.finalise_runs,
+        "mean_s": elapsed / args.finalise_runs,
+        "mib_per_second": args.size * args.finalise_runs / elapsed,
+    }
+
+
+def _print_report(report: dict):
+    print(f"\nSlurp pipeline benchmark ({report['redis']})")
+    for name, result in report["scenarios"].items():
+        print(
+            f"\n{name}: {result['succeeded']}/{result['jobs']} succeeded in {result['elapsed']:.2f}s "
+            f"- {result['jobs_per_second']:.2f} jobs/s, "
+            f"{result['throughput']['mean'] / _MiB:.1f} MiB/s mean download"
+        )
+        print(
+            f"  per job: {result['redis_commands_per_job']:.0f} Redis commands in "
+            f"{result['redis_round_trips_per_job']:.0f} round trips, "
+            f"{result['backend_writes_per_job']:.0f} result backend writes"
+        )
+        for stage, timing in result["stages"].items():
+            print(
+                f"  {stage:<10} mean {timing['mean'] * 1000:8.1f}ms"
+                f"  p50 {timing['p50'] * 1000:8.1f}ms  p95 {timing['p95'] * 1000:8.1f}ms"
+            )
+    events = report["events"]
+    print(
+        f"\nPer-event overhead: {events['total_us']:.0f}µs "
+        f"(emit_event {events['emit_event_us']:.0f}µs, update_state {events['update_state_us']:.0f}µs when due); "
+        f"Fetch.save {events['save_us']:.0f}µs, Fetch.save_fields('status') {events['save_fields_us']:.0f}µs"
+    )
+    fin = report["finalise"]
+    print(
+        f"Finalise: {fin['mib_per_second']:.1f} MiB/s ({fin['mean_s'] * 1000:.1f}ms mean over {fin['runs']} runs)"
+    )
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    redis = parser.add_mutually_exclusive_group()
+    redis.add_argument(
+        "--fakeredis", action="store_true", help="use an in-process fakeredis"
+    )
+    redis.add_argument(
+        "--redis-url",
+        default="redis://localhost:6379/0",
+        help="Redis (with RedisJSON/RediSearch) to run against",
+    )
+    parser.add_argument("--jobs", type=int, default=20, help="jobs per scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel jobs")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(_SCENARIOS),
+        help="scenario to run (repeatable, default all)",
+    )
+    parser.add_argument("--size", type=int, default=4, help="media size in MiB")
+    parser.add_argument(
+        "--bandwidth", type=float, default=None, help="media bandwidth in MiB/s"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="time to first byte in seconds"
+    )
+    parser.add_argument("--events", type=int, default=500, help="events to time")
+    parser.add_argument(
+        "--finalise-runs", type=int, default=10, help="finaliser runs to time"
+    )
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="slurp-bench-")
+    try:
+        for d in ("bin", "out", "tmp"):
+            os.makedirs(os.path.join(work_dir, d))
+
+        cobalt = stubs.FakeCobalt(
+            size=args.size * _MiB,
+            bandwidth=int(args.bandwidth * _MiB) if args.bandwidth else None,
+            latency=args.latency,
+        ).start()
+        stubs.install_fake_get_iplayer(
+            os.path.join(work_dir, "bin"), size=args.size * _MiB, delay=args.latency
+        )
+        if args.fakeredis:
+            stubs.use_fakeredis()
+
+        os.environ |= {
+            "SLURP_SECRET_KEY": "bench",
+            "SLURP_REDIS_URL": args.redis_url,
+            "SLURP_OUTPUTS": os.path.join(work_dir, "out"),
+            "SLURP_OUTPUT_TEMP": os.path.join(work_dir, "tmp"),
+            "SLURP_FETCHER_YTDLP_ENABLED": "false",
+            "SLURP_FETCHER_BBC_IPLAYER_ENABLED": "true",
+            "SLURP_FETCHER_COBALT_ENABLED": "true",
+            "SLURP_FETCHER_COBALT_URL": cobalt.url,
+        }
+
+        from slurp import create_app
+
+        app = create_app()
+        celery = app.extensions["celery"]
+        # Run tasks in-process - we're measuring the pipeline, not the broker.
+        celery.conf.update(
+            task_always_eager=True,
+            broker_url="memory://",
+        )
+        if args.fakeredis:
+            celery.conf.result_backend = "cache+memory://"
+
+        report = {
+            "redis": "fakeredis" if args.fakeredis else args.redis_url,
+            "args": vars(args),
+            "scenarios": {},
+        }
+        with app.app_context():
+            for name in args.scenario or list(_SCENARIOS):
+                report["scenarios"][name] = run_scenario(app, cobalt, name, args)
+            report["events"] = run_event_overhead(app, args)
+            report["finalise"] = run_finalise(app, args)
+        cobalt.stop()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
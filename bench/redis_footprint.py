@@ -0,0 +1,329 @@
+"""
+Redis memory footprint benchmark and budget report.
+
+In synthetic mode (the default), generates N Fetch records with realistic metadata and M FetchEvents each through
+the real models, measures the memory they use (including RediSearch index overhead), then removes them again.
+The per-record figures are projected out to the configured retention (PURGE_AFTER / EXPIRE_AFTER) at a given job rate.
+
+In live mode, scans the keyspace and reports actual memory usage by key type.
+
+This needs a real Redis Stack instance, as it relies on MEMORY USAGE and FT.INFO.
+
+Usage:
+    python -m bench.redis_footprint --records 500 --events 40 --jobs-per-day 300
+    python -m bench.redis_footprint --live --sample 0.1
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+from collections import defaultdict
+
+_MiB = 1024 * 1024
+
+# Key prefix -> key type, for live mode. The first match wins, so more specific prefixes go first.
+_KEY_TYPES = [
+    (":slurp.models.task.FetchEvent:", "FetchEvent"),
+    (":slurp.models.task.Fetch:", "Fetch"),
+    ("slurp:prune_schedule", "Prune schedule"),
+    ("celery-task-meta-", "Celery results"),
+    ("_kombu.binding.", "Celery bindings"),
+    ("unacked", "Celery unacked"),
+]
+
+# A selection of messages in the style of those emitted by each fetcher, to make event records a realistic size.
+_EVENT_MESSAGES = [
+    "[youtube] Extracting URL: https://www.youtube.com/watch?v={vid}",
+    "[youtube] {vid}: Downloading webpage",
+    "[youtube] {vid}: Downloading tv client config",
+    "[info] {vid}: Downloading 1 format(s): 137+140",
+    "[download] Destination: /tmp/slurp_tmp/tmpa1b2c3d4/{slug}.f137.mp4",
+    "[download]  {pct:4.1f}% of  123.45MiB at    3.21MiB/s ETA 00:{eta:02d}",
+    '[Merger] Merging formats into "/tmp/slurp_tmp/tmpa1b2c3d4/{slug}.mp4"',
+    "Media seems fine",
+]
+
+_STAGES = ["queued", "lock", "metadata", "download", "attempt", "validate", "finalise"]
+
+
+def _mb_to_bytes(value) -> float:
+    try:
+        return float(value) * _MiB
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def index_memory(redis, index_name: str) -> dict:
+    """index_memory returns the document count and memory used by the given RediSearch index, in bytes."""
+    info = redis.ft(index_name).info()
+    if "total_index_memory_sz_mb" in info:
+        total = _mb_to_bytes(info["total_index_memory_sz_mb"])
+    else:
+        total = sum(
+            _mb_to_bytes(v)
+            for k, v in info.items()
+            if k.endswith("_sz_mb") or k.endswith("_size_mb")
+        )
+    return {"num_docs": int(info.get("num_docs", 0)), "bytes": total}
+
+
+def _synthesise(n: int, events: int) -> tuple[list, list]:
+    """_synthesise creates n fetches with the given number of events each, returning both."""
+    from slurp.fetchers.types import Format
+    from slurp.models import Fetch, FetchMetadata
+    from slurp.models.task import FetchEvent
+
+    fetches, fetch_events = [], []
+    for i in range(n):
+        vid = "".join(
+            random.choices("abcdefghijklmnopqrstuvwxyzABCDEFGHIJ0123456789_-", k=11)
+        )
+        slug = f"footprint-{i:06d}-news-clip"
+        fetch = Fetch(
+            url=f"https://www.youtube.com/watch?v={vid}",
+            slug=slug,
+            target="/data/ingest",
+            format=Format.VIDEO_AUDIO,
+            status=Fetch.TaskStatus.success,
+            worker_id=f"{random.getrandbits(128):032x}",
+            output_path=f"/data/ingest/{slug}.mp4",
+            meta=FetchMetadata(
+                name="Breaking: Minister answers questions on the economy in the Commons - full statement",
+                author="Parliament Live",
+                author_url="https://www.youtube.com/@ParliamentLive",
+                ts_upload=datetime.datetime.now(datetime.UTC),
+                duration=random.randint(30, 7200),
+                format="137 - 1920x1080 (1080p)+140 - audio only (medium)",
+                thumbnail_url=f"https://i.ytimg.com/vi_webp/{vid}/maxresdefault.webp",
+            ),
+            media_bytes=random.randint(1, 2000) * _MiB,
+            throughput=random.uniform(1, 50) * _MiB,
+        )
+        for stage in _STAGES:
+            fetch.record_stage(stage, fetch.ts_created, "yt-dlp", 0)
+        fetch.save()
+        fetches.append(fetch)
+        for e in range(events):
+            event = FetchEvent(
+                fetch_id=fetch.pk,
+                typ="log",
+                level="info",
+                message=random.choice(_EVENT_MESSAGES).format(
+                    vid=vid, slug=slug, pct=100 * e / events, eta=e % 60
+                ),
+            )
+            event.save()
+            fetch_events.append(event)
+    return fetches, fetch_events
+
+
+def _mean_memory(redis, keys: list[str]) -> float:
+    if not keys:
+        return 0.0
+    pipe = redis.pipeline(transaction=False)
+    for key in keys:
+        pipe.memory_usage(key, samples=0)
+    return sum(u or 0 for u in pipe.execute()) / len(keys)
+
+
+def run_synthetic(redis, app, args) -> dict:
+    from slurp.models import Fetch
+    from slurp.models.task import FetchEvent
+
+    indexes = {"Fetch": Fetch.Meta.index_name, "FetchEvent": FetchEvent.Meta.index_name}
+    before = {k: index_memory(redis, v) for k, v in indexes.items()}
+    fetches, events = _synthesise(args.records, args.events)
+    try:
+        after = {k: index_memory(redis, v) for k, v in indexes.items()}
+        fetch_bytes = _mean_memory(redis, [f.key() for f in fetches])
+        event_bytes = _mean_memory(redis, [e.key() for e in events])
+        index_bytes = {
+            k: (after[k]["bytes"] - before[k]["bytes"])
+            / max(after[k]["num_docs"] - before[k]["num_docs"], 1)
+            for k in indexes
+        }
+    finally:
+        if not args.keep:
+            redis.delete(*[f.key() for f in fetches], *[e.key() for e in events])
+
+    # Events expire PURGE_AFTER after they're written. Finished fetch records expire EXPIRE_AFTER after their last
+    # write - which, for successful ones, is their prune - unless that's disabled, in which case they pile up over the
+    # horizon.
+    prune_after = args.prune_after or app.config["PRUNE_AFTER"]
+    purge_after = args.purge_after or app.config["PURGE_AFTER"]
+    expire_after = (
+        args.expire_after
+        if args.expire_after is not None
+        else app.config["EXPIRE_AFTER"]
+    )
+    fetch_retention_days = (
+        (prune_after + expire_after) / 24 if expire_after > 0 else args.horizon_days
+    )
+    per_fetch = fetch_bytes + index_bytes["Fetch"]
+    per_event = event_bytes + index_bytes["FetchEvent"]
+    retained_events = args.jobs_per_day * purge_after / 24 * args.events
+    retained_fetches = args.jobs_per_day * fetch_retention_days
+    return {
+        "records": args.records,
+        "events_per_record": args.events,
+        "bytes_per_fetch": fetch_bytes,
+        "bytes_per_event": event_bytes,
+        "index_bytes_per_doc": index_bytes,
+        "bytes_per_job": per_fetch + per_event * args.events,
+        "projection": {
+            "jobs_per_day": args.jobs_per_day,
+            "prune_after_hours": prune_after,
+            "purge_after_hours": purge_after,
+            "expire_after_hours": expire_after,
+            "horizon_days": args.horizon_days,
+            "fetch_retention_days": fetch_retention_days,
+            "event_bytes": retained_events * per_event,
+            "fetch_bytes": retained_fetches * per_fetch,
+            "total_bytes": retained_events * per_event + retained_fetches * per_fetch,
+        },
+    }
+
+
+def run_live(redis, args) -> dict:
+    from slurp.models import Fetch
+    from slurp.models.task import FetchEvent
+
+    by_type: dict[str, dict[str, float]] = defaultdict(
+        lambda: {"keys": 0, "sampled": 0, "bytes": 0.0}
+    )
+    batch: list[str] = []
+
+    def flush():
+        pipe = redis.pipeline(transaction=False)
+        for key in batch:
+            pipe.memory_usage(key, samples=0)
+        for key, usage in zip(batch, pipe.execute()):
+            t = by_type[_key_type(redis, key)]
+            t["sampled"] += 1
+            t["bytes"] += usage or 0
+        batch.clear()
+
+    for key in redis.scan_iter(count=1000):
+        key = key.decode() if isinstance(key, bytes) else key
+        by_type[_key_type(redis, key)]["keys"] += 1
+        if random.random() < args.sample:
+            batch.append(key)
+            if len(batch) >= 500:
+                flush()
+    flush()
+
+    # Scale the sampled usage up to the whole keyspace.
+    for t in by_type.values():
+        t["bytes"] = t["bytes"] / t["sampled"] * t["keys"] if t["sampled"] else 0.0
+
+    return {
+        "used_memory": redis.info("memory")["used_memory"],
+        "sample": args.sample,
+        "keys": dict(by_type),
+        "indexes": {
+            "Fetch": index_memory(redis, Fetch.Meta.index_name),
+            "FetchEvent": index_memory(redis, FetchEvent.Meta.index_name),
+        },
+    }
+
+
+def _key_type(redis, key: str) -> str:
+    for prefix, name in _KEY_TYPES:
+        if key.startswith(prefix):
+            return name
+    typ = redis.type(key)
+    return f"other ({typ.decode() if isinstance(typ, bytes) else typ})"
+
+
+def _print_report(report: dict):
+    if "keys" in report:
+        print(f"\nLive keyspace (used_memory {report['used_memory'] / _MiB:.1f} MiB)")
+        for name, t in sorted(report["keys"].items(), key=lambda i: -i[1]["bytes"]):
+            print(f"  {name:<24} {t['keys']:>9} keys  {t['bytes'] / _MiB:10.2f} MiB")
+        for name, idx in report["indexes"].items():
+            print(
+                f"  {name + ' index':<24} {idx['num_docs']:>9} docs  {idx['bytes'] / _MiB:10.2f} MiB"
+            )
+        return
+
+    proj = report["projection"]
+    print(
+        f"\nSynthetic footprint ({report['records']} fetches, {report['events_per_record']} events each)"
+    )
+    print(f"  Fetch record      {report['bytes_per_fetch']:10.0f} B")
+    print(f"  FetchEvent record {report['bytes_per_event']:10.0f} B")
+    for name, b in report["index_bytes_per_doc"].items():
+        print(f"  {name + ' index':<17} {b:10.0f} B/doc")
+    print(f"  Per job           {report['bytes_per_job']:10.0f} B")
+    print(
+        f"\nProjection at {proj['jobs_per_day']} jobs/day "
+        f"(PRUNE_AFTER={proj['prune_after_hours']}h, PURGE_AFTER={proj['purge_after_hours']}h):"
+    )
+    print(f"  Events            {proj['event_bytes'] / _MiB:10.1f} MiB (steady state)")
+    if proj["expire_after_hours"] > 0:
+        print(
+            f"  Fetches           {proj['fetch_bytes'] / _MiB:10.1f} MiB (steady state, kept {proj['fetch_retention_days']:.0f} days)"
+        )
+    else:
+        print(
+            f"  Fetches           {proj['fetch_bytes'] / _MiB:10.1f} MiB (after {proj['horizon_days']} days - EXPIRE_AFTER is disabled)"
+        )
+    print(f"  Total             {proj['total_bytes'] / _MiB:10.1f} MiB")
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument(
+        "--redis-url", help="Redis to run against (default: from config)"
+    )
+    parser.add_argument(
+        "--live", action="store_true", help="report on the live keyspace"
+    )
+    parser.add_argument(
+        "--sample",
+        type=float,
+        default=1.0,
+        help="fraction of keys to measure in live mode",
+    )
+    parser.add_argument("--records", type=int, default=200, help="fetches to generate")
+    parser.add_argument("--events", type=int, default=30, help="events per fetch")
+    parser.add_argument("--keep", action="store_true", help="keep generated records")
+    parser.add_argument("--jobs-per-day", type=int, default=200)
+    parser.add_argument("--prune-after", type=int, help="override PRUNE_AFTER (hours)")
+    parser.add_argument("--purge-after", type=int, help="override PURGE_AFTER (hours)")
+    parser.add_argument(
+        "--expire-after", type=int, help="override EXPIRE_AFTER (hours)"
+    )
+    parser.add_argument(
+        "--horizon-days",
+        type=int,
+        default=365,
+        help="how far to project fetch records, if EXPIRE_AFTER is disabled",
+    )
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    if args.redis_url:
+        os.environ["SLURP_REDIS_URL"] = args.redis_url
+
+    from slurp import create_app, db
+
+    app = create_app()
+    with app.app_context():
+        report = (
+            run_live(db.redis, args)
+            if args.live
+            else run_synthetic(db.redis, app, args)
+        )
+
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Process startup benchmark.
+
+Starts fresh interpreters that boot Slurp the way gunicorn (web) and Celery (worker) do, and reports how long importing
+and creating the app takes, along with any heavyweight modules that were imported but shouldn't have been.
+The first boot against a fresh Redis includes the search index migration; later boots should skip it.
+
+Exits non-zero if a budget is exceeded or a process imports something it shouldn't, so it can guard against
+regressions.
+
+Usage:
+    python -m bench.startup --fakeredis
+    python -m bench.startup --redis-url redis://localhost:6379/0 --runs 10 --max-web-ms 1500 --max-worker-ms 1500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules that each kind of process should never import on startup.
+_FORBIDDEN = {
+    "web": ["yt_dlp", "pymediainfo"],
+    "worker": ["flask_restx", "flask_wtf", "wtforms"],
+}
+
+_BOOT = {
+    "web": "import slurp; slurp.create_app()",
+    "worker": "import slurp.make_celery",
+}
+
+_SNIPPET = """
+import json, sys, time
+ts_start = time.perf_counter()
+{setup}
+{boot}
+elapsed = time.perf_counter() - ts_start
+print(json.dumps({{"boot": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def _boot(kind: str, setup: str, env: dict) -> dict:
+    ts_start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", _SNIPPET.format(setup=setup, boot=_BOOT[kind])],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    wall = time.perf_counter() - ts_start
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {
+        "wall": wall,
+        "boot": result["boot"],
+        "forbidden": [m for m in _FORBIDDEN[kind] if m in result["modules"]],
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    redis = parser.add_mutually_exclusive_group()
+    redis.add_argument(
+        "--fakeredis", action="store_true", help="use an in-process fakeredis"
+    )
+    redis.add_argument(
+        "--redis-url", help="Redis to boot against (default: from config)"
+    )
+    parser.add_argument("--runs", type=int, default=5, help="boots per process kind")
+    parser.add_argument("--max-web-ms", type=float, help="budget for a warm web boot")
+    parser.add_argument(
+        "--max-worker-ms", type=float, help="budget for a warm worker boot"
+    )
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    env = os.environ | {"PYTHONPATH": os.getcwd()}
+    if args.redis_url:
+        env["SLURP_REDIS_URL"] = args.redis_url
+    # fakeredis doesn't persist between processes, so every boot is a cold one.
+    # It has to be installed before Slurp is imported, so its (small) import time is included in the boot time.
+    setup = "from bench import stubs; stubs.use_fakeredis()" if args.fakeredis else ""
+
+    budgets = {"web": args.max_web_ms, "worker": args.max_worker_ms}
+    report, failed = {}, False
+    for kind in _BOOT:
+        runs = [_boot(kind, setup, env) for _ in range(args.runs)]
+        # The first boot may have migrated the search indexes, so it's reported separately.
+        warm = runs[1:] or runs
+        report[kind] = {
+            "first_boot_ms": runs[0]["boot"] * 1000,
+            "boot_ms": statistics.fmean(r["boot"] for r in warm) * 1000,
+            "process_ms": statistics.fmean(r["wall"] for r in warm) * 1000,
+            "forbidden_imports": runs[0]["forbidden"],
+        }
+        r = report[kind]
+        print(
+            f"{kind:<7} boot {r['boot_ms']:7.1f}ms (first {r['first_boot_ms']:7.1f}ms), "
+            f"process {r['process_ms']:7.1f}ms"
+        )
+        if r["forbidden_imports"]:
+            failed = True
+            print(f"  FAIL: imported {', '.join(r['forbidden_imports'])}")
+        if budgets[kind] is not None and r["boot_ms"] > budgets[kind]:
+            failed = True
+            print(f"  FAIL: over budget of {budgets[kind]:.0f}ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
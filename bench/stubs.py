@@ -0,0 +1,316 @@
+"""
+Local stand-ins for the external services Slurp talks to: a Cobalt API server, a get_iplayer binary, and Redis.
+"""
+
+import json
+import os
+import re
+import stat
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Literal
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class FakeCobalt:
+    """
+    FakeCobalt is a minimal Cobalt API server, which serves synthetic media of a configurable size.
+
+    In "tunnel" mode, media is streamed with chunked encoding and an estimated-content-length header (like Cobalt's
+    remuxing tunnel). In "redirect" mode, media is served with a content-length and byte range support, as an origin
+    would. Bandwidth (bytes/s, None for unlimited) and latency (seconds before the first byte) apply to media only.
+    """
+
+    def __init__(
+        self,
+        mode: Literal["tunnel", "redirect"] = "tunnel",
+        size: int = 4 * 1024 * 1024,
+        bandwidth: int | None = None,
+        latency: float = 0.0,
+        host: str = "127.0.0.1",
+    ):
+        self.mode = mode
+        self.size = size
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self._server = ThreadingHTTPServer((host, 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "FakeCobalt":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        cobalt = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                # Keep the benchmark output clean.
+                pass
+
+            def _json(self, status: int, data: dict):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/":
+                    self._json(
+                        200,
+                        {"cobalt": {"version": "bench", "services": ["bench"]}},
+                    )
+                elif self.path.startswith("/media/"):
+                    self._media()
+                else:
+                    self._json(404, {"status": "error"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if "url" not in request:
+                    self._json(
+                        400,
+                        {
+                            "status": "error",
+                            "error": {"code": "error.api.link.missing"},
+                        },
+                    )
+                    return
+                self._json(
+                    200,
+                    {
+                        "status": cobalt.mode,
+                        "url": f"{cobalt.url}media/{cobalt.mode}",
+                        "filename": "bench.mp4",
+                    },
+                )
+
+            def _media(self):
+                time.sleep(cobalt.latency)
+                start, end = 0, cobalt.size - 1
+                ranged = False
+                if cobalt.mode == "redirect" and (
+                    m := re.fullmatch(
+                        r"bytes=(\d*)-(\d*)", self.headers.get("Range", "")
+                    )
+                ):
+                    ranged = True
+                    if m.group(1):
+                        start = int(m.group(1))
+                        if m.group(2):
+                            end = min(int(m.group(2)), end)
+                    elif m.group(2):
+                        # Suffix range - the last N bytes.
+                        start = max(cobalt.size - int(m.group(2)), 0)
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{cobalt.size}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+
+                length = end - start + 1
+                chunked = cobalt.mode == "tunnel"
+                self.send_response(206 if ranged else 200)
+                self.send_header("Content-Type", "video/mp4")
+                if chunked:
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.send_header("Estimated-Content-Length", str(cobalt.size))
+                else:
+                    self.send_header("Accept-Ranges", "bytes")
+                    self.send_header("Content-Length", str(length))
+                    if ranged:
+                        self.send_header(
+                            "Content-Range", f"bytes {start}-{end}/{cobalt.size}"
+                        )
+                self.end_headers()
+
+                chunk = b"\0" * _CHUNK_SIZE
+                ts_start = time.monotonic()
+                sent = 0
+                while sent < length:
+                    data = chunk[: min(_CHUNK_SIZE, length - sent)]
+                    if chunked:
+                        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    else:
+                        self.wfile.write(data)
+                    sent += len(data)
+                    if cobalt.bandwidth:
+                        # Sleep until we're back under the bandwidth limit.
+                        ahead = sent / cobalt.bandwidth - (time.monotonic() - ts_start)
+                        if ahead > 0:
+                            time.sleep(ahead)
+                if chunked:
+                    self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+# The fake get_iplayer is configured through the environment, so that it can be tuned without rewriting it.
+_GET_IPLAYER_SCRIPT = """#!{python}
+import json
+import os
+import sys
+import time
+
+args = sys.argv[1:]
+if "-V" in args:
+    print("get_iplayer v3.99 (bench)")
+    sys.exit(0)
+
+opts = dict(a[2:].split("=", 1) for a in args if a.startswith("--") and "=" in a)
+output = opts["output"]
+os.makedirs(output, exist_ok=True)
+
+if "--metadata-only" in args:
+    pid = args[0].rstrip("/").rsplit("/", 1)[-1]
+    with open(os.path.join(output, pid + ".json"), "w") as f:
+        json.dump(
+            {{
+                "brand": "Bench",
+                "title": "Bench: Episode " + pid,
+                "channel": "BBC Bench",
+                "web": "https://www.bbc.co.uk/programmes/" + pid,
+                "firstbcast": "2026-01-01T12:00:00+00:00",
+                "duration": 1800,
+                "thumbnail": None,
+                "type": "tv",
+            }},
+            f,
+        )
+    sys.exit(0)
+
+size = int(os.environ.get("BENCH_IPLAYER_SIZE", 4 * 1024 * 1024))
+lines = int(os.environ.get("BENCH_IPLAYER_LINES", 20))
+delay = float(os.environ.get("BENCH_IPLAYER_DELAY", 0))
+with open(os.path.join(output, opts["file-prefix"] + ".mp4"), "wb") as f:
+    for i in range(lines):
+        f.write(bytes(size // lines))
+        print(f"INFO: Downloaded {{(i + 1) * 100 // lines}}%", flush=True)
+        time.sleep(delay / lines)
+    f.write(bytes(size % lines))
+"""
+
+
+def install_fake_get_iplayer(
+    bin_dir: str, size: int = 4 * 1024 * 1024, lines: int = 20, delay: float = 0.0
+) -> str:
+    """
+    install_fake_get_iplayer writes a fake get_iplayer binary to bin_dir, and puts it at the front of PATH.
+    :param bin_dir: Directory to write the binary to.
+    :param size: Size of the media "downloaded" by the binary in bytes.
+    :param lines: Number of progress lines the binary writes per download.
+    :param delay: Time a download takes in seconds.
+    :return: Path to the binary.
+    """
+    path = os.path.join(bin_dir, "get_iplayer")
+    with open(path, "w") as f:
+        f.write(_GET_IPLAYER_SCRIPT.format(python=sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+    os.environ["BENCH_IPLAYER_SIZE"] = str(size)
+    os.environ["BENCH_IPLAYER_LINES"] = str(lines)
+    os.environ["BENCH_IPLAYER_DELAY"] = str(delay)
+    return path
+
+
+def use_fakeredis():
+    """
+    use_fakeredis points everything in Slurp that talks to Redis at one shared in-process fakeredis server.
+    It must be called before the app is created.
+    Note that fakeredis doesn't implement RediSearch, so anything that relies on Model.find() will not work.
+    """
+    try:
+        import fakeredis
+    except ImportError as e:
+        raise RuntimeError(
+            "fakeredis is not installed - install it with 'uv pip install fakeredis[lua]', or use a real Redis with --redis-url"
+        ) from e
+    import flask_sse
+
+    from slurp import db
+
+    server = fakeredis.FakeServer()
+
+    class _FakeRedis(fakeredis.FakeStrictRedis):
+        @classmethod
+        def from_url(cls, url, **kwargs):
+            return fakeredis.FakeStrictRedis.from_url(url, server=server, **kwargs)
+
+    db.redis.provider_class = _FakeRedis
+    # flask-sse opens its own connections from REDIS_URL.
+    flask_sse.StrictRedis = _FakeRedis
+
+
+class RedisCounter:
+    """
+    RedisCounter counts the commands (and round trips) every Redis client in the process sends, while it's active.
+    Pipelines count as one round trip, but each of their commands is counted.
+    """
+
+    def __init__(self):
+        self.commands = 0
+        self.round_trips = 0
+        self._lock = threading.Lock()
+        self._patched = []
+
+    def _count(self, commands: int):
+        with self._lock:
+            self.commands += commands
+            self.round_trips += 1
+
+    def __enter__(self) -> "RedisCounter":
+        from redis.client import Pipeline, Redis
+
+        counter = self
+        execute_command = Redis.execute_command
+        immediate_execute_command = Pipeline.immediate_execute_command
+        execute = Pipeline.execute
+
+        def _execute_command(self, *args, **kwargs):
+            counter._count(1)
+            return execute_command(self, *args, **kwargs)
+
+        def _immediate_execute_command(self, *args, **kwargs):
+            counter._count(1)
+            return immediate_execute_command(self, *args, **kwargs)
+
+        def _execute(self, *args, **kwargs):
+            if len(self.command_stack) > 0:
+                counter._count(len(self.command_stack))
+            return execute(self, *args, **kwargs)
+
+        self._patched = [
+            (Redis, "execute_command", execute_command),
+            (Pipeline, "immediate_execute_command", immediate_execute_command),
+            (Pipeline, "execute", execute),
+        ]
+        Redis.execute_command = _execute_command
+        Pipeline.immediate_execute_command = _immediate_execute_command
+        Pipeline.execute = _execute
+        return self
+
+    def __exit__(self, *exc):
+        for cls, name, fn in self._patched:
+            setattr(cls, name, fn)
+        self._patched = []
@@ -2,15 +2,13 @@ import os
 import tomllib
 
 from celery import Celery, Task
+from celery.signals import worker_process_init
 from flask import Flask
-from flask_sse import sse
 
-from slurp.api import api_blueprint
 from slurp.db import bind_redis
 from slurp.fetchers import fetcher_manager
-from slurp.helpers import format_duration
-from slurp.routes import main_blueprint
-from slurp.tasks import _init_periodic_tasks
+from slurp.helpers import format_bytes, format_duration
+from slurp.tasks import _init_periodic_tasks, _init_worker_process
 
 
 def __celery_init_app(app: Flask) -> Celery:
@@ -26,22 +24,49 @@ def __celery_init_app(app: Flask) -> Celery:
         result_backend=app.config["REDIS_URL"],
     )
     celery_app.config_from_object(app.config["CELERY"])
+    # Workers take from the queues they're given in the order they're given (so fetch_high before fetch), and take one
+    # fetch at a time - otherwise a worker could sit on a backlog of fetches while a higher priority one waits.
+    # Every message priority is kept apart (rather than the default of 0, 3, 6 and 9), so smaller fetches can be
+    # worked first within each fetch priority - see slurp/lanes.py.
+    celery_app.conf.broker_transport_options = {
+        "queue_order_strategy": "priority",
+        "priority_steps": list(range(10)),
+    } | celery_app.conf.broker_transport_options
+    celery_app.conf.worker_prefetch_multiplier = app.config["CELERY"].get(
+        "worker_prefetch_multiplier", 1
+    )
     celery_app.set_default()
     app.extensions["celery"] = celery_app
 
     # Create task routes
     celery_app.conf.task_routes = {
         # Fetch tasks should take place in their own queue, as they can be quite lengthy.
-        "slurp.fetch": {"queue": "fetch"}
+        "slurp.fetch": {"queue": "fetch"},
+        # Troubleshooting waits on outside APIs, so it's kept out of the way of both.
+        "slurp.troubleshoot": {"queue": "troubleshoot"},
+        # Sizing up fetches before they're queued only looks up their metadata, so it's cheap - but it shouldn't wait
+        # behind (or hold up) either.
+        "slurp.preflight": {"queue": "preflight"},
+        # If the stages of a fetch are separated, post-processing is CPU-bound, and finalising disk-bound - so they can
+        # be scaled apart from downloading, which is network-bound.
+        "slurp.postprocess": {"queue": "postprocess"},
+        "slurp.finalise": {"queue": "finalise"},
     }
 
     # Bind periodic tasks
     celery_app.on_after_configure.connect(_init_periodic_tasks)
+    # Warm up fetchers in each worker process as it starts
+    worker_process_init.connect(_init_worker_process, weak=False)
     return celery_app
 
 
-def create_app(config_filename: str = "config.toml") -> Flask:
-    """Application factory."""
+def create_app(config_filename: str = "config.toml", web: bool = True) -> Flask:
+    """
+    Application factory.
+    :param config_filename: Configuration file to load, relative to the working directory.
+    :param web: Whether this app will serve the web interface and API.
+        Celery processes don't, so they skip registering (and importing) them to start faster.
+    """
     app = Flask(__name__)
 
     # Load configuration.
@@ -86,13 +111,21 @@ def create_app(config_filename: str = "config.toml") -> Flask:
         f"The following fetchers are enabled: [{', '.join([f.name for f in app.extensions['fetchers'].get_all()])}]"
     )
 
-    app.jinja_env.filters["duration"] = format_duration
+    if web:
+        # These are imported here, as they're slow to import and only needed to serve requests.
+        from flask_sse import sse
+
+        from slurp.api import api_blueprint
+        from slurp.routes import main_blueprint
+
+        app.jinja_env.filters["duration"] = format_duration
+        app.jinja_env.filters["filesize"] = format_bytes
 
-    app.register_blueprint(sse, url_prefix="/api/v1/stream")
+        app.register_blueprint(sse, url_prefix="/api/v1/stream")
 
-    app.register_blueprint(main_blueprint)
+        app.register_blueprint(main_blueprint)
 
-    app.register_blueprint(api_blueprint)
+        app.register_blueprint(api_blueprint)
 
     return app
 
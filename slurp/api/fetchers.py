@@ -0,0 +1,108 @@
+from flask import current_app
+from flask_restx import Namespace, Resource, fields
+
+api = Namespace("fetchers", description="Fetchers")
+
+fetcherInfo = api.model(
+    "Fetcher",
+    {
+        "name": fields.String(description="Name of the fetcher"),
+        "priority": fields.Integer(
+            description="Static priority (lowest first) - used when there's no history to go on"
+        ),
+        "ready": fields.Boolean(description="Fetcher is able to handle requests"),
+        "service_names": fields.List(
+            fields.String, description="Services the fetcher supports"
+        ),
+    },
+)
+
+fetcherScore = api.model(
+    "FetcherScore",
+    {
+        "fetcher": fields.String(description="Name of the fetcher"),
+        "attempts": fields.Integer(description="Attempts made in the window"),
+        "successes": fields.Integer(description="Successful attempts in the window"),
+        "success_rate": fields.Float(description="Fraction of attempts that succeeded"),
+        "ttfb": fields.Float(
+            description="Mean seconds taken to receive the first bytes of media"
+        ),
+        "throughput": fields.Float(
+            description="Mean rate successful attempts downloaded at in bytes per second"
+        ),
+        "expected_time": fields.Float(
+            description="Seconds the fetcher can be expected to spend per successful fetch - fetchers are tried in increasing order of this"
+        ),
+    },
+)
+
+limitUtilisation = api.model(
+    "LimitUtilisation",
+    {
+        "scope": fields.String(
+            description="What's limited - origin:<domain> or fetcher:<name>"
+        ),
+        "in_use": fields.Integer(description="Downloads running in the scope"),
+        "concurrency": fields.Integer(
+            description="Most downloads that can run in the scope at once, or null for no limit"
+        ),
+        "tokens": fields.Float(
+            description="Downloads that can be started in the scope right now, or null if its rate isn't limited"
+        ),
+        "rate": fields.Float(
+            description="Downloads that can be started in the scope per second, or null for no limit"
+        ),
+        "burst": fields.Integer(
+            description="Most downloads that can be started in the scope at once"
+        ),
+    },
+)
+
+
+@api.route("/")
+class List(Resource):
+    @api.doc("list_fetchers")
+    @api.marshal_list_with(fetcherInfo)
+    def get(self):
+        return current_app.extensions["fetchers"].get_all()
+
+
+@api.route("/scoreboard")
+class Scoreboard(Resource):
+    @api.doc("get_scoreboard")
+    def get(self):
+        """Scores of every fetcher against every domain with recent history, by domain."""
+        scoreboard = current_app.extensions["fetchers"].scoreboard
+        if scoreboard is None:
+            return {"error": "Adaptive fetcher ordering is disabled."}, 404
+        return {
+            domain: [
+                api.marshal(score.to_dict(), fetcherScore)
+                for score in scoreboard.scores(domain).values()
+            ]
+            for domain in scoreboard.domains()
+        }
+
+
+@api.route("/scoreboard/<string:domain>")
+class DomainScoreboard(Resource):
+    @api.doc("get_domain_scoreboard")
+    @api.marshal_list_with(fetcherScore)
+    def get(self, domain):
+        """Scores of every fetcher with recent history against the given domain."""
+        scoreboard = current_app.extensions["fetchers"].scoreboard
+        if scoreboard is None:
+            return []
+        return [score.to_dict() for score in scoreboard.scores(domain).values()]
+
+
+@api.route("/limits")
+class Limits(Resource):
+    @api.doc("get_limits")
+    @api.marshal_list_with(limitUtilisation)
+    def get(self):
+        """How much of each origin's and fetcher's limits are in use right now, for those used in the last day."""
+        limiter = current_app.extensions["fetchers"].limiter
+        if limiter is None:
+            return []
+        return limiter.utilisation()
@@ -1,12 +1,27 @@
+import datetime
 from enum import Enum
 from typing import Annotated, Any
 
 from flask import current_app, request
-from flask_restx import Namespace, Resource, ValidationError, abort, fields
-from pydantic import BaseModel, BeforeValidator, Field, field_serializer
+from flask_restx import Namespace, Resource, abort, fields
+from pydantic import (
+    BaseModel,
+    BeforeValidator,
+    Field,
+    ValidationError,
+    field_serializer,
+    model_validator,
+)
 from redis_om import model
 
+from slurp import db
+from slurp.cancellation import request_cancel
+from slurp.diskspace import disk_ledger
+from slurp.exceptions import VersionConflictError
+from slurp.fairshare import fair_queue
+from slurp.lanes import queue_waits
 from slurp.fetchers.types import Format
+from slurp.helpers import parse_timestamp
 from slurp.models.task import Fetch, FetchEvent
 from slurp.tasks import create_fetch
 
@@ -46,6 +61,21 @@ fetchEvent = api.model(
     },
 )
 
+fetchStage = api.model(
+    "FetchStage",
+    {
+        "name": fields.String(
+            description="Stage name - one of queued, lock, attempt, metadata, download, handoff, trim, validate or finalise"
+        ),
+        "fetcher": fields.String(description="Fetcher running during this stage"),
+        "ts_start": fields.DateTime(description="Time the stage started"),
+        "duration": fields.Float(description="Duration of the stage in seconds"),
+        "status": fields.Integer(
+            description="Status reported at the end of the stage (0 is success)"
+        ),
+    },
+)
+
 fetchTask = api.model(
     "FetchTask",
     {
@@ -56,6 +86,20 @@ fetchTask = api.model(
         "slug": fields.String(description="Slug to save fetch as"),
         "format": __EnumValue(description="Download format"),
         "target": fields.String(description="Filesystem target identifier"),
+        "urgent": fields.Boolean(
+            description="Task is urgent (a second fetcher is raced against the first if it's slow to start)"
+        ),
+        "priority": __EnumValue(description="Task priority"),
+        "submitter": fields.String(description="Who submitted the task"),
+        "clip_start": fields.Float(
+            description="Seconds into the media the task fetches from, if it only fetches part of it"
+        ),
+        "clip_end": fields.Float(
+            description="Seconds into the media the task fetches to, if it only fetches part of it"
+        ),
+        "clip_precise": fields.Boolean(
+            description="The part of the media is cut exactly, rather than at the nearest keyframes"
+        ),
         "status": __EnumValue(description="Task status"),
         "meta": fields.Nested(fetchMetadata, default={}),
         "output_path": fields.String(
@@ -68,6 +112,20 @@ fetchTask = api.model(
             description="Task was purged (logs have been removed)"
         ),
         "worker_id": fields.String(description="Work ID - use to query work status"),
+        "stages": fields.List(
+            fields.Nested(fetchStage),
+            description="Timing breakdown of the most recent run of this task",
+        ),
+        "media_bytes": fields.Integer(description="Size of the fetched media in bytes"),
+        "throughput": fields.Float(
+            description="Rate the media was downloaded at in bytes per second"
+        ),
+        "estimated_bytes": fields.Integer(
+            description="Size the media was expected to be in bytes, if the task was sized up before it was queued"
+        ),
+        "estimated_seconds": fields.Float(
+            description="Seconds the media was expected to take to download, if the task was sized up before it was queued"
+        ),
     },
 )
 
@@ -86,6 +144,34 @@ createTask = api.model(
             description="Filesystem target identifier. This MUST be a valid destination as configured.",
             required=True,
         ),  # make this not required?
+        "urgent": fields.Boolean(
+            description="Race a second fetcher against the first if it's slow to start delivering media",
+            default=False,
+        ),
+        "force": fields.Boolean(
+            description="Fetch the media even if it's recently been found to be unavailable",
+            default=False,
+        ),
+        "priority": fields.String(
+            description="Priority of the fetch - high priority fetches are worked before any others",
+            enum=[p.value for p in Fetch.Priority],
+            default=Fetch.Priority.normal.value,
+        ),
+        "submitter": fields.String(
+            description="Who is submitting the fetch - workers are shared out fairly between each submitter to each target"
+        ),
+        "start": fields.String(
+            description="Only fetch the media from this far in - in seconds, or as [[H:]M:]S",
+            example="1:02:30",
+        ),
+        "end": fields.String(
+            description="Only fetch the media up to this far in - in seconds, or as [[H:]M:]S",
+            example="1:03:10",
+        ),
+        "precise_cut": fields.Boolean(
+            description="Cut the media exactly at start and end (slower), rather than at the nearest keyframes",
+            default=False,
+        ),
     },
 )
 
@@ -119,6 +205,43 @@ class CreateTaskSchema(BaseModel):
     target: str = Field(
         description="Filesystem target identifier. This MUST be a valid destination as configured."
     )
+    urgent: bool = Field(
+        default=False,
+        description="Race a second fetcher against the first if it's slow to start delivering media",
+    )
+    force: bool = Field(
+        default=False,
+        description="Fetch the media even if it's recently been found to be unavailable",
+    )
+    priority: Fetch.Priority = Field(
+        default=Fetch.Priority.normal,
+        description="Priority of the fetch - high priority fetches are worked before any others",
+    )
+    submitter: str | None = Field(
+        default=None,
+        description="Who is submitting the fetch - workers are shared out fairly between each submitter to each target",
+    )
+    start: Annotated[float | None, BeforeValidator(parse_timestamp)] = Field(
+        default=None,
+        description="Only fetch the media from this far in - in seconds, or as [[H:]M:]S",
+    )
+    end: Annotated[float | None, BeforeValidator(parse_timestamp)] = Field(
+        default=None,
+        description="Only fetch the media up to this far in - in seconds, or as [[H:]M:]S",
+    )
+    precise_cut: bool = Field(
+        default=False,
+        description="Cut the media exactly at start and end (slower), rather than at the nearest keyframes",
+    )
+
+    @model_validator(mode="after")
+    def check_clip(self) -> "CreateTaskSchema":
+        if self.end is not None and self.end <= (self.start or 0):
+            raise ValueError("end must be after start")
+        if self.start == 0 and self.end is None:
+            # That's all of it - there's nothing to cut.
+            self.start = None
+        return self
 
 
 @api.route("/")
@@ -156,13 +279,24 @@ class List(Resource):
                 fmt=data.format,
                 target=data.target,
                 slug=data.slug,
+                urgent=data.urgent,
+                force=data.force,
+                priority=data.priority.value,
+                submitter=data.submitter,
+                clip_start=data.start,
+                clip_end=data.end,
+                clip_precise=data.precise_cut,
             )
             # Await the result from the worker.
             return {"fetch_id": result.get()}, 201
             # return {"message": "Task created", "data": data.model_dump()}, 200
 
         except ValidationError as e:
-            return {"message": "Validation failed", "errors": e}, 400
+            # The context is the exception each validator raised, which doesn't serialise - the message says it all.
+            return {
+                "message": "Validation failed",
+                "errors": e.errors(include_url=False, include_context=False),
+            }, 400
 
 
 @api.route("/<string:task_id>")
@@ -176,6 +310,49 @@ class Task(Resource):
             return abort(404)
         return fetch
 
+    @api.doc("cancel_task")
+    def delete(self, task_id):
+        try:
+            fetch = Fetch.get(task_id)
+        except model.NotFoundError:
+            return abort(404)
+        if fetch.status not in (Fetch.TaskStatus.created, Fetch.TaskStatus.running):
+            return {
+                "error": f"This task can't be cancelled, as it is {fetch.status.value}."
+            }, 409
+
+        while fetch.status == Fetch.TaskStatus.created:
+            # Still queued - make sure it never starts.
+            fetch.status = Fetch.TaskStatus.cancelled
+            try:
+                fetch.save_fields("status", check_version=True)
+            except VersionConflictError:
+                # Something else has written it in the meantime (it's been sized up, say, or a worker has picked it
+                # up) - look again.
+                try:
+                    fetch = Fetch.get(task_id)
+                except model.NotFoundError:
+                    return abort(404)
+                continue
+            # Only now it's marked cancelled - had the job been revoked first, losing the race above would have left
+            # the fetch queued forever, with nothing left to work it.
+            current_app.extensions["celery"].control.revoke(fetch.worker_id)
+            db.publish(
+                {
+                    "fetch_id": fetch.pk,
+                    "state": Fetch.TaskStatus.cancelled.value,
+                },
+                type="fetch_updated",
+            )
+            fetch.emit_event("log", "warning", "Fetch cancelled before it started")
+            if (fair := fair_queue(db.redis, current_app.config)) is not None:
+                # Don't hold its place.
+                fair.done(fetch.pk)
+
+        # Tell whoever is working it (or is just about to) to stop.
+        request_cancel(Fetch.db(), fetch.pk)
+        return {"fetch_id": fetch.pk}, 202
+
 
 @api.route("/<string:task_id>/events")
 class TaskEvents(Resource):
@@ -193,3 +370,123 @@ class Work(Resource):
     def get(self, worker_id):
         fetch_obj = Fetch.find(worker_id == worker_id).first()
         return fetch_obj
+
+
+queueWait = api.model(
+    "QueueWait",
+    {
+        "priority": fields.String(description="Priority of the fetches"),
+        "samples": fields.Integer(description="Number of recent fetches summarised"),
+        "mean": fields.Float(description="Mean seconds fetches waited for a worker"),
+        "p50": fields.Float(description="Median seconds fetches waited for a worker"),
+        "p95": fields.Float(
+            description="95th percentile of seconds fetches waited for a worker"
+        ),
+        "max": fields.Float(description="Longest wait for a worker in seconds"),
+    },
+)
+
+
+@api.route("/queue-wait")
+class QueueWait(Resource):
+    @api.doc("get_queue_wait")
+    @api.marshal_list_with(queueWait)
+    def get(self):
+        """How long recent fetches of each priority waited to be picked up by a worker."""
+        return queue_waits(db.redis)
+
+
+queuePosition = api.model(
+    "QueuePosition",
+    {
+        "tenant": fields.String(
+            description="Who the task is worked on behalf of - its target, and its submitter if it has one"
+        ),
+        "position": fields.Integer(
+            description="Number of tasks that will be started before this one"
+        ),
+        "estimated_start": fields.DateTime(
+            description="When the task is expected to start, going by how long recent tasks took - null if there's nothing to go on yet"
+        ),
+    },
+)
+
+
+@api.route("/<string:task_id>/position")
+class TaskPosition(Resource):
+    @api.doc("get_task_position")
+    @api.response(200, "Success", queuePosition)
+    def get(self, task_id):
+        """Where a task waiting for its turn is in the queue, and when it's expected to start."""
+        fair = fair_queue(db.redis, current_app.config)
+        if fair is None:
+            return {"error": "Tasks aren't being shared out between tenants."}, 404
+        position = fair.position(task_id)
+        if position is None:
+            return {"error": "This task isn't waiting for its turn."}, 404
+        if position["estimated_start"] is not None:
+            position["estimated_start"] = datetime.datetime.fromtimestamp(
+                position["estimated_start"], datetime.UTC
+            )
+        return position
+
+
+tenantShare = api.model(
+    "TenantShare",
+    {
+        "tenant": fields.String(
+            description="Who tasks are worked on behalf of - a target, and a submitter if they gave one"
+        ),
+        "share": fields.Float(description="Share of the worker slots the tenant gets"),
+        "waiting": fields.Integer(description="Tasks waiting for the tenant's turn"),
+        "running": fields.Integer(description="Tasks handed to the workers"),
+    },
+)
+
+
+@api.route("/tenants")
+class Tenants(Resource):
+    @api.doc("get_tenants")
+    @api.marshal_list_with(tenantShare)
+    def get(self):
+        """What each tenant has waiting and running, if tasks are being shared out between them."""
+        fair = fair_queue(db.redis, current_app.config)
+        if fair is None:
+            return []
+        return fair.tenants()
+
+
+diskUsage = api.model(
+    "DiskUsage",
+    {
+        "volume": fields.String(
+            description="Where tasks take up space - temp:<node>:<path> for a node's scratch directory, or target:<path>"
+        ),
+        "free": fields.Integer(description="Bytes free on the volume"),
+        "total": fields.Integer(description="Size of the volume in bytes"),
+        "ts_measured": fields.DateTime(
+            description="When the free space was measured - whenever a task last reserved space on the volume"
+        ),
+        "reserved": fields.Integer(
+            description="Bytes reserved by tasks on the volume right now, and not yet written"
+        ),
+        "reservations": fields.Integer(description="Tasks holding reservations"),
+    },
+)
+
+
+@api.route("/disk")
+class Disk(Resource):
+    @api.doc("get_disk")
+    @api.marshal_list_with(diskUsage)
+    def get(self):
+        """Free space and space reserved by tasks on each volume reserved on in the last day."""
+        ledger = disk_ledger(db.redis, current_app.config)
+        if ledger is None:
+            return []
+        usage = ledger.usage()
+        for volume in usage:
+            volume["ts_measured"] = datetime.datetime.fromtimestamp(
+                volume["ts_measured"], datetime.UTC
+            )
+        return usage
@@ -0,0 +1,76 @@
+import types
+
+import fakeredis
+import flask
+import pytest
+
+from slurp import db
+from slurp.api import api_blueprint
+from slurp.api.fetchtasks import CreateTaskSchema
+from slurp.models import Fetch
+
+
+@pytest.fixture
+def client():
+    app = flask.Flask(__name__)
+    app.register_blueprint(api_blueprint)
+    return app.test_client()
+
+
+@pytest.mark.parametrize(
+    "clip",
+    [
+        {"start": "-5"},
+        {"start": "1:2:3:4"},
+        {"start": "10", "end": "10"},
+        {"end": 0},
+    ],
+)
+def test_create_invalid_clip(client, clip):
+    response = client.post(
+        "/api/v1/task/",
+        json={
+            "url": "https://example.com/",
+            "format": None,
+            "slug": "test",
+            "target": "media",
+        }
+        | clip,
+    )
+    assert response.status_code == 400
+    assert response.json["errors"][0]["type"] == "value_error"
+
+
+def test_whole_clip():
+    schema = CreateTaskSchema(
+        url="https://example.com/", format=None, slug="test", target="media", start=0
+    )
+    assert schema.start is None, "that's not a clip at all"
+
+
+def test_cancel_queued_after_conflict(client, monkeypatch):
+    monkeypatch.setattr(db.redis, "_redis_client", fakeredis.FakeRedis())
+    revoked = []
+    client.application.extensions["celery"] = types.SimpleNamespace(
+        control=types.SimpleNamespace(revoke=revoked.append)
+    )
+    fetch = Fetch(
+        url="https://example.com/",
+        slug="test",
+        worker_id="job",
+        status=Fetch.TaskStatus.created,
+    )
+    fetch.save()
+    # It's read just before something else (preflight, say) writes it.
+    stale = Fetch.get(fetch.pk)
+    fetch.save_fields("estimated_bytes")
+    reads = iter([stale])
+    get = Fetch.get
+    monkeypatch.setattr(
+        Fetch, "get", classmethod(lambda cls, pk: next(reads, None) or get(pk))
+    )
+
+    response = client.delete(f"/api/v1/task/{fetch.pk}")
+    assert response.status_code == 202
+    assert get(fetch.pk).status == Fetch.TaskStatus.cancelled
+    assert revoked == ["job"]
@@ -0,0 +1,80 @@
+import contextlib
+import threading
+
+from redis.exceptions import RedisError
+
+# How long a cancellation request is kept for, in case the fetch it's for hasn't been picked up yet.
+CANCEL_TTL = 86400
+
+
+def _key(pk: str) -> str:
+    return f"slurp:cancel:{pk}"
+
+
+def request_cancel(redis, pk: str):
+    """
+    request_cancel asks whoever is working the given fetch to stop.
+    The request is both published, for a worker that's already running it, and left in a key, for one that's about to.
+    """
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.set(_key(pk), 1, ex=CANCEL_TTL)
+    pipeline.publish(_key(pk), 1)
+    pipeline.execute()
+
+
+class CancelWatcher:
+    """
+    A CancelWatcher listens for cancellation requests for a fetch in the background, setting cancelled when one arrives.
+    Anything working the fetch should check (or wait on) cancelled, and stop as soon as it can once it's set.
+    """
+
+    def __init__(self, redis, pk: str):
+        """
+        :param redis: Redis connection.
+        :param pk: ID of the fetch to watch.
+        """
+        self.redis = redis
+        self.pk = pk
+        self.cancelled = threading.Event()
+
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        """start starts watching. It returns once the watcher is listening, so no request can slip by unnoticed."""
+        self._thread = threading.Thread(
+            target=self._watch, name=f"cancel-{self.pk}", daemon=True
+        )
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        """stop stops watching, and clears any request - it's been dealt with, one way or another."""
+        # The thread notices within a second, and there's no need to hold the fetch up waiting for it.
+        self._stop.set()
+        self.redis.delete(_key(self.pk))
+
+    def _watch(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(_key(self.pk))
+            # Check for a request made before we subscribed.
+            if self.redis.exists(_key(self.pk)):
+                self.cancelled.set()
+        finally:
+            self._ready.set()
+        try:
+            while not self._stop.is_set() and not self.cancelled.is_set():
+                try:
+                    if pubsub.get_message(timeout=1.0) is not None:
+                        self.cancelled.set()
+                except RedisError:
+                    # The request is still in its key, so look there until we can listen again.
+                    if self._stop.wait(1.0):
+                        break
+                    with contextlib.suppress(RedisError):
+                        if self.redis.exists(_key(self.pk)):
+                            self.cancelled.set()
+        finally:
+            pubsub.close()
@@ -15,24 +15,117 @@ class DefaultConfig:
     # Possible output directories. Strings will be split by the OS path separator (: on unix, ; on Windows)
     OUTPUTS: list | str | None = ["/tmp/slurp"]
 
-    # Temporary storage directory.
-    OUTPUT_TEMP: str | None = "/tmp/slurp_tmp"
+    # Temporary storage directories. Strings will be split by the OS path separator, like OUTPUTS. Each fetch downloads
+    # to whichever has room for it and the fewest fetches already working on it.
+    OUTPUT_TEMP: list | str | None = "/tmp/slurp_tmp"
+    # Largest fetch, in bytes, to download to each temporary storage directory, by path - so a small, fast one (tmpfs,
+    # say) is kept for small fetches. Only fetches whose size is known (see FETCH_PREFLIGHT) go to one with a limit, and
+    # they go there first. For example: "{'/dev/shm/slurp': 268435456}"
+    OUTPUT_TEMP_MAX_BYTES: str | None = None
 
     # Purger settings - The purger has two levels, PURGE and PRUNE.
-    ## Purged events have their output file removed from the filesystem.
-    ## Purge after this many hours:
+    ## Purged tasks have their event logs removed. Logs expire this many hours after they were written:
     PURGE_AFTER: int = 24  # 1 day
-    ## Pruned events have their logs expunged.
-    ## Prune after this many hours:
+    ## Pruned tasks have their output file removed from the filesystem.
+    ## Prune this many hours after the task finished:
     PRUNE_AFTER: int = 168  # 7 days
+    ## Finished tasks are removed entirely this many hours after they were last updated (successful ones once they're
+    ## pruned).
+    ## Set to 0 to keep them forever.
+    EXPIRE_AFTER: int = 720  # 30 days
+    ## Cleanup works through stale tasks this many at a time...
+    CLEANUP_BATCH_SIZE: int = 100
+    ## ...for at most this many seconds per run, before leaving the rest for a later run.
+    CLEANUP_TIME_BUDGET: int = 60
+
+    # Running fetches write a summary of their progress to the Celery task state at most once every this many seconds.
+    # (Every progress event is still logged against the fetch and published to the web interface as it happens.)
+    PROGRESS_STATE_INTERVAL: float = 5.0
+
+    # Workers hold a lease on the fetch they're working, renewing it every third of this many seconds.
+    # If a worker dies, its fetch is requeued once the lease lapses.
+    FETCH_LEASE_TTL: int = 30
+
+    # Fetchers are tried in the order they've been doing best against each site (by success rate and speed), rather
+    # than in a fixed order. Results are kept for FETCHER_SCOREBOARD_WINDOW hours.
+    FETCHER_ADAPTIVE_ORDER: bool = True
+    FETCHER_SCOREBOARD_WINDOW: int = 24
+    # Chance of trying the fetcher with the least recent history first, so one that's recovered gets noticed.
+    FETCHER_EXPLORE_RATE: float = 0.1
+
+    # Urgent fetches race the next fetcher against the first if it hasn't received any media after this many seconds.
+    FETCH_HEDGE_DELAY: float = 20.0
+
+    # Fetches are worked in priority order. If this is set, high priority fetches get a lane of their own - the
+    # fetch_high queue - so some workers can be kept free for them: run those with `-Q fetch_high`, and the rest with
+    # `-Q fetch_high,fetch` so they help out when they can.
+    FETCH_RESERVED_LANE: bool = False
+
+    # Fetches can be sized up before they're queued, by looking up their metadata on the preflight queue (run a worker
+    # with `-Q preflight`), so they can be scheduled by how big they are. Media without a size given is assumed to
+    # be FETCH_ASSUMED_BITRATE bytes per second of its duration.
+    FETCH_PREFLIGHT: bool = False
+    FETCH_ASSUMED_BITRATE: int = 625_000
+    # Sized up fetches under FETCH_SMALL_JOB_BYTES are worked before others of the same priority, and those of at least
+    # FETCH_LARGE_JOB_BYTES after them.
+    FETCH_SHORTEST_FIRST: bool = True
+    FETCH_SMALL_JOB_BYTES: int = 100 * 1024 * 1024
+    FETCH_LARGE_JOB_BYTES: int = 2 * 1024 * 1024 * 1024
+    # If this is set, fetches of at least FETCH_LARGE_JOB_BYTES go to the fetch_large queue instead, so they're only
+    # worked by workers with the scratch space for them: run those with `-Q fetch_large,fetch`.
+    FETCH_LARGE_LANE: bool = False
+
+    # If this is set, fetches are held back from the workers and handed over as slots free up, shared out between
+    # tenants - each pairing of target and submitter - so one tenant's backlog doesn't hold everyone else up. Set it to
+    # how many fetches the fetch workers can work at once between them. Each tenant gets a share of the slots, looked up
+    # by tenant ('<target> by <submitter>'), then submitter, then target, then '*' - for example:
+    # "{'*': 1, 'archive': 0.25, 'newsroom': 4}"
+    FETCH_FAIR_SLOTS: int | None = None
+    FETCH_SHARES: str | None = None
+
+    # If this is set, a fetch's download, post-processing (checking the media) and finalising (moving it into place)
+    # run as separate tasks, on the fetch, postprocess and finalise queues - so each node can run plenty of download
+    # workers, and only a few of the others. They hand over through the fetch's scratch directory (OUTPUT_TEMP), so
+    # every worker needs to see the same one.
+    FETCH_PIPELINE_STAGES: bool = False
+
+    # Fetchers give up on a download (and move on to the next fetcher) if it stalls. Each fetcher has its own
+    # thresholds, which can be overridden here by fetcher name - see StallPolicy in slurp/fetchers/types.py. For example:
+    # "{'cobalt': {'first_byte_timeout': 60, 'window': 30, 'min_throughput': 65536}}"
+    FETCHER_STALL_POLICIES: str | None = None
+
+    # Limits on how hard every worker together hits each origin domain, and uses each fetcher. Each has a concurrency (the
+    # most downloads at once), and optionally a rate (downloads started per second) with a burst (how many can start at
+    # once after a quiet spell). '*' applies to any origin or fetcher without its own limits. For example:
+    # "{'*': {'concurrency': 8}, 'youtube.com': {'concurrency': 4, 'rate': 0.5, 'burst': 4}}"
+    FETCH_ORIGIN_LIMITS: str | None = "{'*': {'concurrency': 8}}"
+    FETCHER_LIMITS: str | None = None
+    # Fetches that can't start because of the limits are put back in the queue for about this many seconds.
+    FETCH_LIMIT_RETRY_DELAY: float = 10.0
+
+    # Fetches reserve the space they're expected to take up (once it's known - see FETCH_PREFLIGHT) on their scratch
+    # volume and their target before they start, so they don't run a volume out of space part way through. If there
+    # isn't room, they're put back in the queue for about FETCH_DISK_RETRY_DELAY seconds. FETCH_DISK_MIN_FREE bytes are
+    # always kept free on each volume. Set FETCH_DISK_ADMISSION to false to start fetches whether there's room or not.
+    FETCH_DISK_ADMISSION: bool = True
+    FETCH_DISK_MIN_FREE: int = 512 * 1024 * 1024
+    FETCH_DISK_RETRY_DELAY: float = 60.0
+
+    # Media found to be permanently unavailable (private, removed, geo-blocked...) is remembered for this many hours,
+    # and fetches of it fail straight away unless they're forced. Set to 0 to always try.
+    NEGATIVE_CACHE_TTL: float = 24
 
     # External API keys
     ## YouTube Data API key. Get a token from the Google Cloud console - https://developers.google.com/youtube/v3/getting-started
     EXT_API_YT_TOKEN: str | None = None
+    ## What the YouTube API reports about each video is cached (in Redis, shared by every worker) for this many seconds.
+    EXT_API_YT_CACHE_TTL: int = 3600
 
     # Enable the YTDLP fetcher.
     FETCHER_YTDLP_ENABLED: bool = True
     FETCHER_YTDLP_EXTRACTOR_ARGS: str | None = None
+    # Directory for YTDLP's cache (player JS, signatures). Share it between every worker on a node. None uses YTDLP's default.
+    FETCHER_YTDLP_CACHE_DIR: str | None = None
 
     # Enable the get_iplayer fetcher.
     # Note: get_iplayer must be installed separately (we just call the binary).
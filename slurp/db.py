@@ -1,11 +1,93 @@
+import hashlib
+
+from flask import json
 from flask_redis import FlaskRedis
+from flask_sse import Message
+from redis.client import Pipeline
+from redis.exceptions import LockError
 from redis_om import Migrator
 
 redis = FlaskRedis()
 
+# The schema version that the search indexes were last migrated to. Delete this key to force a migration.
+_SCHEMA_VERSION_KEY = "slurp:schema_version"
+# How many of the data migrations (see _data_migrations) have been run.
+_DATA_VERSION_KEY = "slurp:data_version"
+
 
 def bind_redis(app):
     redis.init_app(app)
 
     # Migrate database.
-    Migrator().run()
+    # Every process calls this on startup, so only migrate if the schema has changed since the last migration.
+    version = schema_version()
+    if redis.get(_SCHEMA_VERSION_KEY) != version.encode():
+        with redis.lock("slurp:schema_migration", timeout=60, blocking_timeout=60):
+            # Another process may well have done the migration while we waited for the lock.
+            if redis.get(_SCHEMA_VERSION_KEY) != version.encode():
+                Migrator().run()
+                redis.set(_SCHEMA_VERSION_KEY, version)
+                app.logger.info(f"Search indexes migrated to schema version {version}")
+
+    migrations = _data_migrations()
+    done = int(redis.get(_DATA_VERSION_KEY) or 0)
+    if done >= len(migrations):
+        return
+    # Nothing else needs to wait for these, so if another process is already running them, leave it to it.
+    # They're all safe to run more than once, should that process die part way through.
+    lock = redis.lock("slurp:data_migration", timeout=600)
+    if not lock.acquire(blocking=False):
+        return
+    try:
+        with app.app_context():
+            for i, migration in enumerate(migrations[done:], start=done + 1):
+                app.logger.info(f"Running data migration {i}: {migration.__name__}")
+                result = migration()
+                redis.set(_DATA_VERSION_KEY, i)
+                app.logger.info(f"Data migration {i} done: {result}")
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # It took long enough that the lock lapsed - so another process may have joined in, which does no harm.
+            pass
+
+
+def _data_migrations() -> list:
+    """
+    _data_migrations returns the one-off migrations of existing data, in the order they were added.
+    Only ever add to the end of this list - the data version is how many of them have been run.
+    """
+    from slurp.models.task import backfill_expiry
+
+    return [
+        # Records written before they were made to expire by themselves.
+        backfill_expiry,
+    ]
+
+
+def publish(data, type: str | None = None, pipeline: Pipeline | None = None):
+    """
+    publish sends a server-sent event to anyone listening, in the same format as flask_sse.
+    flask_sse opens a new Redis connection for every event it publishes, so we use our own connection instead.
+    :param data: The event data. Serialised to JSON if it isn't a string already.
+    :param type: Optional event type.
+    :param pipeline: If given, the event is queued on this pipeline rather than being sent immediately.
+    """
+    message = json.dumps(Message(data, type=type).to_dict())
+    (pipeline if pipeline is not None else redis).publish("sse", message)
+
+
+def schema_version() -> str:
+    """schema_version returns a hash of the search index schemas of all models."""
+    # Make sure all models are registered.
+    import slurp.models  # noqa: F401
+    from redis_om.model.model import model_registry
+
+    digest = hashlib.sha1()
+    for name, cls in sorted(model_registry.items()):
+        try:
+            digest.update(f"{name}:{cls.redisearch_schema()}".encode())
+        except NotImplementedError:
+            continue
+    return digest.hexdigest()
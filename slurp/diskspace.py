@@ -0,0 +1,380 @@
+import ast
+import os
+import random
+import shutil
+import socket
+import tempfile
+import time
+from dataclasses import dataclass
+
+from slurp.helpers import dir_size
+
+# Disk space ledger keys are prefixed with this. Each volume has a sorted set of the fetches holding reservations on
+# it (scored by when they lapse), a hash of how many bytes each has reserved, and a hash of when it was last measured.
+DISK_KEY = "slurp:disk"
+# Sorted set of volumes that have been reserved on, scored by when they were last measured.
+VOLUMES_KEY = f"{DISK_KEY}:volumes"
+# Seconds a fetch's reservations are kept for when it's handed over to its next stage, for that to pick them up.
+HANDOFF_HOLD = 3600
+# Each fetch works in a directory of its own on a scratch volume, named this followed by the fetch's ID.
+SCRATCH_PREFIX = "slurp-"
+
+# Reserves the given number of bytes on each of the given volumes for a holder, but only if every one of them has the
+# room for it once everyone else's reservations are taken into account.
+# KEYS: holders and sizes key of each volume, in turn.
+# ARGV: now, holder, ttl, then the free bytes (less any minimum to keep free) and bytes wanted of each volume in turn.
+# Returns {1, 0, 0} if they were reserved, or {0, i, reserved} - where i is the (1-based) index of the first volume
+# without the room, and reserved is how much of it everyone else has reserved.
+_RESERVE = """
+local now = tonumber(ARGV[1])
+local holder = ARGV[2]
+local ttl = tonumber(ARGV[3])
+for i = 1, #KEYS / 2 do
+    local holders, sizes = KEYS[2 * i - 1], KEYS[2 * i]
+    local free, wanted = tonumber(ARGV[2 * i + 2]), tonumber(ARGV[2 * i + 3])
+    local lapsed = redis.call('ZRANGEBYSCORE', holders, '-inf', now)
+    if #lapsed > 0 then
+        redis.call('ZREMRANGEBYSCORE', holders, '-inf', now)
+        redis.call('HDEL', sizes, unpack(lapsed))
+    end
+    local reserved = 0
+    for _, other in ipairs(redis.call('ZRANGE', holders, 0, -1)) do
+        if other ~= holder then
+            reserved = reserved + (tonumber(redis.call('HGET', sizes, other)) or 0)
+        end
+    end
+    if free - reserved < wanted then
+        return {0, i, tostring(reserved)}
+    end
+end
+for i = 1, #KEYS / 2 do
+    local holders, sizes = KEYS[2 * i - 1], KEYS[2 * i]
+    redis.call('ZADD', holders, now + ttl, holder)
+    redis.call('HSET', sizes, holder, ARGV[2 * i + 3])
+end
+return {1, 0, '0'}
+"""
+
+
+@dataclass()
+class Volume:
+    """A Volume is somewhere fetches take up space - a node's scratch directory, or an output target."""
+
+    # Name of the volume in the ledger.
+    name: str
+    # Where it is on this node.
+    path: str
+
+
+def temp_volume(temp_dir: str) -> Volume:
+    """temp_volume returns the volume of the given scratch directory - which is particular to this node."""
+    return Volume(f"temp:{socket.gethostname()}:{temp_dir}", temp_dir)
+
+
+def fetch_volumes(temp_dir: str, target: str) -> list[Volume]:
+    """
+    fetch_volumes returns the volumes a fetch takes up space on: the scratch directory it downloads to, and the target
+    it's moved to, which is shared.
+    """
+    return [temp_volume(temp_dir), Volume(f"target:{target}", target)]
+
+
+@dataclass()
+class ScratchVolume:
+    """A ScratchVolume is one of the directories fetches can download to."""
+
+    path: str
+    # Largest fetch, in bytes, to put here - for small, fast volumes (tmpfs, say). None for no limit.
+    max_bytes: int | None = None
+
+
+def scratch_volumes(config) -> list[ScratchVolume]:
+    """
+    scratch_volumes returns the scratch volumes set up by the given configuration (OUTPUT_TEMP and
+    OUTPUT_TEMP_MAX_BYTES), falling back to the system's temporary directory.
+    """
+    paths = config.get("OUTPUT_TEMP") or [tempfile.gettempdir()]
+    if isinstance(paths, str):
+        paths = paths.split(os.pathsep)
+    max_bytes: dict[str, int] = {}
+    if config.get("OUTPUT_TEMP_MAX_BYTES") is not None:
+        try:
+            max_bytes = ast.literal_eval(config.get("OUTPUT_TEMP_MAX_BYTES"))
+        except SyntaxError as e:
+            raise SyntaxError(f"Parsing OUTPUT_TEMP_MAX_BYTES failed: {e}") from e
+    return [ScratchVolume(path, max_bytes.get(path)) for path in paths]
+
+
+def place_scratch(
+    pk: str,
+    volumes: list[ScratchVolume],
+    estimated_bytes: int | None,
+    min_free: int,
+    ledger: "DiskLedger | None" = None,
+) -> str:
+    """
+    place_scratch picks the scratch directory for the given fetch. If it already has one (it's being retried, or is
+    further along), that's where it stays. Otherwise, it goes on a volume with room for it - preferring volumes kept for
+    fetches as small as it (if its size is known), then the one with the fewest fetches already working on it, then the
+    one with the most room. If none have room, it goes on the roomiest, and waits for space there.
+    :param min_free: Bytes to keep free on each volume.
+    :param ledger: Ledger of space reserved by other fetches, if space is being reserved.
+    :return: Path to the fetch's scratch directory - it may not exist yet.
+    """
+    name = f"{SCRATCH_PREFIX}{pk}"
+    for volume in volumes:
+        if os.path.isdir(os.path.join(volume.path, name)):
+            return os.path.join(volume.path, name)
+
+    ranked = []
+    for volume in volumes:
+        if volume.max_bytes is not None and (
+            estimated_bytes is None or estimated_bytes > volume.max_bytes
+        ):
+            continue
+        room = _usage(volume.path).free - min_free
+        if ledger is not None:
+            room -= ledger.reserved(temp_volume(volume.path))
+        try:
+            working = sum(e.startswith(SCRATCH_PREFIX) for e in os.listdir(volume.path))
+        except FileNotFoundError:
+            working = 0
+        if estimated_bytes is None or room >= estimated_bytes:
+            ranked.append(((False, volume.max_bytes is None, working, -room), volume))
+        else:
+            ranked.append(((True, False, 0, -room), volume))
+    if len(ranked) == 0:
+        # It's too big (or its size isn't known) for every volume with a limit - use the first.
+        return os.path.join(volumes[0].path, name)
+    return os.path.join(min(ranked, key=lambda r: r[0])[1].path, name)
+
+
+def disk_ledger(redis, config) -> "DiskLedger | None":
+    """
+    disk_ledger returns the DiskLedger set up by the given configuration (FETCH_DISK_MIN_FREE and
+    FETCH_DISK_RETRY_DELAY), or None if fetches don't reserve disk space (FETCH_DISK_ADMISSION).
+    """
+    if not config.get("FETCH_DISK_ADMISSION"):
+        return None
+    return DiskLedger(
+        redis,
+        config.get("FETCH_DISK_MIN_FREE"),
+        retry_delay=config.get("FETCH_DISK_RETRY_DELAY"),
+    )
+
+
+class ShortOfSpace(Exception):
+    """ShortOfSpace is raised when a volume doesn't have room for a reservation, and never will."""
+
+    def __init__(self, volume: Volume, wanted: int, capacity: int):
+        super().__init__()
+        self.volume = volume
+        self.wanted = wanted
+        self.capacity = capacity
+
+    def __str__(self):
+        return f"The media is expected to take up {_mib(self.wanted)}, but {self.volume.path} only has room for {_mib(self.capacity)}"
+
+
+def _mib(size: float) -> str:
+    return f"{size / 1024 / 1024:.0f}MiB"
+
+
+def _usage(path: str):
+    """_usage returns the disk usage of the volume the given path is on - or will be on, if it doesn't exist yet."""
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path)
+
+
+class DiskLedger:
+    """
+    The DiskLedger keeps track, through Redis, of the space every worker's fetches are expected to take up on each
+    volume, so that fetches are only started if there's room for them - rather than running out of space part way
+    through, and taking everything else on the volume down with them.
+    Reservations lapse unless they're renewed, so ones held by a worker that died are freed up.
+    """
+
+    def __init__(self, redis, min_free: int, ttl: float = 60, retry_delay: float = 60):
+        """
+        :param redis: Redis connection.
+        :param min_free: Bytes to always keep free on each volume.
+        :param ttl: Seconds a reservation is held for without being renewed.
+        :param retry_delay: Seconds to suggest waiting for when there isn't the room.
+        """
+        self.redis = redis
+        self.min_free = min_free
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self._reserve = redis.register_script(_RESERVE)
+
+    @staticmethod
+    def _keys(volume: Volume) -> tuple[str, str, str]:
+        prefix = f"{DISK_KEY}:{volume.name}"
+        return f"{prefix}:holders", f"{prefix}:sizes", f"{prefix}:usage"
+
+    def reserve(
+        self, holder: str, volumes: list[Volume], sizes: list[int]
+    ) -> Volume | None:
+        """
+        reserve reserves the given number of bytes on each of the given volumes, if every one of them has the room
+        for it. If any doesn't, nothing is reserved.
+        :param holder: Unique name for the reservation - used to renew and release it.
+        :raises ShortOfSpace: If a volume is too small to ever have the room.
+        :return: None if it was reserved, otherwise the first volume without the room.
+        """
+        now = time.time()
+        keys = []
+        args: list = [now, holder, self.ttl]
+        pipeline = self.redis.pipeline(transaction=False)
+        for volume, size in zip(volumes, sizes):
+            usage = _usage(volume.path)
+            if size > usage.total - self.min_free:
+                raise ShortOfSpace(volume, size, usage.total - self.min_free)
+            holders, sizes_key, usage_key = self._keys(volume)
+            keys += [holders, sizes_key]
+            args += [usage.free - self.min_free, size]
+            pipeline.hset(
+                usage_key, mapping={"free": usage.free, "total": usage.total, "ts": now}
+            )
+            pipeline.zadd(VOLUMES_KEY, {volume.name: now})
+        pipeline.zremrangebyscore(VOLUMES_KEY, "-inf", now - 86400)
+        self._reserve(keys=keys, args=args, client=pipeline)
+        *_, (reserved, short, _) = pipeline.execute()
+        if reserved:
+            return None
+        return volumes[int(short) - 1]
+
+    def reserved(self, volume: Volume) -> int:
+        """reserved returns how many bytes are reserved on the given volume right now."""
+        holders, sizes_key, _ = self._keys(volume)
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.zrangebyscore(holders, time.time(), "+inf")
+        pipeline.hgetall(sizes_key)
+        holders, sizes = pipeline.execute()
+        return sum(int(sizes.get(h, 0)) for h in holders)
+
+    def renew(self, holder: str, volumes: list[Volume], sizes: list[int]):
+        """renew keeps hold of the reservations taken by reserve, updating how many bytes are still needed."""
+        pipeline = self.redis.pipeline(transaction=False)
+        for volume, size in zip(volumes, sizes):
+            holders, sizes_key, _ = self._keys(volume)
+            pipeline.zadd(holders, {holder: time.time() + self.ttl}, xx=True)
+            pipeline.hset(sizes_key, holder, size)
+        pipeline.execute()
+
+    def hold(self, holder: str, volumes: list[Volume], seconds: float):
+        """hold keeps the reservations taken by reserve for the given number of seconds, without renewing them."""
+        pipeline = self.redis.pipeline(transaction=False)
+        for volume in volumes:
+            holders, _, _ = self._keys(volume)
+            pipeline.zadd(holders, {holder: time.time() + seconds}, xx=True)
+        pipeline.execute()
+
+    def release(self, holder: str, volumes: list[Volume]):
+        """release gives up the reservations taken by reserve."""
+        pipeline = self.redis.pipeline(transaction=False)
+        for volume in volumes:
+            holders, sizes_key, _ = self._keys(volume)
+            pipeline.zrem(holders, holder)
+            pipeline.hdel(sizes_key, holder)
+        pipeline.execute()
+
+    def usage(self) -> list[dict]:
+        """
+        usage returns how much space was free on each volume reserved on in the last day when it was last measured,
+        and how much of it is reserved right now.
+        """
+        now = time.time()
+        names = [
+            v.decode()
+            for v in self.redis.zrangebyscore(VOLUMES_KEY, now - 86400, "+inf")
+        ]
+        pipeline = self.redis.pipeline(transaction=False)
+        for name in names:
+            holders, sizes_key, usage_key = self._keys(Volume(name, ""))
+            pipeline.zrangebyscore(holders, now, "+inf")
+            pipeline.hgetall(sizes_key)
+            pipeline.hgetall(usage_key)
+        results = pipeline.execute()
+
+        usage = []
+        for i, name in enumerate(names):
+            holders, sizes, measured = results[3 * i : 3 * i + 3]
+            usage.append(
+                {
+                    "volume": name,
+                    "free": int(measured.get(b"free", 0)),
+                    "total": int(measured.get(b"total", 0)),
+                    "ts_measured": float(measured.get(b"ts", 0)),
+                    "reserved": sum(int(sizes.get(h, 0)) for h in holders),
+                    "reservations": len(holders),
+                }
+            )
+        return usage
+
+
+class Reservation:
+    """
+    A Reservation is a handle on the space DiskLedger.reserve reserved for a fetch. Renew it while the fetch downloads,
+    and release it once the media is in place.
+    The space still needed on the scratch volume shrinks as the download goes, as what's been written is already
+    taken off its free space.
+    """
+
+    def __init__(self, ledger: DiskLedger, holder: str, volumes: list[Volume]):
+        """
+        :param volumes: The fetch's volumes, as given by fetch_volumes - its scratch volume first.
+        """
+        self.ledger = ledger
+        self.holder = holder
+        self.volumes = volumes
+        # Bytes the media is expected to take up, once it's known.
+        self.size = 0
+        self._ts_renewed = time.monotonic()
+
+    def reserve(self, size: int) -> tuple[Volume, float] | None:
+        """
+        reserve reserves the given number of bytes on every volume, replacing anything reserved before.
+        :raises ShortOfSpace: If a volume is too small to ever have the room.
+        :return: None if it was reserved, otherwise the first volume without the room, and roughly how many seconds to
+            wait before trying again.
+        """
+        short = self.ledger.reserve(
+            self.holder, self.volumes, [size] * len(self.volumes)
+        )
+        if short is not None:
+            # Spread retries out, so everything that was turned away doesn't come back at once.
+            return short, self.ledger.retry_delay * random.uniform(1, 1.25)
+        self.size = size
+        self._ts_renewed = time.monotonic()
+        return None
+
+    def renew(self, directory: str):
+        """
+        renew renews the reservation, if it's a third of the way to lapsing.
+        :param directory: Directory the fetch is downloading to - what's in it is taken off what's needed.
+        """
+        now = time.monotonic()
+        if self.size == 0 or now - self._ts_renewed < self.ledger.ttl / 3:
+            # Nothing's been reserved yet, or it was renewed recently.
+            return
+        self._ts_renewed = now
+        written = dir_size(directory)
+        self.ledger.renew(
+            self.holder,
+            self.volumes,
+            [max(self.size - written, 0)] + [self.size] * (len(self.volumes) - 1),
+        )
+
+    def hold(self, seconds: float):
+        """
+        hold keeps the reservation on the target for the given number of seconds, for whatever works the fetch next.
+        The media is already on the scratch volume, so its reservation there is released.
+        """
+        self.ledger.release(self.holder, self.volumes[:1])
+        self.ledger.hold(self.holder, self.volumes[1:], seconds)
+
+    def release(self):
+        """release releases the reservation."""
+        self.ledger.release(self.holder, self.volumes)
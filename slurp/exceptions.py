@@ -1,2 +1,6 @@
 class FinaliserError(Exception):
     pass
+
+
+class VersionConflictError(Exception):
+    """VersionConflictError is raised when a model couldn't be saved, as it's been modified by something else."""
@@ -0,0 +1,196 @@
+import datetime
+import enum
+import json
+import re
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from slurp.fetchers.types import FetcherUpdateEvent
+from slurp.lib.yt_block_check import InvalidUrlException, VideoStatus, video_id
+
+# Negative cache entries are kept under this prefix, by canonical media ID.
+NEGATIVE_CACHE_KEY = "slurp:unavailable"
+
+
+class FailureClass(str, enum.Enum):
+    # The media can't be fetched, and trying again won't change that (it's private, removed, geo-blocked...).
+    permanent = "permanent"
+    # Something got in the way this time (a timeout, rate limiting, a stall...) - trying again may well work.
+    transient = "transient"
+    # Couldn't tell.
+    unknown = "unknown"
+
+
+# Failure messages that mean the media itself is unavailable. Matched case-insensitively.
+_PERMANENT = re.compile(
+    "|".join(
+        [
+            r"private video",
+            r"video is private",
+            r"video unavailable",
+            r"this video is not available",
+            r"has been removed",
+            r"account .* terminated",
+            r"not available in your (country|region|location)",
+            r"geo.?(restrict|block)",
+            r"copyright",
+            r"members.only",
+            r"join this channel",
+            r"does not exist",
+            r"no programmes match",
+            r"could not find any metadata",
+            # Cobalt's error codes for content it can't get at - https://github.com/imputnet/cobalt/blob/main/web/i18n/en/error.json
+            r"content\.video\.(unavailable|private|region|age|live)",
+            r"content\.post\.(unavailable|private|age)",
+        ]
+    ),
+    re.IGNORECASE,
+)
+# Failure messages that mean something went wrong along the way.
+_TRANSIENT = re.compile(
+    "|".join(
+        [
+            r"timed? ?out",
+            r"\b429\b",
+            r"too many requests",
+            r"try again later",
+            r"connection (reset|refused|aborted)",
+            r"\b50[234]\b",
+            r"temporar",
+            r"sign in to confirm",
+            r"not a bot",
+            r"stalled",
+            r"no data received",
+            r"fetch\.rate",
+            r"fetch\.fail",
+        ]
+    ),
+    re.IGNORECASE,
+)
+
+
+def classify(message: str) -> FailureClass:
+    """classify judges whether the failure described by the given message is likely to happen again."""
+    if _PERMANENT.search(message):
+        return FailureClass.permanent
+    if _TRANSIENT.search(message):
+        return FailureClass.transient
+    return FailureClass.unknown
+
+
+@dataclass()
+class FailureDiagnosis(FetcherUpdateEvent):
+    """FailureDiagnosis is the troubleshooter's verdict on why a fetch failed, and whether it's worth trying again."""
+
+    failure_class: FailureClass
+    reason: str
+
+
+def diagnose(
+    reasons: Iterable[str], video: VideoStatus | None = None
+) -> FailureDiagnosis:
+    """
+    diagnose classifies a failed fetch from the reasons its fetchers gave, and what YouTube says about the video if
+    it's a YouTube video. YouTube reporting the video gone is taken at its word; otherwise the fetchers are, with any
+    of them reporting the media unavailable taking precedence over any of them reporting trouble along the way.
+    :param reasons: Messages the fetchers failed with.
+    :param video: What the YouTube API reports about the video, if it was asked.
+    """
+    if video is not None and video.unavailable is not None:
+        return FailureDiagnosis(
+            FailureClass.permanent, f"YouTube reports {video.unavailable}"
+        )
+    transient: str | None = None
+    for reason in reasons:
+        match classify(reason):
+            case FailureClass.permanent:
+                return FailureDiagnosis(FailureClass.permanent, reason)
+            case FailureClass.transient if transient is None:
+                transient = reason
+    if transient is not None:
+        return FailureDiagnosis(FailureClass.transient, transient)
+    return FailureDiagnosis(FailureClass.unknown, "No reason could be determined")
+
+
+# BBC programme IDs are a b, p, m or w followed by 7 digits or lowercase consonants.
+_BBC_PID = re.compile(
+    r"/(?:episode|episodes|programmes|play)/([bpmw][0-9b-df-hj-np-tv-z]{7,})\b"
+)
+
+
+def canonical_media_id(url: str) -> str:
+    """
+    canonical_media_id returns an ID for the media at the given URL that's the same however it's linked to,
+    so a video is recognised whether it's a youtu.be link, a watch URL with a timestamp, a shorts URL...
+    """
+    try:
+        return f"youtube:{video_id(url)}"
+    except (InvalidUrlException, AssertionError):
+        pass
+    url_split = urlsplit(url)
+    host = (url_split.hostname or "").removeprefix("www.")
+    if host.endswith("bbc.co.uk") or host.endswith("bbc.com"):
+        if (match := _BBC_PID.search(url_split.path)) is not None:
+            return f"bbc:{match.group(1)}"
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(url_split.query)
+        if not k.startswith("utm_") and k not in ("t", "si", "feature")
+    )
+    return f"url:{host}{url_split.path.rstrip('/')}{'?' + urlencode(query) if query else ''}"
+
+
+@dataclass()
+class CachedFailure:
+    """CachedFailure records why some media was found to be permanently unavailable, and when."""
+
+    reason: str
+    url: str
+    fetch_id: str | None
+    ts: datetime.datetime
+
+    def to_dict(self) -> dict:
+        return asdict(self) | {"ts": self.ts.isoformat()}
+
+
+class NegativeCache:
+    """
+    The NegativeCache remembers media that's permanently unavailable, so that fetches of it can fail straight away
+    rather than working through every fetcher again. Entries expire, in case the media becomes available after all.
+    """
+
+    def __init__(self, redis, ttl: int):
+        """
+        :param redis: Redis connection.
+        :param ttl: Seconds to remember a failure for.
+        """
+        self.redis = redis
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return f"{NEGATIVE_CACHE_KEY}:{canonical_media_id(url)}"
+
+    def get(self, url: str) -> CachedFailure | None:
+        """get returns the failure remembered for the media at the given URL, if any."""
+        value = self.redis.get(self._key(url))
+        if value is None:
+            return None
+        entry = json.loads(value)
+        entry["ts"] = datetime.datetime.fromisoformat(entry["ts"])
+        return CachedFailure(**entry)
+
+    def put(self, url: str, reason: str, fetch_id: str | None = None):
+        """put remembers that the media at the given URL is permanently unavailable, for the given reason."""
+        entry = CachedFailure(
+            reason=reason,
+            url=url,
+            fetch_id=fetch_id,
+            ts=datetime.datetime.now(datetime.UTC),
+        )
+        self.redis.set(self._key(url), json.dumps(entry.to_dict()), ex=self.ttl)
+
+    def clear(self, url: str):
+        """clear forgets any failure remembered for the media at the given URL."""
+        self.redis.delete(self._key(url))
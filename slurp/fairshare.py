@@ -0,0 +1,282 @@
+import ast
+import json
+import statistics
+import time
+from collections.abc import Callable
+
+# Fair share state is kept under this prefix:
+#   pending:<tenant> - sorted set of the fetches each tenant has waiting, scored by the order they should go in.
+#   jobs - hash of the tenant and Celery options of each waiting fetch, by fetch ID.
+#   ring - list of the tenants with fetches waiting, in the order they take their turns.
+#   deficit - hash of how many fetches each tenant is owed, by tenant.
+#   turn - the tenant whose turn it is, once it's been given its share for the turn.
+#   running - hash of the tenant and start time of each fetch handed to the workers, by fetch ID.
+#   durations - list of how long recent fetches took from being handed to the workers to finishing, in seconds.
+FAIR_KEY = "slurp:fair"
+# How many durations to keep.
+DURATION_SAMPLES = 100
+
+# Shares that apply to any tenant not given its own.
+DEFAULT_SHARE = "*"
+
+
+# Tenants are named "<target> by <submitter>", or just "<target>" if there's no submitter.
+_BY = " by "
+
+
+def tenant_of(target: str, submitter: str | None = None) -> str:
+    """tenant_of returns the tenant a fetch to the given target, by the given submitter, is worked on behalf of."""
+    return target if not submitter else f"{target}{_BY}{submitter}"
+
+
+def fair_queue(redis, config) -> "FairQueue | None":
+    """
+    fair_queue returns the FairQueue set up by the given configuration (FETCH_FAIR_SLOTS and FETCH_SHARES), or None if
+    fetches aren't being shared out between tenants.
+    """
+    slots = config.get("FETCH_FAIR_SLOTS")
+    if not slots:
+        return None
+    shares: dict[str, float] = {}
+    if config.get("FETCH_SHARES") is not None:
+        try:
+            shares = ast.literal_eval(config.get("FETCH_SHARES"))
+        except SyntaxError as e:
+            raise SyntaxError(f"Parsing FETCH_SHARES failed: {e}") from e
+    for tenant, share in shares.items():
+        if share <= 0:
+            raise ValueError(f"FETCH_SHARES: the share of {tenant} must be more than 0")
+    return FairQueue(redis, slots, shares)
+
+
+class FairQueue:
+    """
+    The FairQueue holds fetches back from the workers, and hands them over as worker slots free up - sharing the slots
+    out between tenants (each pairing of output target and submitter), so one tenant submitting a big backlog doesn't
+    hold everyone else up until it's done.
+    Tenants take turns by deficit round robin: each turn, a tenant is given its share, and can start a fetch for each
+    whole one it's owed. Anything it doesn't use is carried over to its next turn, so shares of less than one work too.
+    """
+
+    def __init__(self, redis, slots: int, shares: dict[str, float]):
+        """
+        :param redis: Redis connection.
+        :param slots: How many fetches the workers can work at once, between them.
+        :param shares: Share of the slots each tenant gets, relative to each other. A tenant with no share of its own
+            falls back to that of its submitter, then that of its target, then DEFAULT_SHARE, then 1.
+        """
+        self.redis = redis
+        self.slots = slots
+        self.shares = shares
+
+    def share(self, tenant: str) -> float:
+        """share returns the given tenant's share of the slots."""
+        target, _, submitter = tenant.partition(_BY)
+        for name in (tenant, submitter, target, DEFAULT_SHARE):
+            if name and name in self.shares:
+                return self.shares[name]
+        return 1
+
+    def _lock(self):
+        return self.redis.lock(f"{FAIR_KEY}:lock", timeout=10, blocking_timeout=10)
+
+    def push(
+        self, pk: str, tenant: str, options: dict, order: float, now: bool = False
+    ) -> bool:
+        """
+        push queues the given fetch to be handed to the workers.
+        :param options: Celery options to queue the fetch with - handed back by dispatch.
+        :param order: Where the fetch goes among its tenant's fetches - lowest first, then first come first served.
+        :param now: Hand it to the workers straight away, whether there's a free slot or not.
+        :return: Whether the fetch should be handed to the workers straight away. It already is, if it's been handed
+            over before (it's being requeued).
+        """
+        with self._lock():
+            if now or self.redis.hexists(f"{FAIR_KEY}:running", pk):
+                self.redis.hset(
+                    f"{FAIR_KEY}:running",
+                    pk,
+                    json.dumps({"tenant": tenant, "ts": time.time()}),
+                )
+                return True
+            pipeline = self.redis.pipeline()
+            # The order is a small number, so there's room to break ties by when the fetch was queued.
+            pipeline.zadd(
+                f"{FAIR_KEY}:pending:{tenant}", {pk: order * 1e13 + time.time() * 1000}
+            )
+            pipeline.hset(
+                f"{FAIR_KEY}:jobs",
+                pk,
+                json.dumps({"tenant": tenant, "options": options}),
+            )
+            pipeline.execute()
+            if self.redis.lpos(f"{FAIR_KEY}:ring", tenant) is None:
+                self.redis.rpush(f"{FAIR_KEY}:ring", tenant)
+        return False
+
+    def dispatch(self) -> list[tuple[str, dict]]:
+        """
+        dispatch takes as many fetches as there are free slots for, tenant by tenant.
+        :return: The ID and Celery options of each fetch to hand to the workers, in order.
+        """
+        dispatched = []
+        with self._lock():
+            free = self.slots - self.redis.hlen(f"{FAIR_KEY}:running")
+            while free > 0:
+                tenant = self.redis.lindex(f"{FAIR_KEY}:ring", 0)
+                if tenant is None:
+                    break
+                tenant = tenant.decode()
+                deficit = float(self.redis.hget(f"{FAIR_KEY}:deficit", tenant) or 0)
+                if self.redis.get(f"{FAIR_KEY}:turn") != tenant.encode():
+                    # A new turn.
+                    deficit += self.share(tenant)
+                    self.redis.set(f"{FAIR_KEY}:turn", tenant)
+                pending = f"{FAIR_KEY}:pending:{tenant}"
+                while deficit >= 1 and free > 0:
+                    popped = self.redis.zpopmin(pending)
+                    if len(popped) == 0:
+                        break
+                    pk = popped[0][0].decode()
+                    job = self.redis.hget(f"{FAIR_KEY}:jobs", pk)
+                    if job is None:
+                        continue
+                    pipeline = self.redis.pipeline()
+                    pipeline.hdel(f"{FAIR_KEY}:jobs", pk)
+                    pipeline.hset(
+                        f"{FAIR_KEY}:running",
+                        pk,
+                        json.dumps({"tenant": tenant, "ts": time.time()}),
+                    )
+                    pipeline.execute()
+                    dispatched.append((pk, json.loads(job)["options"]))
+                    deficit -= 1
+                    free -= 1
+
+                if self.redis.zcard(pending) == 0:
+                    # Nothing left to take turns for - and nothing to carry over.
+                    self.redis.lpop(f"{FAIR_KEY}:ring")
+                    self.redis.hdel(f"{FAIR_KEY}:deficit", tenant)
+                    self.redis.delete(f"{FAIR_KEY}:turn")
+                    continue
+                self.redis.hset(f"{FAIR_KEY}:deficit", tenant, deficit)
+                if deficit < 1:
+                    # Turn over - to the back of the ring.
+                    self.redis.lmove(
+                        f"{FAIR_KEY}:ring", f"{FAIR_KEY}:ring", "LEFT", "RIGHT"
+                    )
+                    self.redis.delete(f"{FAIR_KEY}:turn")
+                # Otherwise, we're out of slots - the turn carries on next time.
+        return dispatched
+
+    def done(self, pk: str):
+        """done frees the slot the given fetch was using (or drops it from the queue, if it was never started)."""
+        with self._lock():
+            running = self.redis.hget(f"{FAIR_KEY}:running", pk)
+            if running is not None:
+                self.redis.hdel(f"{FAIR_KEY}:running", pk)
+                pipeline = self.redis.pipeline(transaction=False)
+                pipeline.lpush(
+                    f"{FAIR_KEY}:durations",
+                    round(time.time() - json.loads(running)["ts"], 3),
+                )
+                pipeline.ltrim(f"{FAIR_KEY}:durations", 0, DURATION_SAMPLES - 1)
+                pipeline.execute()
+                return
+            job = self.redis.hget(f"{FAIR_KEY}:jobs", pk)
+            if job is not None:
+                self.redis.zrem(f"{FAIR_KEY}:pending:{json.loads(job)['tenant']}", pk)
+                self.redis.hdel(f"{FAIR_KEY}:jobs", pk)
+
+    def reconcile(self, finished: Callable[[str], bool]) -> list[str]:
+        """
+        reconcile frees the slots of fetches that have finished without saying so (because their worker died, say).
+        :param finished: Returns whether the fetch with the given ID has finished.
+        :return: IDs of the fetches whose slots were freed.
+        """
+        freed = [
+            pk.decode()
+            for pk in self.redis.hkeys(f"{FAIR_KEY}:running")
+            if finished(pk.decode())
+        ]
+        for pk in freed:
+            self.done(pk)
+        return freed
+
+    def _mean_duration(self) -> float | None:
+        durations = self.redis.lrange(f"{FAIR_KEY}:durations", 0, -1)
+        if len(durations) == 0:
+            return None
+        return statistics.fmean(float(d) for d in durations)
+
+    def position(self, pk: str) -> dict | None:
+        """
+        position works out how many fetches will be handed to the workers before the given one, by playing the turns
+        out, and estimates when it'll start from how long recent fetches took.
+        :return: None if the fetch isn't waiting.
+        """
+        ring = [t.decode() for t in self.redis.lrange(f"{FAIR_KEY}:ring", 0, -1)]
+        turn = self.redis.get(f"{FAIR_KEY}:turn")
+        deficits = {
+            t.decode(): float(d)
+            for t, d in self.redis.hgetall(f"{FAIR_KEY}:deficit").items()
+        }
+        pending = {
+            t: [p.decode() for p in self.redis.zrange(f"{FAIR_KEY}:pending:{t}", 0, -1)]
+            for t in ring
+        }
+        if not any(pk in p for p in pending.values()):
+            return None
+
+        position = 0
+        in_turn = turn is not None and len(ring) > 0 and turn.decode() == ring[0]
+        while True:
+            tenant = ring[0]
+            deficit = deficits.get(tenant, 0)
+            if not in_turn:
+                deficit += self.share(tenant)
+            in_turn = False
+            while deficit >= 1 and len(pending[tenant]) > 0:
+                if pending[tenant].pop(0) == pk:
+                    break
+                deficit -= 1
+                position += 1
+            else:
+                deficits[tenant] = deficit
+                ring.pop(0)
+                if len(pending[tenant]) > 0:
+                    ring.append(tenant)
+                continue
+            break
+
+        # Each fetch ahead (and this one) waits for a slot to free up, and slots free up every mean duration / slots
+        # seconds on average - unless there's a slot free already.
+        free = self.slots - self.redis.hlen(f"{FAIR_KEY}:running")
+        mean = self._mean_duration()
+        estimated_start = None
+        if position < free:
+            estimated_start = time.time()
+        elif mean is not None:
+            estimated_start = time.time() + (position - free + 1) * mean / self.slots
+        return {
+            "tenant": tenant,
+            "position": position,
+            "estimated_start": estimated_start,
+        }
+
+    def tenants(self) -> list[dict]:
+        """tenants summarises what each tenant has waiting and running."""
+        running: dict[str, int] = {}
+        for value in self.redis.hvals(f"{FAIR_KEY}:running"):
+            tenant = json.loads(value)["tenant"]
+            running[tenant] = running.get(tenant, 0) + 1
+        ring = [t.decode() for t in self.redis.lrange(f"{FAIR_KEY}:ring", 0, -1)]
+        return [
+            {
+                "tenant": tenant,
+                "share": self.share(tenant),
+                "waiting": self.redis.zcard(f"{FAIR_KEY}:pending:{tenant}"),
+                "running": running.get(tenant, 0),
+            }
+            for tenant in dict.fromkeys(ring + list(running))
+        ]
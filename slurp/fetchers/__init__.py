@@ -1,20 +1,33 @@
 import ast
+import dataclasses
+import logging
 import shutil
 
-from slurp.fetchers.cobalt import CobaltFetcher
+from redis.exceptions import RedisError
+
+from slurp import db
 from slurp.fetchers.exceptions import FetcherMisconfiguredError
-from slurp.fetchers.get_iplayer import BBCiPlayerFetcher
+from slurp.fetchers.limits import Limit, Limiter
+from slurp.fetchers.scoreboard import Scoreboard
 from slurp.fetchers.types import Fetcher
-from slurp.fetchers.ytdlp import YTDLPFetcher
 
 
 # slurp/fetchers/__init__.py
 class FetcherManager:
     def __init__(self):
         self.fetchers = []
+        self.scoreboard: Scoreboard | None = None
+        self.explore = 0.0
+        self.limiter: Limiter | None = None
 
     def init_app(self, app):
         """Initialize fetchers for this app instance."""
+        # Fetchers are imported here rather than at the top of the module, so that importing anything in this package
+        # (e.g. the exceptions) doesn't drag every backend in with it.
+        from slurp.fetchers.cobalt import CobaltFetcher
+        from slurp.fetchers.get_iplayer import BBCiPlayerFetcher
+        from slurp.fetchers.ytdlp import YTDLPFetcher
+
         self.fetchers = []  # Reset for this app
 
         # Fill fetchers config with configured fetchers.
@@ -58,6 +71,7 @@ class FetcherManager:
                     YTDLPFetcher(
                         js_runtimes=js_runtimes,
                         extractor_args=extractor_args,
+                        cache_dir=app.config.get("FETCHER_YTDLP_CACHE_DIR", None),
                     )
                 )
             except FetcherMisconfiguredError as e:
@@ -83,8 +97,55 @@ class FetcherManager:
         if len(self.fetchers) == 0:
             raise RuntimeError("No fetchers enabled - please enable some!")
 
+        # Apply any overrides to the fetchers' stall policies.
+        if app.config.get("FETCHER_STALL_POLICIES") is not None:
+            try:
+                stall_policies: dict[str, dict[str, float]] = ast.literal_eval(
+                    app.config.get("FETCHER_STALL_POLICIES")
+                )
+            except SyntaxError as e:
+                raise SyntaxError(f"Parsing FETCHER_STALL_POLICIES failed: {e}") from e
+            for fetcher in self.fetchers:
+                if fetcher.name in stall_policies:
+                    # Replace rather than modify - the defaults are shared by every instance of the fetcher.
+                    fetcher.stall_policy = dataclasses.replace(
+                        fetcher.stall_policy, **stall_policies[fetcher.name]
+                    )
+
+        if app.config.get("FETCHER_ADAPTIVE_ORDER") is True:
+            self.scoreboard = Scoreboard(
+                db.redis, app.config.get("FETCHER_SCOREBOARD_WINDOW", 24)
+            )
+            self.explore = app.config.get("FETCHER_EXPLORE_RATE", 0.0)
+        else:
+            self.scoreboard = None
+
+        # Limit how hard every worker together hits each origin, and uses each fetcher.
+        origin_limits = _parse_limits(app, "FETCH_ORIGIN_LIMITS")
+        fetcher_limits = _parse_limits(app, "FETCHER_LIMITS")
+        if len(origin_limits) > 0 or len(fetcher_limits) > 0:
+            self.limiter = Limiter(
+                db.redis,
+                origin_limits,
+                fetcher_limits,
+                slot_ttl=app.config.get("FETCH_LEASE_TTL"),
+                retry_delay=app.config.get("FETCH_LIMIT_RETRY_DELAY"),
+            )
+        else:
+            self.limiter = None
+
         app.extensions["fetchers"] = self
 
+    def warm_up(self):
+        """warm_up warms up every configured fetcher. Fetchers that fail to warm up are logged and skipped."""
+        for fetcher in self.fetchers:
+            try:
+                fetcher.warm_up()
+            except Exception as e:
+                logging.getLogger(__name__).warning(
+                    "Failed to warm up the %s fetcher: %s", fetcher.name, e
+                )
+
     def get_all(self):
         return self.fetchers
 
@@ -100,7 +161,43 @@ class FetcherManager:
                 continue
             if any(elem in url for elem in fetcher.service_urls):
                 valid_fetchers.append(fetcher)
+
+        if self.scoreboard is not None and len(valid_fetchers) > 1:
+            # Try whichever fetchers have been doing best against this site lately first.
+            try:
+                valid_fetchers = self.scoreboard.order(
+                    url, valid_fetchers, self.explore
+                )
+            except RedisError as e:
+                logging.getLogger(__name__).warning(
+                    "Failed to read the fetcher scoreboard: %s", e
+                )
         return valid_fetchers
 
+    def record_attempt(self, url: str, fetcher: Fetcher, success: bool, **stats):
+        """
+        record_attempt records how a fetcher's attempt at the given URL went on the scoreboard, if there is one.
+        See Scoreboard.record for the stats.
+        """
+        if self.scoreboard is None:
+            return
+        try:
+            self.scoreboard.record(url, fetcher.name, success, **stats)
+        except RedisError as e:
+            logging.getLogger(__name__).warning(
+                "Failed to record %s on the fetcher scoreboard: %s", fetcher.name, e
+            )
+
+
+def _parse_limits(app, key: str) -> dict[str, Limit]:
+    """_parse_limits parses the Limits in the given configuration value, by scope."""
+    if app.config.get(key) is None:
+        return {}
+    try:
+        limits: dict[str, dict[str, float]] = ast.literal_eval(app.config.get(key))
+    except SyntaxError as e:
+        raise SyntaxError(f"Parsing {key} failed: {e}") from e
+    return {scope: Limit(**limit) for scope, limit in limits.items()}
+
 
 fetcher_manager = FetcherManager()
@@ -9,12 +9,13 @@ from celery.utils.log import get_task_logger
 
 from slurp.fetchers.exceptions import FetcherMisconfiguredError
 from slurp.fetchers.types import (
+    Clip,
     Fetcher,
     FetcherMediaAvailable,
-    FetcherMediaMetadataAvailable,
     FetcherProgressReport,
     FetcherUpdateEvent,
     Format,
+    StallPolicy,
 )
 
 logger = get_task_logger(__name__)
@@ -28,6 +29,9 @@ class CobaltFetcher(Fetcher):
     # We handle basically anything that isn't handled by other fetchers - very low priority.
     priority = 1000
 
+    # Cobalt hands back something to stream from straight away, so media should start flowing quickly.
+    stall_policy = StallPolicy(first_byte_timeout=120)
+
     url = ""
     key: str | None = None
 
@@ -123,7 +127,13 @@ class CobaltFetcher(Fetcher):
         return cfg
 
     def _get_media(
-        self, q: queue.Queue, url: str, fmt: Format, directory: str, filename: str
+        self,
+        q: queue.Queue,
+        url: str,
+        fmt: Format,
+        directory: str,
+        filename: str,
+        abort: threading.Event,
     ):
         """
         Commence a download.
@@ -236,6 +246,8 @@ class CobaltFetcher(Fetcher):
 
                     q.put(FetcherProgressReport(typ="log", level="info", message=msg))
                     for data in r.iter_bytes():
+                        if abort.is_set():
+                            raise Exception("download aborted")
                         f.write(data)
                         logger.debug(
                             f"written {r.num_bytes_downloaded} bytes from cobalt"
@@ -284,31 +296,20 @@ class CobaltFetcher(Fetcher):
         fmt: Format,
         directory: str,
         filename: str,
+        cancel: threading.Event | None = None,
+        clip: Clip | None = None,
     ) -> Generator[FetcherUpdateEvent]:
         """get_media downloads the media at the given params in the foreground, returning log information by means of a Generator."""
         q: queue.Queue[FetcherUpdateEvent] = queue.Queue()
+        # Set to stop the download thread early, if it stalls or the fetch is cancelled.
+        abort = threading.Event()
 
         # We need to run the download on a thread so we can continue to execute our client response
         thread = threading.Thread(
-            target=self._get_media, args=(q, url, fmt, directory, filename), daemon=True
+            target=self._get_media,
+            args=(q, url, fmt, directory, filename, abort),
+            daemon=True,
         )
         thread.start()
 
-        while True:
-            try:
-                # Reasonably sane timeout, just to stop us endlessly spinning.
-                event: FetcherUpdateEvent = q.get(timeout=300)
-            except queue.ShutDown:
-                # End of data.
-                break
-            match event:
-                case FetcherProgressReport() as i:
-                    if i.typ == "finish":
-                        yield i
-                        # Break the generator.
-                        break
-                    yield i
-                case FetcherMediaMetadataAvailable() as i:
-                    yield i
-                case FetcherMediaAvailable() as i:
-                    yield i
+        yield from self._relay(q, thread, directory, abort, cancel)
@@ -16,6 +16,11 @@ class NoFetchersAvailable(Exception):
 
 
 class FetchersExhaustedError(Exception):
+    def __init__(self, reasons: list[str] | None = None):
+        super().__init__()
+        # The reasons each fetcher gave for failing.
+        self.reasons = reasons or []
+
     def __str__(self):
         return "Available Fetchers exhausted"
 
@@ -23,3 +28,27 @@ class FetchersExhaustedError(Exception):
 class FetchLockedError(Exception):
     def __str__(self):
         return "Fetch locked by another worker"
+
+
+class FetchLeaseLostError(Exception):
+    def __str__(self):
+        return "Lost the lease on the fetch - another worker may have taken it over"
+
+
+class FetchCancelledError(Exception):
+    def __str__(self):
+        return "Fetch cancelled"
+
+
+class FetchDeferredError(Exception):
+    def __init__(
+        self, delay: float, reason: str = "the site or its fetchers are at their limits"
+    ):
+        super().__init__()
+        # Seconds to wait before trying the fetch again.
+        self.delay = delay
+        # Why it can't be fetched right now.
+        self.reason = reason
+
+    def __str__(self):
+        return f"Fetch deferred for {self.delay:.0f}s - {self.reason}"
@@ -3,6 +3,7 @@ import os
 import pathlib
 import queue
 import shutil
+import signal
 import subprocess
 import tempfile
 import threading
@@ -16,6 +17,7 @@ from slurp.fetchers.exceptions import (
     NoUpstreamMetadataError,
 )
 from slurp.fetchers.types import (
+    Clip,
     Fetcher,
     FetcherMediaAvailable,
     FetcherMediaMetadataAvailable,
@@ -23,6 +25,7 @@ from slurp.fetchers.types import (
     FetcherUpdateEvent,
     Format,
     MediaMetadata,
+    StallPolicy,
 )
 
 
@@ -51,13 +54,23 @@ class BBCiPlayerFetcher(Fetcher):
             )
         return True
 
+    # Set once the binary has been found to work, so we don't spawn it again for every fetch.
+    _available: bool = False
+
     @property
     def ready(self) -> bool:
         """We're Ready if the get_iplayer binary is available."""
+        if self._available:
+            return True
         try:
-            return self.__backend_available()
+            self._available = self.__backend_available()
         except FetcherMisconfiguredError:
             return False
+        return self._available
+
+    def warm_up(self):
+        """warm_up checks the get_iplayer binary once, so later fetches in this process don't have to."""
+        _ = self.ready
 
     # We're quite a specific fetcher, so relatively high priority.
     priority = 10
@@ -65,6 +78,9 @@ class BBCiPlayerFetcher(Fetcher):
     service_names = ["BBC iPlayer"]
     service_urls = ["bbc.co.uk/iplayer", "bbc.co.uk/sounds"]
 
+    # get_iplayer looks up the programme and negotiates its streams before it writes anything, which can take a while.
+    stall_policy = StallPolicy(first_byte_timeout=600)
+
     @staticmethod
     def _log_emit(log: str) -> FetcherProgressReport:
         """_log_emit produces a FetcherProgressReport with the appropriate level for the given get_iplayer log line."""
@@ -85,6 +101,10 @@ class BBCiPlayerFetcher(Fetcher):
                 typ="log", level="debug", message=log.replace("DEBUG: ", "")
             )
 
+    def probe(self, url: str, fmt: Format) -> MediaMetadata | None:
+        """probe looks up the programme's metadata. get_iplayer doesn't say how big it is, but it does give its duration."""
+        return self._get_metadata(url)
+
     def _get_metadata(self, url: str) -> MediaMetadata:
         """_get_metadata returns MediaMetadata for the given url."""
 
@@ -106,7 +126,7 @@ class BBCiPlayerFetcher(Fetcher):
                 timeout=300,
             )
             assert proc.returncode == 0, (
-                f"get_iplayer failed with code {proc.returncode}"
+                f"get_iplayer failed with code {proc.returncode}: {_last_line(proc.stdout)}"
             )
 
             # Find the metadata file.
@@ -149,6 +169,23 @@ class BBCiPlayerFetcher(Fetcher):
             data.format = meta.get("type")
         return data
 
+    @staticmethod
+    def _kill_on_abort(proc: subprocess.Popen, abort: threading.Event):
+        """_kill_on_abort kills proc, and every process it started, if abort is set before it exits."""
+        while proc.poll() is None:
+            if not abort.wait(0.5):
+                continue
+            try:
+                os.killpg(proc.pid, signal.SIGTERM)
+                try:
+                    proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                # It exited in the meantime.
+                pass
+            return
+
     def _get_media(
         self,
         q: queue.Queue[FetcherUpdateEvent],
@@ -156,6 +193,7 @@ class BBCiPlayerFetcher(Fetcher):
         fmt: Format,
         directory: str,
         filename: str,
+        abort: threading.Event,
     ):
         """
         Commence a download from BBC iPlayer.
@@ -192,14 +230,26 @@ class BBCiPlayerFetcher(Fetcher):
                 stdout=subprocess.PIPE,
                 bufsize=1,
                 text=True,
+                # get_iplayer hands the download off to ffmpeg and friends - giving it its own process group means
+                # they can all be killed together.
+                start_new_session=True,
             )
+            threading.Thread(
+                target=self._kill_on_abort, args=(proc, abort), daemon=True
+            ).start()
+            # The last thing get_iplayer said is usually why it failed, if it does.
+            last_output = ""
             for o in proc.stdout:
                 q.put(self._log_emit(o))
+                if o.strip():
+                    last_output = o
 
             # Wait for process to finish returning
-            proc.poll()
+            proc.wait()
+            if abort.is_set():
+                raise Exception("download aborted")
             assert proc.returncode == 0, (
-                f"get_iplayer failed with code {proc.returncode}"
+                f"get_iplayer failed with code {proc.returncode}: {_last_line(last_output)}"
             )
 
             # Find the downloaded file.
@@ -228,7 +278,7 @@ class BBCiPlayerFetcher(Fetcher):
                 return
 
             # signals that media is now available for consumption
-            q.put(FetcherMediaAvailable(path=target))
+            q.put(FetcherMediaAvailable(path=destination))
 
             q.put(
                 FetcherProgressReport(
@@ -257,31 +307,28 @@ class BBCiPlayerFetcher(Fetcher):
         fmt: Format,
         directory: str,
         filename: str,
+        cancel: threading.Event | None = None,
+        clip: Clip | None = None,
     ) -> Generator[FetcherUpdateEvent]:
         """get_media downloads the media at the given params in the foreground, returning log information by means of a Generator."""
         q: queue.Queue[FetcherUpdateEvent] = queue.Queue()
+        # Set to stop the download thread early, if it stalls or the fetch is cancelled.
+        abort = threading.Event()
 
         # We need to run the download on a thread so we can continue to execute our client response
         thread = threading.Thread(
-            target=self._get_media, args=(q, url, fmt, directory, filename), daemon=True
+            target=self._get_media,
+            args=(q, url, fmt, directory, filename, abort),
+            daemon=True,
         )
         thread.start()
 
-        while True:
-            try:
-                # Reasonably sane timeout, just to stop us endlessly spinning.
-                event: FetcherUpdateEvent = q.get(timeout=300)
-            except queue.ShutDown:
-                # End of data.
-                break
-            match event:
-                case FetcherProgressReport() as i:
-                    if i.typ == "finish":
-                        yield i
-                        # Break the generator.
-                        break
-                    yield i
-                case FetcherMediaMetadataAvailable() as i:
-                    yield i
-                case FetcherMediaAvailable() as i:
-                    yield i
+        yield from self._relay(q, thread, directory, abort, cancel)
+
+
+def _last_line(output: str) -> str:
+    """_last_line returns the last line of get_iplayer's output, without its log level."""
+    lines = output.strip().splitlines()
+    if len(lines) == 0:
+        return "no output"
+    return lines[-1].removeprefix("ERROR: ").removeprefix("INFO: ").strip()
@@ -0,0 +1,248 @@
+import math
+import random
+import time
+from dataclasses import dataclass
+
+from slurp.fetchers.scoreboard import domain_of
+
+# Limiter keys are prefixed with this. Each scope has a sorted set of the slots held in it, and a token bucket hash.
+LIMITS_KEY = "slurp:limits"
+# Sorted set of scopes that have been used, scored by when they were last used.
+SCOPES_KEY = f"{LIMITS_KEY}:scopes"
+
+# Scopes that apply to anything not given its own limits.
+DEFAULT_SCOPE = "*"
+
+# Takes a slot and a token in each of the given scopes, but only if every one of them has both to give.
+# KEYS: slots and bucket key of each scope, in turn.
+# ARGV: now, holder, slot ttl, then the concurrency, rate and burst of each scope in turn (-1 for no limit).
+# Returns {1, 0} if they were taken, or {0, seconds} - where seconds is how long until a token is due, or -1 if the
+# scopes are out of slots instead.
+_ACQUIRE = """
+local now = tonumber(ARGV[1])
+local holder = ARGV[2]
+local ttl = tonumber(ARGV[3])
+local full = false
+local wait = 0
+for i = 1, #KEYS / 2 do
+    local slots, bucket = KEYS[2 * i - 1], KEYS[2 * i]
+    local concurrency, rate, burst = tonumber(ARGV[3 * i + 1]), tonumber(ARGV[3 * i + 2]), tonumber(ARGV[3 * i + 3])
+    if concurrency >= 0 then
+        redis.call('ZREMRANGEBYSCORE', slots, '-inf', now)
+        if not redis.call('ZSCORE', slots, holder) and redis.call('ZCARD', slots) >= concurrency then
+            full = true
+        end
+    end
+    if rate > 0 then
+        local state = redis.call('HMGET', bucket, 'tokens', 'ts')
+        local tokens = math.min(burst, (tonumber(state[1]) or burst) + (now - (tonumber(state[2]) or now)) * rate)
+        if tokens < 1 then
+            wait = math.max(wait, (1 - tokens) / rate)
+        end
+    end
+end
+if full then
+    return {0, '-1'}
+end
+if wait > 0 then
+    return {0, tostring(wait)}
+end
+for i = 1, #KEYS / 2 do
+    local slots, bucket = KEYS[2 * i - 1], KEYS[2 * i]
+    local concurrency, rate, burst = tonumber(ARGV[3 * i + 1]), tonumber(ARGV[3 * i + 2]), tonumber(ARGV[3 * i + 3])
+    if concurrency >= 0 then
+        redis.call('ZADD', slots, now + ttl, holder)
+        redis.call('EXPIRE', slots, math.ceil(ttl) + 1)
+    end
+    if rate > 0 then
+        local state = redis.call('HMGET', bucket, 'tokens', 'ts')
+        local tokens = math.min(burst, (tonumber(state[1]) or burst) + (now - (tonumber(state[2]) or now)) * rate)
+        redis.call('HSET', bucket, 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+        redis.call('EXPIRE', bucket, math.ceil(burst / rate) + 1)
+    end
+end
+return {1, '0'}
+"""
+
+
+@dataclass()
+class Limit:
+    """A Limit caps how hard Slurp hits an origin (or uses a fetcher) across every worker."""
+
+    # Most downloads that can run at once, or None for no limit.
+    concurrency: int | None = None
+    # Downloads that can be started per second on average, or None for no limit...
+    rate: float | None = None
+    # ...with up to this many started at once after a quiet spell.
+    burst: int = 1
+
+
+class Limiter:
+    """
+    The Limiter shares out permission to download between every worker, through Redis.
+    Each origin domain and each fetcher is a scope, with its own Limit: a semaphore of slots, which are held for as
+    long as a download runs, and a token bucket, which a token is taken from whenever a download starts.
+    Slots lapse unless they're renewed, so ones held by a worker that died are freed up.
+    """
+
+    def __init__(
+        self,
+        redis,
+        origins: dict[str, Limit],
+        fetchers: dict[str, Limit],
+        slot_ttl: float = 30,
+        retry_delay: float = 10,
+    ):
+        """
+        :param redis: Redis connection.
+        :param origins: Limits for each origin domain. DEFAULT_SCOPE applies to domains without their own.
+        :param fetchers: Limits for each fetcher, by name. DEFAULT_SCOPE applies to fetchers without their own.
+        :param slot_ttl: Seconds a slot is held for without being renewed.
+        :param retry_delay: Seconds to suggest waiting for when a scope is out of slots.
+        """
+        self.redis = redis
+        self.origins = origins
+        self.fetchers = fetchers
+        self.slot_ttl = slot_ttl
+        self.retry_delay = retry_delay
+        self._acquire = redis.register_script(_ACQUIRE)
+
+    def _scopes(self, url: str, fetcher: str) -> dict[str, Limit]:
+        """_scopes returns the scopes a download of the given URL with the given fetcher falls into, with their limits."""
+        domain = domain_of(url)
+        scopes = {}
+        if (
+            limit := self.origins.get(domain, self.origins.get(DEFAULT_SCOPE))
+        ) is not None:
+            scopes[f"origin:{domain}"] = limit
+        if (
+            limit := self.fetchers.get(fetcher, self.fetchers.get(DEFAULT_SCOPE))
+        ) is not None:
+            scopes[f"fetcher:{fetcher}"] = limit
+        return scopes
+
+    def acquire(self, holder: str, url: str, fetcher: str) -> float:
+        """
+        acquire takes a slot (and token) for a download of the given URL with the given fetcher, if every scope it falls
+        into has one to spare. If any doesn't, nothing is taken.
+        :param holder: Unique name for the download - used to renew and release its slots.
+        :return: 0 if they were taken, otherwise roughly how many seconds to wait before trying again.
+        """
+        scopes = self._scopes(url, fetcher)
+        if len(scopes) == 0:
+            return 0
+        keys = []
+        args: list = [time.time(), holder, self.slot_ttl]
+        for scope, limit in scopes.items():
+            keys += [f"{LIMITS_KEY}:{scope}:slots", f"{LIMITS_KEY}:{scope}:bucket"]
+            args += [
+                limit.concurrency if limit.concurrency is not None else -1,
+                limit.rate or -1,
+                limit.burst,
+            ]
+        now = time.time()
+        pipeline = self.redis.pipeline(transaction=False)
+        self._acquire(keys=keys, args=args, client=pipeline)
+        pipeline.zadd(SCOPES_KEY, {scope: now for scope in scopes})
+        pipeline.zremrangebyscore(SCOPES_KEY, "-inf", now - 86400)
+        (taken, wait), *_ = pipeline.execute()
+        if taken:
+            return 0
+        wait = float(wait)
+        if wait < 0:
+            wait = self.retry_delay
+        # Spread retries out, so everything that was turned away doesn't come back at once.
+        return wait * random.uniform(1, 1.25)
+
+    def renew(self, holder: str, url: str, fetcher: str):
+        """renew keeps hold of the slots taken by acquire."""
+        pipeline = self.redis.pipeline(transaction=False)
+        for scope, limit in self._scopes(url, fetcher).items():
+            if limit.concurrency is not None:
+                pipeline.zadd(
+                    f"{LIMITS_KEY}:{scope}:slots",
+                    {holder: time.time() + self.slot_ttl},
+                    xx=True,
+                )
+                pipeline.expire(
+                    f"{LIMITS_KEY}:{scope}:slots", math.ceil(self.slot_ttl) + 1
+                )
+        pipeline.execute()
+
+    def release(self, holder: str, url: str, fetcher: str):
+        """release gives up the slots taken by acquire."""
+        pipeline = self.redis.pipeline(transaction=False)
+        for scope in self._scopes(url, fetcher):
+            pipeline.zrem(f"{LIMITS_KEY}:{scope}:slots", holder)
+        pipeline.execute()
+
+    def slot(self, holder: str, url: str, fetcher: str) -> "Slot":
+        """slot returns a handle on the slots acquire took, to renew and release them with."""
+        return Slot(self, holder, url, fetcher)
+
+    def utilisation(self) -> list[dict]:
+        """utilisation returns how much of each scope used in the last day is in use right now."""
+        now = time.time()
+        scopes = [
+            s.decode()
+            for s in self.redis.zrangebyscore(SCOPES_KEY, now - 86400, "+inf")
+        ]
+        pipeline = self.redis.pipeline(transaction=False)
+        for scope in scopes:
+            pipeline.zcount(f"{LIMITS_KEY}:{scope}:slots", now, "+inf")
+            pipeline.hmget(f"{LIMITS_KEY}:{scope}:bucket", "tokens", "ts")
+        results = pipeline.execute()
+
+        utilisation = []
+        for i, scope in enumerate(scopes):
+            kind, _, name = scope.partition(":")
+            limits = self.origins if kind == "origin" else self.fetchers
+            limit = limits.get(name, limits.get(DEFAULT_SCOPE, Limit()))
+            in_use = results[2 * i]
+            tokens, ts = results[2 * i + 1]
+            if limit.rate:
+                tokens = min(
+                    limit.burst,
+                    float(tokens or limit.burst)
+                    + (now - float(ts or now)) * limit.rate,
+                )
+            else:
+                tokens = None
+            utilisation.append(
+                {
+                    "scope": scope,
+                    "in_use": in_use,
+                    "concurrency": limit.concurrency,
+                    "tokens": tokens,
+                    "rate": limit.rate,
+                    "burst": limit.burst,
+                }
+            )
+        return utilisation
+
+
+class Slot:
+    """A Slot is a handle on the slots Limiter.acquire took for a download. Renew it while it runs, and release it after."""
+
+    def __init__(self, limiter: Limiter, holder: str, url: str, fetcher: str):
+        self.limiter = limiter
+        self.holder = holder
+        self.url = url
+        self.fetcher = fetcher
+        self._ts_renewed = time.monotonic()
+        self._released = False
+
+    def renew(self):
+        """renew renews the slots, if they're a third of the way to lapsing."""
+        now = time.monotonic()
+        if self._released or now - self._ts_renewed < self.limiter.slot_ttl / 3:
+            return
+        self._ts_renewed = now
+        self.limiter.renew(self.holder, self.url, self.fetcher)
+
+    def release(self):
+        """release releases the slots. Releasing them again does nothing."""
+        if self._released:
+            return
+        self._released = True
+        self.limiter.release(self.holder, self.url, self.fetcher)
@@ -0,0 +1,208 @@
+import random
+import time
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass, fields
+from urllib.parse import urlsplit
+
+from slurp.fetchers.types import Fetcher
+
+# Scoreboard keys are prefixed with this. Each domain has a hash per time bucket, and DOMAINS_KEY lists the domains.
+SCOREBOARD_KEY = "slurp:scoreboard"
+# Sorted set of domains with a score, scored by when they were last recorded.
+DOMAINS_KEY = f"{SCOREBOARD_KEY}:domains"
+
+# Until a fetcher has some history against a domain, it's assumed to be this likely to succeed...
+_PRIOR_SUCCESS_RATE = 0.5
+# ...and for attempts to take this many seconds...
+_PRIOR_SECONDS = 60.0
+# ...with as much weight as this many attempts.
+_PRIOR_WEIGHT = 2
+
+
+def domain_of(url: str) -> str:
+    """domain_of returns the domain the scoreboard files the given URL under."""
+    host = urlsplit(url).hostname or ""
+    for prefix in ("www.", "m."):
+        host = host.removeprefix(prefix)
+    return host
+
+
+@dataclass()
+class FetcherScore:
+    """A FetcherScore summarises how a fetcher has fared against a domain recently."""
+
+    fetcher: str
+    attempts: int = 0
+    successes: int = 0
+    # Total seconds spent on successful and failed attempts.
+    success_seconds: float = 0
+    failure_seconds: float = 0
+    # Total seconds taken to receive the first bytes of media, over ttfb_count attempts.
+    ttfb_seconds: float = 0
+    ttfb_count: int = 0
+    # Total bytes downloaded by successful attempts, and the seconds spent downloading them.
+    download_bytes: float = 0
+    download_seconds: float = 0
+
+    @property
+    def success_rate(self) -> float | None:
+        return self.successes / self.attempts if self.attempts > 0 else None
+
+    @property
+    def ttfb(self) -> float | None:
+        """ttfb is the mean number of seconds taken to receive the first bytes of media."""
+        return self.ttfb_seconds / self.ttfb_count if self.ttfb_count > 0 else None
+
+    @property
+    def throughput(self) -> float | None:
+        """throughput is the mean rate successful attempts downloaded at, in bytes/s."""
+        return (
+            self.download_bytes / self.download_seconds
+            if self.download_seconds > 0
+            else None
+        )
+
+    @property
+    def expected_time(self) -> float:
+        """
+        expected_time is the number of seconds this fetcher can be expected to spend per successful fetch.
+        Trying fetchers in increasing order of this minimises the expected time to a successful fetch.
+        """
+        failures = self.attempts - self.successes
+        p = (self.successes + _PRIOR_WEIGHT * _PRIOR_SUCCESS_RATE) / (
+            self.attempts + _PRIOR_WEIGHT
+        )
+        success_time = (self.success_seconds + _PRIOR_WEIGHT * _PRIOR_SECONDS) / (
+            self.successes + _PRIOR_WEIGHT
+        )
+        failure_time = (self.failure_seconds + _PRIOR_WEIGHT * _PRIOR_SECONDS) / (
+            failures + _PRIOR_WEIGHT
+        )
+        return (p * success_time + (1 - p) * failure_time) / p
+
+    def to_dict(self) -> dict:
+        return asdict(self) | {
+            "success_rate": self.success_rate,
+            "ttfb": self.ttfb,
+            "throughput": self.throughput,
+            "expected_time": self.expected_time,
+        }
+
+
+# The FetcherScore fields that are stored, and which of them are counts.
+_STATS = {f.name for f in fields(FetcherScore)} - {"fetcher"}
+_COUNTS = {"attempts", "successes", "ttfb_count"}
+
+
+class Scoreboard:
+    """
+    The Scoreboard keeps a rolling record of how each fetcher has fared against each domain, in Redis.
+    Attempts are counted in hourly buckets that expire once they fall out of the window, so old results age out and
+    a fetcher that's recovered is judged on how it's doing now.
+    """
+
+    bucket_seconds = 3600
+
+    def __init__(self, redis, window_hours: int = 24):
+        """
+        :param redis: Redis connection.
+        :param window_hours: Number of hours of history to keep.
+        """
+        self.redis = redis
+        self.window_hours = window_hours
+
+    def _buckets(self, now: float) -> list[int]:
+        current = int(now // self.bucket_seconds)
+        return list(range(current - self.window_hours + 1, current + 1))
+
+    def record(
+        self,
+        url: str,
+        fetcher: str,
+        success: bool,
+        duration: float,
+        ttfb: float | None = None,
+        download_bytes: int | None = None,
+        download_seconds: float | None = None,
+    ):
+        """
+        record records the outcome of a fetcher's attempt at the given URL.
+        :param duration: Seconds the attempt took.
+        :param ttfb: Seconds taken to receive the first bytes of media, if any were.
+        :param download_bytes: Size of the media, if the attempt succeeded.
+        :param download_seconds: Seconds spent downloading the media, if the attempt succeeded.
+        """
+        now = time.time()
+        domain = domain_of(url)
+        key = f"{SCOREBOARD_KEY}:{domain}:{self._buckets(now)[-1]}"
+
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.hincrby(key, f"{fetcher}:attempts", 1)
+        if success:
+            pipeline.hincrby(key, f"{fetcher}:successes", 1)
+            pipeline.hincrbyfloat(key, f"{fetcher}:success_seconds", duration)
+        else:
+            pipeline.hincrbyfloat(key, f"{fetcher}:failure_seconds", duration)
+        if ttfb is not None:
+            pipeline.hincrbyfloat(key, f"{fetcher}:ttfb_seconds", ttfb)
+            pipeline.hincrby(key, f"{fetcher}:ttfb_count", 1)
+        if download_bytes is not None and download_seconds:
+            pipeline.hincrbyfloat(key, f"{fetcher}:download_bytes", download_bytes)
+            pipeline.hincrbyfloat(key, f"{fetcher}:download_seconds", download_seconds)
+        pipeline.expire(key, (self.window_hours + 1) * self.bucket_seconds)
+        pipeline.zadd(DOMAINS_KEY, {domain: now})
+        pipeline.zremrangebyscore(
+            DOMAINS_KEY, "-inf", now - self.window_hours * self.bucket_seconds
+        )
+        pipeline.execute()
+
+    def scores(self, domain: str) -> dict[str, FetcherScore]:
+        """scores returns the score of every fetcher with any history against the given domain, by fetcher name."""
+        pipeline = self.redis.pipeline(transaction=False)
+        for bucket in self._buckets(time.time()):
+            pipeline.hgetall(f"{SCOREBOARD_KEY}:{domain}:{bucket}")
+
+        scores: dict[str, FetcherScore] = {}
+        for bucket in pipeline.execute():
+            for field, value in bucket.items():
+                fetcher, _, stat = field.decode().rpartition(":")
+                if stat not in _STATS:
+                    continue
+                score = scores.setdefault(fetcher, FetcherScore(fetcher))
+                value = int(value) if stat in _COUNTS else float(value)
+                setattr(score, stat, getattr(score, stat) + value)
+        return scores
+
+    def domains(self) -> list[str]:
+        """domains returns every domain with history in the window."""
+        return [
+            d.decode()
+            for d in self.redis.zrangebyscore(
+                DOMAINS_KEY,
+                time.time() - self.window_hours * self.bucket_seconds,
+                "+inf",
+            )
+        ]
+
+    def order(
+        self, url: str, fetchers: Sequence[Fetcher], explore: float = 0.0
+    ) -> list[Fetcher]:
+        """
+        order sorts the given fetchers by how long each can be expected to take to fetch the given URL.
+        Fetchers the scoreboard can't tell apart are left in the order they were given.
+        :param explore: Chance of trying the fetcher with the least history first instead, so that a fetcher that's
+            fallen to the back gets the chance to show it's recovered.
+        """
+        scores = self.scores(domain_of(url))
+        ranked = sorted(
+            fetchers,
+            key=lambda f: scores.get(f.name, FetcherScore(f.name)).expected_time,
+        )
+        if len(ranked) > 1 and random.random() < explore:
+            least_tried = min(
+                ranked[1:],
+                key=lambda f: scores.get(f.name, FetcherScore(f.name)).attempts,
+            )
+            ranked.remove(least_tried)
+            ranked.insert(0, least_tried)
+        return ranked
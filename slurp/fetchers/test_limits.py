@@ -0,0 +1,61 @@
+import time
+
+import fakeredis
+import pytest
+
+from slurp.fetchers.limits import DEFAULT_SCOPE, Limit, Limiter
+
+_URL = "https://www.youtube.com/watch?v=x"
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeRedis()
+
+
+def test_concurrency(redis):
+    limiter = Limiter(redis, {DEFAULT_SCOPE: Limit(concurrency=2)}, {})
+    assert limiter.acquire("a", _URL, "yt-dlp") == 0
+    assert limiter.acquire("b", _URL, "cobalt") == 0
+    assert limiter.acquire("c", _URL, "yt-dlp") > 0, "the origin should be full"
+    assert limiter.acquire("c", "https://www.bbc.co.uk/x", "cobalt") == 0, (
+        "other origins have their own slots"
+    )
+    limiter.release("a", _URL, "yt-dlp")
+    assert limiter.acquire("c", _URL, "yt-dlp") == 0
+    assert {u["scope"]: u["in_use"] for u in limiter.utilisation()} == {
+        "origin:youtube.com": 2,
+        "origin:bbc.co.uk": 1,
+    }
+
+
+def test_all_or_nothing(redis):
+    limiter = Limiter(
+        redis,
+        {DEFAULT_SCOPE: Limit(concurrency=2)},
+        {"yt-dlp": Limit(concurrency=1)},
+    )
+    assert limiter.acquire("a", _URL, "yt-dlp") == 0
+    assert limiter.acquire("b", _URL, "yt-dlp") > 0
+    assert limiter.acquire("b", _URL, "cobalt") == 0, (
+        "being turned away by the fetcher shouldn't have used up the origin"
+    )
+
+
+def test_rate(redis):
+    limiter = Limiter(redis, {"youtube.com": Limit(rate=0.1, burst=2)}, {})
+    assert limiter.acquire("a", _URL, "yt-dlp") == 0
+    assert limiter.acquire("b", _URL, "yt-dlp") == 0
+    wait = limiter.acquire("c", _URL, "yt-dlp")
+    assert 5 < wait <= 12.5, "the next token is due in about 10s"
+
+
+def test_slots_lapse(redis):
+    limiter = Limiter(redis, {DEFAULT_SCOPE: Limit(concurrency=1)}, {}, slot_ttl=0.2)
+    assert limiter.acquire("a", _URL, "yt-dlp") == 0
+    assert limiter.acquire("b", _URL, "yt-dlp") > 0
+
+    time.sleep(0.3)
+    assert limiter.acquire("b", _URL, "yt-dlp") == 0, (
+        "a slot that isn't renewed should lapse"
+    )
@@ -0,0 +1,50 @@
+import fakeredis
+import pytest
+
+from slurp.fetchers.scoreboard import Scoreboard, domain_of
+
+
+class _Fetcher:
+    def __init__(self, name: str):
+        self.name = name
+
+
+@pytest.fixture
+def scoreboard():
+    return Scoreboard(fakeredis.FakeRedis())
+
+
+def test_domain_of():
+    assert domain_of("https://www.youtube.com/watch?v=x") == "youtube.com"
+    assert domain_of("https://m.youtube.com/watch?v=x") == "youtube.com"
+    assert domain_of("https://www.bbc.co.uk/iplayer/episode/x") == "bbc.co.uk"
+
+
+def test_scores_accumulate(scoreboard):
+    url = "https://www.youtube.com/watch?v=x"
+    scoreboard.record(
+        url, "yt-dlp", True, 10, ttfb=2, download_bytes=800, download_seconds=8
+    )
+    scoreboard.record(url, "yt-dlp", False, 30)
+    score = scoreboard.scores("youtube.com")["yt-dlp"]
+    assert score.attempts == 2
+    assert score.success_rate == 0.5
+    assert score.ttfb == 2
+    assert score.throughput == 100
+    assert scoreboard.domains() == ["youtube.com"]
+
+
+def test_order_prefers_what_works(scoreboard):
+    url = "https://www.youtube.com/watch?v=x"
+    fetchers = [_Fetcher("yt-dlp"), _Fetcher("cobalt")]
+    assert scoreboard.order(url, fetchers) == fetchers, (
+        "with no history, the given order should be kept"
+    )
+    for _ in range(5):
+        scoreboard.record(url, "yt-dlp", False, 120)
+        scoreboard.record(url, "cobalt", True, 20)
+    assert [f.name for f in scoreboard.order(url, fetchers)] == ["cobalt", "yt-dlp"]
+    assert [f.name for f in scoreboard.order(url, fetchers, explore=1)] == [
+        "yt-dlp",
+        "cobalt",
+    ], "exploring should try the fetcher with the least history first"
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from slurp.fetchers.types import StallPolicy, StallWatch
+
+
+@pytest.fixture
+def watch(tmp_path, monkeypatch):
+    monkeypatch.setattr(StallWatch, "sample_interval", 0)
+
+    def make(**policy):
+        return StallWatch(StallPolicy(**policy), str(tmp_path))
+
+    return make
+
+
+def _write(path, n: int):
+    with open(path, "ab") as f:
+        f.write(bytes(n))
+
+
+def test_events_without_data_stall(watch):
+    w = watch(first_byte_timeout=0.3, idle_timeout=10)
+    for _ in range(2):
+        w.alive()
+        assert w.check() is None
+        time.sleep(0.1)
+    time.sleep(0.15)
+    w.alive()
+    assert "no data" in w.check()
+
+
+def test_steady_data_without_events_is_fine(watch, tmp_path):
+    w = watch(first_byte_timeout=10, idle_timeout=0.3, window=0.2, min_throughput=100)
+    for _ in range(8):
+        _write(tmp_path / "media.part", 1000)
+        assert w.check() is None
+        time.sleep(0.1)
+
+
+def test_slow_data_stalls(watch, tmp_path):
+    w = watch(first_byte_timeout=10, idle_timeout=10, window=0.3, min_throughput=1e6)
+    _write(tmp_path / "media.part", 10)
+    assert w.check() is None
+    for _ in range(5):
+        time.sleep(0.1)
+        _write(tmp_path / "media.part", 10)
+        reason = w.check()
+    assert "B/s" in reason
+
+
+def test_partial_download_is_not_progress(watch, tmp_path):
+    _write(tmp_path / "media.part", 1000)
+    w = watch(first_byte_timeout=0.2, idle_timeout=10)
+    time.sleep(0.3)
+    assert "no data" in w.check()
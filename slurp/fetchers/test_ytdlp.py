@@ -1,8 +1,12 @@
+import http.server
+import queue
+import threading
+
 import httpx
 import pytest
 import yt_dlp.utils
 
-from slurp.fetchers.types import Format
+from slurp.fetchers.types import Clip, Format
 from slurp.fetchers.ytdlp import YTDLPFetcher
 
 _urls = {
@@ -70,3 +74,84 @@ class TestYTDLPFetcher:
         assert (tmp_path / "test.webm").exists(), (
             "output file does not exist (expected 'test.webm')"
         )
+
+
+def test_warm_up_reuses_extractor(tmp_path):
+    fetcher = YTDLPFetcher(cache_dir=str(tmp_path))
+    fetcher.warm_up()
+    with fetcher._extractor() as ydl:
+        assert ydl.params["cachedir"] == str(tmp_path)
+    fetcher.warm_up()
+    with fetcher._extractor() as again:
+        assert again is ydl, "warm_up should only create the extractor once"
+
+
+@pytest.fixture
+def paired_media():
+    """paired_media serves media at any path - but only answers the first request for each once there are two."""
+    barrier = threading.Barrier(2, timeout=5)
+    seen = set()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path not in seen:
+                seen.add(self.path)
+                try:
+                    barrier.wait()
+                except threading.BrokenBarrierError:
+                    self.send_error(503)
+                    return
+            self.send_response(200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        do_HEAD = do_GET
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_concurrent_extraction(paired_media):
+    fetcher = YTDLPFetcher()
+    fetcher.warm_up()
+    results = {}
+
+    def extract(name):
+        q = queue.Queue()
+        info = fetcher._extract(f"{paired_media}/{name}.mp4", q)
+        results[name] = (info, [q.get().message for _ in range(q.qsize())])
+
+    threads = [threading.Thread(target=extract, args=(n,)) for n in ("a", "b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # Had either extraction waited for the other, neither would have been answered.
+    assert results.keys() == {"a", "b"}
+    for name, (info, messages) in results.items():
+        assert info["webpage_url"] == f"{paired_media}/{name}.mp4"
+        assert len(messages) > 0 and all(
+            f"/{name}.mp4" in m or f"] {name}:" in m for m in messages
+        ), "each extraction logs to its own queue"
+    assert len(fetcher._idle_ydls) == 2, "both instances are kept for next time"
+
+
+def test_clip_config():
+    assert YTDLPFetcher._clip_config(None) == {}
+    cfg = YTDLPFetcher._clip_config(Clip(start=3750, end=3790, precise=True))
+    assert cfg["force_keyframes_at_cuts"]
+    assert list(cfg["download_ranges"]({"duration": 10800}, None)) == [
+        {"start_time": 3750, "end_time": 3790}
+    ]
+    cfg = YTDLPFetcher._clip_config(Clip(start=60))
+    assert not cfg["force_keyframes_at_cuts"]
+    assert list(cfg["download_ranges"]({"duration": 10800}, None)) == [
+        {"start_time": 60, "end_time": float("inf")}
+    ], "a clip with no end runs to the end of the media"
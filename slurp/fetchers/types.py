@@ -1,9 +1,15 @@
+import collections
+import queue
+import threading
+import time
 from abc import ABC, abstractmethod
 from collections.abc import Generator
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 
+from slurp.helpers import dir_size, format_timestamp
+
 
 class Format(str, Enum):
     """A Format defines what format the target Media should be fetched in."""
@@ -31,6 +37,31 @@ class MediaMetadata:
 
     thumbnail_url: str | None = None
 
+    # Expected size of the media in bytes, if the source says.
+    filesize: int | None = None
+
+
+@dataclass()
+class Clip:
+    """A Clip is the part of the media to fetch, when only part of it is wanted."""
+
+    # Seconds into the media to start from.
+    start: float = 0
+    # Seconds into the media to end at, or None to carry on to the end.
+    end: float | None = None
+    # Cut exactly at start and end, re-encoding around the cuts. Otherwise, the cuts are made at the nearest keyframes,
+    # which is much quicker, but can take in a few seconds either side.
+    precise: bool = False
+
+    def length(self, duration: float) -> float:
+        """length returns how many seconds long the clip is, out of media of the given duration."""
+        end = duration if self.end is None else min(self.end, duration)
+        return max(end - self.start, 0)
+
+    def __str__(self):
+        end = "the end" if self.end is None else format_timestamp(self.end)
+        return f"{format_timestamp(self.start)} to {end}"
+
 
 class FetcherUpdateEvent(ABC):
     """A FetcherUpdateEvent is any event that happens over the course of a fetcher's fetching lifespan."""
@@ -61,12 +92,93 @@ class FetcherMediaMetadataAvailable(FetcherUpdateEvent):
     metadata: MediaMetadata
 
 
+@dataclass()
+class StallPolicy:
+    """
+    A StallPolicy decides when a download has stalled, and should be given up on in favour of the next fetcher.
+    Progress is measured by how much has been written to the download directory.
+    """
+
+    # Seconds to wait for the first bytes of media (metadata lookups, stream negotiation, etc. happen before this).
+    first_byte_timeout: float = 300
+    # Seconds without any bytes written or events reported, at any point, before giving up.
+    idle_timeout: float = 300
+    # Once bytes are flowing, they must average at least min_throughput bytes/s over every window seconds.
+    window: float = 60
+    min_throughput: float = 1024
+
+
+class StallWatch:
+    """A StallWatch tracks the progress of a single download against a StallPolicy."""
+
+    # Minimum number of seconds between looks at the download directory.
+    sample_interval = 1.0
+
+    def __init__(self, policy: StallPolicy, directory: str):
+        self.policy = policy
+        self.directory = directory
+
+        now = time.monotonic()
+        self._ts_start = now
+        self._ts_alive = now
+        self._ts_sampled = 0.0
+        self._ts_first_byte: float | None = None
+        # The directory may already hold a partial download from a previous attempt.
+        self._size = dir_size(directory)
+        # Bytes written since the first byte, as (time, cumulative bytes) samples covering the last window.
+        self._written = 0
+        self._samples: collections.deque[tuple[float, int]] = collections.deque()
+
+    def alive(self):
+        """alive records that the download reported an event."""
+        self._ts_alive = time.monotonic()
+
+    def check(self) -> str | None:
+        """check samples the download's progress, and returns why it has stalled, if it has."""
+        now = time.monotonic()
+        if now - self._ts_sampled >= self.sample_interval:
+            self._sample(now)
+
+        if now - self._ts_alive >= self.policy.idle_timeout:
+            return f"no data or events for {now - self._ts_alive:.0f}s"
+        if self._ts_first_byte is None:
+            if now - self._ts_start >= self.policy.first_byte_timeout:
+                return f"no data after {now - self._ts_start:.0f}s"
+            return None
+        if now - self._ts_first_byte < self.policy.window:
+            # Not enough history to judge the throughput yet.
+            return None
+        ts_oldest, written = self._samples[0]
+        throughput = (self._written - written) / max(now - ts_oldest, 1e-3)
+        if throughput < self.policy.min_throughput:
+            return f"only {throughput:.0f}B/s over the last {now - ts_oldest:.0f}s"
+        return None
+
+    def _sample(self, now: float):
+        self._ts_sampled = now
+        size = dir_size(self.directory)
+        if size != self._size:
+            self._ts_alive = now
+            if self._ts_first_byte is None:
+                self._ts_first_byte = now
+            # Files shrink when they're merged or moved, which isn't a loss of progress.
+            self._written += max(size - self._size, 0)
+            self._size = size
+        self._samples.append((now, self._written))
+        # Keep one sample at least a window old, to measure the window from.
+        while (
+            len(self._samples) > 1 and now - self._samples[1][0] >= self.policy.window
+        ):
+            self._samples.popleft()
+
+
 class Fetcher(ABC):
     """A Fetcher is an interface for downloading media from any supported external media source.
 
     Attributes:
         name: Friendly name of the Fetcher
         priority: How urgently this Fetcher should be selected (0 has highest priority, then incrementing)
+        stall_policy: When to give up on a download that isn't getting anywhere.
         service_names: list[str]: Friendly names of services this fetcher supports.
         service_urls: list[str] | None: List of domains that this fetcher supports grabbing media from.
             If set to None, then this service will attempt to download literally anything as a last resort.
@@ -80,12 +192,33 @@ class Fetcher(ABC):
 
     service_urls: list[str] | None
 
+    # When to give up on a download that isn't getting anywhere.
+    stall_policy: StallPolicy = StallPolicy()
+
+    # Whether the fetcher can download just a clip of the media. If it can't, it's given the whole thing to download,
+    # and it's trimmed afterwards.
+    clips: bool = False
+
     @property
     @abstractmethod
     def ready(self) -> bool:
         """A Fetcher is Ready when it can handle requests (configuration is valid, can connect to backend, etc."""
         return False
 
+    def warm_up(self):
+        """
+        warm_up prepares any state that can be reused between fetches (clients, caches, backend checks).
+        It is called once per worker process, before any fetches are run. By default, there's nothing to do.
+        """
+
+    def probe(self, url: str, fmt: Format) -> MediaMetadata | None:
+        """
+        probe looks up metadata for the media at the given URL without downloading it - including its expected size,
+        if the source says - so the fetch can be scheduled by how big it is.
+        By default, the fetcher can't, and returns None.
+        """
+        return None
+
     @abstractmethod
     def fetch(
         self,
@@ -93,6 +226,8 @@ class Fetcher(ABC):
         fmt: Format,
         directory: str,
         filename: str,
+        cancel: threading.Event | None = None,
+        clip: Clip | None = None,
     ) -> Generator[FetcherUpdateEvent]:
         """
         fetch fetches the media at the given URL, in the given format, and places it at the provided directory / filename.
@@ -106,4 +241,56 @@ class Fetcher(ABC):
         :param fmt:
         :param directory:
         :param filename:
+        :param cancel: If this is set, the fetch should stop as soon as it can (killing anything it's started), and
+            finish with a failure.
+        :param clip: The part of the media to fetch, if only part of it is wanted. Only fetchers that support clips
+            are given one.
+        """
+
+    def _relay(
+        self,
+        q: queue.Queue[FetcherUpdateEvent],
+        thread: threading.Thread,
+        directory: str,
+        abort: threading.Event,
+        cancel: threading.Event | None = None,
+    ) -> Generator[FetcherUpdateEvent]:
+        """
+        _relay yields the events a fetcher's download thread puts on q, until it finishes or shuts the queue down.
+        Meanwhile, it watches the directory the thread is downloading into, and if the download stalls (see
+        stall_policy), or cancel is set, it sets abort to stop the thread, and finishes with a failure.
+        :param q: Queue the thread puts its events on.
+        :param thread: The download thread.
+        :param directory: Directory the thread downloads into.
+        :param abort: Event the thread stops on.
+        :param cancel: Event set when the whole fetch is cancelled.
         """
+        watch = StallWatch(self.stall_policy, directory)
+        while True:
+            failure: str | None = None
+            if cancel is not None and cancel.is_set():
+                failure = "Fetch cancelled"
+            else:
+                stall = watch.check()
+                if stall is not None:
+                    failure = f"Fetcher stalled: {stall}"
+            if failure is not None:
+                abort.set()
+                # Let the thread tidy up (and let go of the directory) before moving on.
+                thread.join(timeout=10)
+                yield FetcherProgressReport(
+                    typ="finish", level="warning", status=1, message=failure
+                )
+                break
+            try:
+                # Wake up regularly to check on the download.
+                event: FetcherUpdateEvent = q.get(timeout=1)
+            except queue.Empty:
+                continue
+            except queue.ShutDown:
+                # End of data.
+                break
+            watch.alive()
+            yield event
+            if isinstance(event, FetcherProgressReport) and event.typ == "finish":
+                break
@@ -1,12 +1,14 @@
+import contextlib
+import copy
+import math
 import queue
 import threading
 from collections.abc import Generator
 from datetime import UTC, datetime
 from glob import glob
 
-from yt_dlp import YoutubeDL
-
 from slurp.fetchers.types import (
+    Clip,
     Fetcher,
     FetcherMediaAvailable,
     FetcherMediaMetadataAvailable,
@@ -28,6 +30,9 @@ class YTDLPFetcher(Fetcher):
     # We're not particularly specific - but try it first before moving on.
     priority = 100
 
+    # YT-DLP can download just part of the media (with ffmpeg), rather than the whole thing.
+    clips = True
+
     service_names = [
         "Most services - see https://github.com/yt-dlp/yt-dlp/blob/master/supportedsites.md"
     ]
@@ -44,14 +49,23 @@ class YTDLPFetcher(Fetcher):
 
     js_runtimes: dict[str, dict[str, str]] | None = None
     extractor_args: dict[str, dict[str, str]] | None = None
+    cache_dir: str | None = None
 
     def __init__(
         self,
         js_runtimes: dict[str, dict[str, str]] | None = None,
         extractor_args: dict[str, dict[str, str]] = None,
+        cache_dir: str | None = None,
     ):
         self.js_runtimes = js_runtimes
         self.extractor_args = extractor_args
+        self.cache_dir = cache_dir
+
+        # The YoutubeDL instances used for extraction are kept for the life of the process, so that their extractors
+        # (and the player JS they've downloaded and solved) are reused between fetches. See warm_up.
+        # YoutubeDL isn't thread-safe, so each extraction borrows an instance of its own - these are the idle ones.
+        self._idle_ydls = []
+        self._ydl_lock = threading.Lock()
 
     class _Queuelogger:
         """queueLogger provides a yt-dlp compatible logging interface that emits exclusively to a queue."""
@@ -75,15 +89,25 @@ class YTDLPFetcher(Fetcher):
         def error(self, msg):
             self.q.put(FetcherProgressReport(typ="log", level="error", message=msg))
 
+    def _base_config(self) -> dict:
+        """_base_config returns YT-DLP configuration common to extraction and downloads in any format."""
+        cfg = {}
+        if self.extractor_args is not None:
+            # If extractor args are available, append them to the config.
+            cfg = cfg | {"extractor_args": self.extractor_args}
+        if self.js_runtimes is not None:
+            cfg = cfg | {"js_runtimes": self.js_runtimes}
+        if self.cache_dir is not None:
+            # The cache holds solved player JS and signatures, so it's worth sharing between processes.
+            cfg = cfg | {"cachedir": self.cache_dir}
+        return cfg
+
     def _format_config(self, fmt: Format) -> dict:
         """_format_config returns YT-DLP configuration to be used when downloading media in the given format.
         :param fmt: The desired media format.
         :return: A YT-DLP configuration parameters dictionary.
         """
-        cfg = {}
-        if self.extractor_args is not None:
-            # If extractor args are available, append them to the config.
-            cfg = cfg | {"extractor_args": self.extractor_args}
+        cfg = self._base_config()
 
         match fmt:
             case fmt.VIDEO_AUDIO:
@@ -107,30 +131,99 @@ class YTDLPFetcher(Fetcher):
                 raise ValueError("invalid format")
         return cfg
 
+    @staticmethod
+    def _clip_config(clip: Clip | None) -> dict:
+        """_clip_config returns YT-DLP configuration to download just the given clip of the media, if there is one."""
+        if clip is None:
+            return {}
+        from yt_dlp.utils import download_range_func
+
+        end = math.inf if clip.end is None else clip.end
+        return {
+            "download_ranges": download_range_func(None, [(clip.start, end)]),
+            # Re-encode around the cuts so they're exactly where they were asked for, rather than at keyframes.
+            "force_keyframes_at_cuts": clip.precise,
+        }
+
+    def warm_up(self):
+        """warm_up creates a YoutubeDL instance for extraction, and initialises its YouTube extractor."""
+        with self._extractor():
+            pass
+
+    @contextlib.contextmanager
+    def _extractor(self) -> Generator:
+        """
+        _extractor lends out a long-lived YoutubeDL instance for extraction - an idle one, or a new one if they're all
+        in use (by a hedged race, or a preflight, say). Nothing else uses it until it's given back.
+        """
+        with self._ydl_lock:
+            ydl = self._idle_ydls.pop() if len(self._idle_ydls) > 0 else None
+        if ydl is None:
+            # yt-dlp is slow to import, and only needed by processes that actually fetch.
+            from yt_dlp import YoutubeDL
+
+            # Nothing is printed to the worker's output - anything worth hearing goes to the logger, if there is one.
+            ydl = YoutubeDL(self._base_config() | {"quiet": True, "no_warnings": True})
+            ydl.get_info_extractor("Youtube")
+        try:
+            yield ydl
+        finally:
+            ydl.params["logger"] = None
+            with self._ydl_lock:
+                self._idle_ydls.append(ydl)
+
+    def _extract(
+        self, url: str, q: queue.Queue[FetcherUpdateEvent] | None = None
+    ) -> dict:
+        """
+        _extract extracts information about the media at the given URL, without selecting formats or downloading.
+        :param url: The URL of the media.
+        :param q: Queue to send extractor log messages to, if any.
+        :return: The raw extractor result, which can be processed by any YoutubeDL instance.
+        """
+        with self._extractor() as ydl:
+            ydl.params["logger"] = self._Queuelogger(q) if q is not None else None
+            return ydl.extract_info(url, download=False, process=False)
+
+    @staticmethod
+    def _metadata(url: str, response: dict) -> MediaMetadata:
+        """_metadata builds MediaMetadata from a processed and sanitized YT-DLP info dictionary."""
+        data = MediaMetadata(url)
+        data.name = response.get("title")
+        data.author = response.get("uploader")
+        data.author_url = response.get("uploader_url")
+        data.ts_upload = (
+            datetime.fromtimestamp(response.get("timestamp"), UTC)
+            if response.get("timestamp", False)
+            else None
+        )
+        data.duration = response.get("duration")
+
+        data.thumbnail_url = response.get("thumbnail")
+
+        data.format = response.get("format")
+        # Formats that are merged (video+audio) are sized separately.
+        sizes = [
+            f.get("filesize") or f.get("filesize_approx")
+            for f in response.get("requested_formats") or [response]
+        ]
+        data.filesize = sum(sizes) if sizes and None not in sizes else None
+        return data
+
     def _get_metadata(
         self, url: str, fmt: Format = Format.VIDEO_AUDIO
     ) -> MediaMetadata:
         """_get_metadata returns MediaMetadata for the given url."""
-        data = MediaMetadata(url)
-        with YoutubeDL(self._format_config(fmt)) as ydl:
-            info = ydl.extract_info(url, download=False)
+        from yt_dlp import YoutubeDL
 
+        with YoutubeDL(self._format_config(fmt)) as ydl:
+            info = ydl.process_ie_result(self._extract(url), download=False)
             # sanitize_info required to make serializable
-            response = ydl.sanitize_info(info)
-            data.name = response.get("title")
-            data.author = response.get("uploader")
-            data.author_url = response.get("uploader_url")
-            data.ts_upload = (
-                datetime.fromtimestamp(response.get("timestamp"), UTC)
-                if response.get("timestamp", False)
-                else None
-            )
-            data.duration = response.get("duration")
+            return self._metadata(url, ydl.sanitize_info(info))
 
-            data.thumbnail_url = response.get("thumbnail")
-
-            data.format = response.get("format")
-        return data
+    def probe(self, url: str, fmt: Format) -> MediaMetadata | None:
+        """probe extracts the media's metadata, with the size of the formats that would be downloaded."""
+        return self._get_metadata(url, fmt)
 
     def _get_media(
         self,
@@ -139,15 +232,27 @@ class YTDLPFetcher(Fetcher):
         fmt: Format,
         directory: str,
         filename: str,
+        abort: threading.Event,
+        clip: Clip | None = None,
     ):
         """
         Commence a download from YouTube.
         Consider threading this to allow for asynchronous downloads.
         """
+        from yt_dlp import YoutubeDL
+        from yt_dlp.utils import DownloadCancelled
+
+        def check_abort(_):
+            # yt-dlp calls its hooks as the download progresses, so this is where it can be stopped.
+            if abort.is_set():
+                raise DownloadCancelled("Download aborted")
+
         opts = (
             {
                 "logger": self._Queuelogger(q),
                 "no_warnings": True,
+                "progress_hooks": [check_abort],
+                "postprocessor_hooks": [check_abort],
                 "outtmpl": f"{directory}/{filename}.%(ext)s",
                 "paths": {
                     "home": directory,
@@ -155,20 +260,23 @@ class YTDLPFetcher(Fetcher):
                 },
             }
             | self._format_config(fmt)
+            | self._clip_config(clip)
         )
 
-        if self.js_runtimes is not None:
-            opts.update({"js_runtimes": self.js_runtimes})
-
         try:
-            # We support early metadata - send that if it's available.
-            metadata = self._get_metadata(url, fmt)
-            if metadata.name != "":
-                event = FetcherMediaMetadataAvailable(metadata=metadata)
-                q.put(event)
+            # Extract once with the warm instance - the result is used for both the metadata and the download.
+            ie_result = self._extract(url, q)
 
             with YoutubeDL(opts) as ydl:
-                code = ydl.download([url])
+                # We support early metadata - send that if it's available.
+                info = ydl.process_ie_result(copy.deepcopy(ie_result), download=False)
+                metadata = self._metadata(url, ydl.sanitize_info(info))
+                if metadata.name != "":
+                    event = FetcherMediaMetadataAvailable(metadata=metadata)
+                    q.put(event)
+
+                # Any errors are raised, so if it gets past here, the download succeeded.
+                ydl.process_ie_result(ie_result, download=True)
                 files = glob(f"{directory}/*.*")
                 assert len(files) == 1, (
                     f"unexpected number of files in bagging area: {len(files)}"
@@ -178,7 +286,7 @@ class YTDLPFetcher(Fetcher):
                     FetcherProgressReport(
                         typ="finish",
                         level="info",
-                        status=code,
+                        status=0,
                         message="Fetcher complete",
                     )
                 )
@@ -201,31 +309,20 @@ class YTDLPFetcher(Fetcher):
         fmt: Format,
         directory: str,
         filename: str,
+        cancel: threading.Event | None = None,
+        clip: Clip | None = None,
     ) -> Generator[FetcherUpdateEvent]:
         """get_media downloads the media at the given params in the foreground, returning log information by means of a Generator."""
         q: queue.Queue[FetcherUpdateEvent] = queue.Queue()
+        # Set to stop the download thread early, if it stalls or the fetch is cancelled.
+        abort = threading.Event()
 
         # We need to run the download on a thread so we can continue to execute our client response
         thread = threading.Thread(
-            target=self._get_media, args=(q, url, fmt, directory, filename), daemon=True
+            target=self._get_media,
+            args=(q, url, fmt, directory, filename, abort, clip),
+            daemon=True,
         )
         thread.start()
 
-        while True:
-            try:
-                # Reasonably sane timeout, just to stop us endlessly spinning.
-                event: FetcherUpdateEvent = q.get(timeout=300)
-            except queue.ShutDown:
-                # End of data.
-                break
-            match event:
-                case FetcherProgressReport() as i:
-                    if i.typ == "finish":
-                        yield i
-                        # Break the generator.
-                        break
-                    yield i
-                case FetcherMediaMetadataAvailable() as i:
-                    yield i
-                case FetcherMediaAvailable() as i:
-                    yield i
+        yield from self._relay(q, thread, directory, abort, cancel)
@@ -1,29 +1,45 @@
+import os
 import shutil
-from collections.abc import Generator
+import subprocess
+from collections.abc import Generator, Iterable
 from urllib.parse import SplitResult, urlsplit
 
 from flask import current_app
 from httpx import HTTPError
-from pymediainfo import MediaInfo
 
+from slurp import db
+from slurp.failures import diagnose
 from slurp.fetchers.types import (
+    Clip,
     FetcherMediaAvailable,
     FetcherProgressReport,
     FetcherUpdateEvent,
 )
-from slurp.lib.yt_block_check import InvalidUrlException, YtBlockCheck, hostSuffixes
+from slurp.lib.yt_block_check import (
+    CachedYtBlockCheck,
+    InvalidUrlException,
+    VideoStatus,
+    YtBlockCheck,
+    hostSuffixes,
+)
 from slurp.models import Fetch
 
 _acceptable_frame_rates = [23.976, 24, 25, 29.97, 30, 50, 59.94, 60]
 
 
-def troubleshooter(fetch: Fetch) -> Generator[FetcherUpdateEvent]:
+def troubleshooter(
+    fetch: Fetch, reasons: Iterable[str] = ()
+) -> Generator[FetcherUpdateEvent]:
     """
     The Troubleshooter attempts to figure out why a given fetch failed.
+    It finishes with a FailureDiagnosis, saying whether the failure is likely to happen again.
     :param fetch: The fetch that failed.
+    :param reasons: Messages the fetchers failed with.
     """
     # This canary is flipped if one or more of the troubleshooting routines are run.
     ts_run = False
+    # What YouTube reports about the video, if it's a YouTube video we could ask about.
+    video: VideoStatus | None = None
     # If it's a YouTube video, we can hopefully provide some context.
 
     url_split: SplitResult = urlsplit(fetch.url)
@@ -32,13 +48,16 @@ def troubleshooter(fetch: Fetch) -> Generator[FetcherUpdateEvent]:
         ts_run = True
         if current_app.config.get("EXT_API_YT_TOKEN", None) is not None:
             try:
-                result = YtBlockCheck(
-                    api_key=current_app.config.get("YT_API_KEY")
-                ).check(fetch.url)
+                # Lookups are cached, as a YouTube outage can fail a lot of fetches of the same video at once.
+                video = CachedYtBlockCheck(
+                    YtBlockCheck(api_key=current_app.config.get("EXT_API_YT_TOKEN")),
+                    db.redis,
+                    ttl=current_app.config.get("EXT_API_YT_CACHE_TTL"),
+                ).lookup(fetch.url)
                 yield FetcherProgressReport(
                     typ="log",
                     level="info",
-                    message=f"YouTube interrogation: {result}",
+                    message=f"YouTube interrogation: {video.describe()}",
                 )
             except InvalidUrlException as e:
                 yield FetcherProgressReport(
@@ -56,7 +75,7 @@ def troubleshooter(fetch: Fetch) -> Generator[FetcherUpdateEvent]:
             yield FetcherProgressReport(
                 typ="log",
                 level="warning",
-                message="Unable to interrogate YouTube for troubleshooting information, as the YT_API_KEY configuration value has not been set.",
+                message="Unable to interrogate YouTube for troubleshooting information, as the EXT_API_YT_TOKEN configuration value has not been set.",
             )
     if not ts_run:
         yield FetcherProgressReport(
@@ -64,10 +83,18 @@ def troubleshooter(fetch: Fetch) -> Generator[FetcherUpdateEvent]:
             level="info",
             message="Unable to troubleshoot why the fetch failed. This is likely because the origin is not supported by the troubleshooter. Read the logs for more context.",
         )
+    yield diagnose(reasons, video)
     return
 
 
 def finalise(src: str, dest_dir: str):
+    """finalise checks the media at src is sound, then moves it into dest_dir."""
+    yield from validate(src)
+    yield from place(src, dest_dir)
+
+
+def validate(src: str) -> Generator[FetcherUpdateEvent]:
+    """validate checks the media at src is sound, reporting any problems with it."""
     problems = _validate_media_integrity(src)
     if len(problems) > 0:
         for problem in problems:
@@ -82,10 +109,60 @@ def finalise(src: str, dest_dir: str):
             level="info",
             message="Media seems fine",
         )
+
+
+def trim(src: str, clip: Clip) -> Generator[FetcherUpdateEvent]:
+    """trim cuts the media at src down to the given clip, in place - for fetchers that can't download just the clip."""
+    base, extension = os.path.splitext(src)
+    trimmed = f"{base}.clip{extension}"
+    proc = subprocess.run(
+        _trim_command(src, trimmed, clip), capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        if os.path.exists(trimmed):
+            os.remove(trimmed)
+        lines = proc.stderr.strip().splitlines()
+        raise RuntimeError(
+            f"ffmpeg failed with code {proc.returncode}: {lines[-1] if lines else 'no output'}"
+        )
+    os.replace(trimmed, src)
+    yield FetcherProgressReport(
+        typ="log",
+        level="info",
+        message=f"Media trimmed to {clip}",
+    )
+
+
+def _trim_command(src: str, dest: str, clip: Clip) -> list[str]:
+    """_trim_command returns the ffmpeg command to cut the media at src down to the given clip, at dest."""
+    # Seeking the input is quick, and (when re-encoding) frame accurate.
+    command = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-y",
+        "-ss",
+        str(clip.start),
+    ]
+    if clip.end is not None:
+        command += ["-to", str(clip.end)]
+    command += ["-i", src, "-map", "0"]
+    if not clip.precise:
+        # Copy the streams as they are - the cuts land on the nearest keyframes.
+        command += ["-c", "copy", "-avoid_negative_ts", "make_zero"]
+    return command + [dest]
+
+
+def place(src: str, dest_dir: str) -> Generator[FetcherUpdateEvent]:
+    """place moves the media at src into dest_dir, reporting where it ended up."""
     yield FetcherMediaAvailable(_move_file(src, dest_dir))
 
 
 def _validate_media_integrity(media: str) -> list[str]:
+    # pymediainfo is slow to import, and only needed by processes that actually fetch.
+    from pymediainfo import MediaInfo
+
     problems: list[str] = []
     media_info = MediaInfo.parse(media)
     for track in media_info.video_tracks:
@@ -1,3 +1,7 @@
+import math
+import os
+
+
 def format_duration(seconds: int) -> str:
     """format_duration nicely formats the given duration in seconds.
     :param seconds: the duration in seconds
@@ -17,3 +21,70 @@ def format_duration(seconds: int) -> str:
         parts.append(f"{seconds} second{'s' if seconds != 1 else ''}")
 
     return " ".join(parts)
+
+
+def format_timestamp(seconds: float) -> str:
+    """format_timestamp formats the given number of seconds into some media as a timestamp.
+    :param seconds: seconds from the start of the media
+    :return str: The timestamp, as H:MM:SS - with fractions of a second, if there are any.
+    """
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return (
+        f"{hours}:{minutes:02}:{seconds:02.0f}"
+        if seconds == int(seconds)
+        else f"{hours}:{minutes:02}:{seconds:06.3f}"
+    )
+
+
+def parse_timestamp(value: str | float | None) -> float | None:
+    """parse_timestamp parses a timestamp into some media - in seconds, or as [[H:]M:]S.
+    :param value: the timestamp. Blank values are taken as none at all.
+    :return float: The timestamp in seconds, or None if there isn't one.
+    :raises ValueError: If the timestamp isn't valid.
+    """
+    if value is None or isinstance(value, (int, float)):
+        seconds = value
+    elif value.strip() == "":
+        return None
+    else:
+        parts = value.strip().split(":")
+        if len(parts) > 3:
+            raise ValueError(f"{value} is not a valid timestamp")
+        seconds = 0.0
+        try:
+            for part in parts:
+                seconds = seconds * 60 + float(part)
+        except ValueError:
+            raise ValueError(f"{value} is not a valid timestamp") from None
+    if seconds is not None and not 0 <= seconds < math.inf:
+        raise ValueError(f"{value} is not a valid timestamp")
+    return seconds
+
+
+def format_bytes(num: int | float) -> str:
+    """format_bytes nicely formats the given number of bytes.
+    :param num: the number of bytes
+    :return str: The size formatted nicely, in the largest sensible binary unit.
+    """
+    num = float(num)
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if abs(num) < 1024:
+            return f"{num:.0f} {unit}" if unit == "B" else f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} TiB"
+
+
+def dir_size(directory: str) -> int:
+    """dir_size returns the total size of the files under the given directory, which may be changing as we look.
+    :param directory: the directory to measure
+    :return int: The size of its files in bytes.
+    """
+    size = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                size += os.stat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                continue
+    return size
@@ -0,0 +1,93 @@
+import statistics
+
+from slurp.models import Fetch
+
+# The queue fetches are worked from.
+FETCH_QUEUE = "fetch"
+# The queue high priority fetches are worked from, if they have a lane of their own.
+FETCH_HIGH_QUEUE = "fetch_high"
+# The queue very large fetches are worked from, if they have a lane of their own - by workers with the disk for them.
+FETCH_LARGE_QUEUE = "fetch_large"
+
+# Celery message priority of each fetch priority. With Redis, lower numbers are worked first.
+# Within each priority, smaller fetches are worked first, by adding their size rank (0-2) to this - so the broker's
+# priority_steps need to cover 0-8 (the defaults are just 0, 3, 6 and 9).
+_MESSAGE_PRIORITY = {
+    Fetch.Priority.high: 0,
+    Fetch.Priority.normal: 3,
+    Fetch.Priority.low: 6,
+}
+
+# How long fetches of each priority waited for a worker is kept in a list per priority, under this prefix...
+QUEUE_WAIT_KEY = "slurp:queue_wait"
+# ...up to this many of the most recent.
+QUEUE_WAIT_SAMPLES = 1000
+
+
+def lane(
+    priority: Fetch.Priority,
+    reserved: bool = False,
+    size_rank: int = 0,
+    large: bool = False,
+) -> dict:
+    """
+    lane returns the Celery options to queue a fetch of the given priority with.
+    :param reserved: Whether high priority fetches have a lane of their own.
+    :param size_rank: How big the fetch is compared to others of its priority, from 0 (small) to 2 (large) - smaller
+        fetches are worked first.
+    :param large: Whether the fetch is too big for any worker but those taking from the large fetch lane.
+    """
+    if large:
+        queue = FETCH_LARGE_QUEUE
+    elif reserved and priority == Fetch.Priority.high:
+        queue = FETCH_HIGH_QUEUE
+    else:
+        queue = FETCH_QUEUE
+    return {
+        "queue": queue,
+        "priority": _MESSAGE_PRIORITY[priority] + min(max(size_rank, 0), 2),
+    }
+
+
+def size_rank(estimated_bytes: int | None, small_bytes: int, large_bytes: int) -> int:
+    """
+    size_rank ranks a fetch by how big it's expected to be: 0 if it's under small_bytes, 2 if it's at least
+    large_bytes, and 1 otherwise - including if its size isn't known, so it isn't put ahead of fetches known to be small.
+    """
+    if estimated_bytes is None:
+        return 1
+    if estimated_bytes < small_bytes:
+        return 0
+    if estimated_bytes >= large_bytes:
+        return 2
+    return 1
+
+
+def record_queue_wait(redis, priority: Fetch.Priority, seconds: float):
+    """record_queue_wait records how long a fetch of the given priority waited for a worker."""
+    key = f"{QUEUE_WAIT_KEY}:{priority.value}"
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.lpush(key, round(seconds, 3))
+    pipeline.ltrim(key, 0, QUEUE_WAIT_SAMPLES - 1)
+    pipeline.execute()
+
+
+def queue_waits(redis) -> list[dict]:
+    """queue_waits summarises how long recent fetches of each priority waited for a worker, in seconds."""
+    pipeline = redis.pipeline(transaction=False)
+    for priority in Fetch.Priority:
+        pipeline.lrange(f"{QUEUE_WAIT_KEY}:{priority.value}", 0, -1)
+
+    waits = []
+    for priority, samples in zip(Fetch.Priority, pipeline.execute()):
+        samples = sorted(float(s) for s in samples)
+        summary = {"priority": priority.value, "samples": len(samples)}
+        if len(samples) > 0:
+            summary |= {
+                "mean": round(statistics.fmean(samples), 3),
+                "p50": samples[len(samples) // 2],
+                "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                "max": samples[-1],
+            }
+        waits.append(summary)
+    return waits
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from redis.exceptions import LockError, RedisError
+
+
+class Lease:
+    """
+    A Lease is a lock that lapses after ttl seconds, unless its holder keeps renewing it.
+    While it's held, a heartbeat thread renews it every third of its ttl - so it only lapses if the holder dies, or
+    loses contact with Redis for too long. Held leases are also listed in a sorted set (the registry), scored by when
+    they lapse, so that lapsed leases can be found without scanning.
+    """
+
+    def __init__(self, redis, name: str, ttl: float, registry: str):
+        """
+        :param redis: Redis connection.
+        :param name: Name of the lock key.
+        :param ttl: Seconds the lease lasts for without being renewed.
+        :param registry: Key of the sorted set to list the lease in while it's held.
+        """
+        self.redis = redis
+        self.name = name
+        self.ttl = ttl
+        self.registry = registry
+        # Set if the lease lapsed while we thought we held it. Anything done under the lease should stop.
+        self.lost = False
+
+        # The token has to be visible to the heartbeat thread, so it can't be thread-local.
+        self._lock = redis.lock(name, timeout=ttl, thread_local=False)
+        self._stop = threading.Event()
+        self._heartbeat: threading.Thread | None = None
+
+    def acquire(self, token: str | None = None) -> bool:
+        """acquire takes the lease if nobody else holds it, and starts renewing it. Returns whether it was taken."""
+        if not self._lock.acquire(blocking=False, token=token):
+            return False
+        self._register()
+        self._heartbeat = threading.Thread(
+            target=self._beat, name=f"lease-{self.name}", daemon=True
+        )
+        self._heartbeat.start()
+        return True
+
+    def release(self):
+        """release stops renewing the lease, and gives it up if we still hold it."""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        if self.lost:
+            # Someone else may well hold it by now, so leave it (and its registry entry) alone.
+            return
+        self.redis.zrem(self.registry, self.name)
+        try:
+            self._lock.release()
+        except LockError:
+            # It lapsed after the last heartbeat.
+            self.lost = True
+
+    def _register(self):
+        self.redis.zadd(self.registry, {self.name: time.time() + self.ttl})
+
+    def _beat(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self._lock.extend(self.ttl, replace_ttl=True)
+                self._register()
+            except LockError:
+                self.lost = True
+                return
+            except RedisError:
+                # Hopefully temporary - there's still time to renew before the lease lapses.
+                continue
@@ -1,91 +1,248 @@
+import json
+import time
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass
 from urllib.parse import SplitResult, parse_qs, urlsplit
 
 import httpx
 
-from .consts import api, country_codes, hostSuffixes
+from .consts import api, cache_key, country_codes, hostSuffixes, max_ids_per_request
 from .exceptions import InvalidUrlException
 
 
-class YtBlockCheck:
-    __api_key: str | None = None
+def video_id(url: str) -> str:
+    """
+    video_id returns the ID of the YouTube video at the given URL.
+    :param url: URL of the video.
+    :raises InvalidUrlException: if the URL isn't a YouTube video URL.
+    """
+    # Break the URL apart.
+    url_split: SplitResult = urlsplit(url)
+    if len([i for i in hostSuffixes if i in url_split.netloc]) == 0:
+        raise InvalidUrlException("not a YouTube URL")
 
-    def __init__(self, api_key: str) -> None:
-        self.__api_key = api_key
+    if "youtube.com" in url_split.netloc:
+        # Shorts, embeds and streams carry the ID in the path
+        parts = url_split.path.split("/")
+        if len(parts) > 2 and parts[1] in ("shorts", "embed", "live") and parts[2]:
+            return parts[2]
+        # Classic / long URL - parse the query string
+        if not url_split.path.startswith("/watch"):
+            raise InvalidUrlException("not a watch URL")
+        query = parse_qs(url_split.query)
+        if query is None or query.get("v", None) is None:
+            raise InvalidUrlException("URL does not include query string")
+        assert len(query["v"]) == 1, "multiple video query elements in URL"
+        return query["v"][0]
 
-    def check(self, url: str) -> str:
-        """
-        check performs basic checks for the availability and block status of a given YouTube video.
-        :param url: URL of the video.
-        :return: A human-readable string describing the video, its block status, etc.
-        """
-        # Break the URL apart.
-        url_split: SplitResult = urlsplit(url)
-        if len([i for i in hostSuffixes if i in url_split.netloc]) == 0:
-            raise InvalidUrlException("not a YouTube URL")
-
-        # Get the video ID out of the URL
-        video_id: str | None = None
-        if "youtube.com" in url_split.netloc:
-            # Classic / long URL - parse the query string
-            if not url_split.path.startswith("/watch"):
-                raise InvalidUrlException("not a watch URL")
-            query = parse_qs(url_split.query)
-            if query is None or query.get("v", None) is None:
-                raise InvalidUrlException("URL does not include query string")
-
-            video_id = query["v"]
-            assert video_id is not list, "multiple video query elements in URL"
-        else:
-            if url_split.path == "/":
-                raise InvalidUrlException("not a watch URL")
-            video_id = url_split.path.split("/")[1]
-
-        # Build the query
-        params = {
-            "part": "snippet,contentDetails",
-            "id": video_id,
-            "key": self.__api_key,
-        }
-        response_data = httpx.get(api, params=params).raise_for_status().json()
+    if url_split.path == "/":
+        raise InvalidUrlException("not a watch URL")
+    return url_split.path.split("/")[1]
 
-        r_page_info = response_data.get("pageInfo")
-        assert r_page_info is not None, "invalid response from YouTube API"
-        assert r_page_info.get("totalResults", None) is not None, (
-            "invalid response from YouTube API"
-        )
 
-        if r_page_info.get("totalResults") == 0:
+@dataclass()
+class VideoStatus:
+    """VideoStatus is what the YouTube API reports about a video."""
+
+    video_id: str
+    exists: bool = False
+    title: str | None = None
+    author: str | None = None
+    licensed: bool = False
+    # Privacy status (public, unlisted or private) and upload status (processed, deleted, rejected, etc.)
+    privacy: str | None = None
+    upload_status: str | None = None
+    # Countries the video is allowed in, if it's restricted.
+    allowed_countries: list[str] | None = None
+
+    @property
+    def unavailable(self) -> str | None:
+        """unavailable returns why nobody can fetch the video, if that's the case."""
+        if not self.exists:
+            return "the video does not exist, or is private"
+        if self.privacy == "private":
+            return "the video is private"
+        if self.upload_status in ("deleted", "failed", "rejected"):
+            return f"the video was {self.upload_status}"
+        return None
+
+    def describe(self) -> str:
+        """describe returns a human-readable string describing the video, its block status, etc."""
+        if not self.exists:
             return (
                 "The YouTube API reports that this video does not exist. Check the URL."
             )
 
-        assert (
-            response_data.get("items", None) is not None
-            and len(response_data.get("items")) != 0
-        ), "invalid response from YouTube API - no items"
-
-        vid_obj = response_data["items"][0]
-        vid_content_details = vid_obj.get("contentDetails", {})
-        vid_meta_obj = vid_obj["snippet"]
-        # vid_id = vid_obj["id"]
-        vid_title = vid_meta_obj["title"]
-        vid_author = vid_meta_obj["channelTitle"]
-        # vid_author_channel_id = vid_meta_obj["channelId"]
-        vid_is_licensed = vid_content_details["licensedContent"]
-        vid_restriction = vid_content_details.get("regionRestriction", None)
-        vid_is_restricted = True if vid_restriction is not None else False
-
         # Build the description string
         result = (
-            f"Video '{vid_title}' by '{vid_author}' - "
-            f"{'YouTube Partner' if vid_is_licensed else 'Not a YouTube Partner'} - "
+            f"Video '{self.title}' by '{self.author}' - "
+            f"{'YouTube Partner' if self.licensed else 'Not a YouTube Partner'} - "
         )
-        if vid_is_restricted:
+        if self.allowed_countries is not None:
             restricted_countries = [
-                i for i in country_codes if i not in vid_restriction
+                i for i in country_codes if i not in self.allowed_countries
             ]
-            result += f"Allowed countries: {','.join(vid_restriction)}"
+            result += f"Allowed countries: {','.join(self.allowed_countries)}"
             result += f"Restricted countries: {','.join(restricted_countries)}"
         else:
             result += "There are no reported country restrictions."
         return result
+
+
+class YtBlockCheck:
+    __api_key: str | None = None
+
+    def __init__(self, api_key: str) -> None:
+        self.__api_key = api_key
+
+    def check(self, url: str) -> str:
+        """
+        check performs basic checks for the availability and block status of a given YouTube video.
+        :param url: URL of the video.
+        :return: A human-readable string describing the video, its block status, etc.
+        """
+        return self.lookup(url).describe()
+
+    def lookup(self, url: str) -> VideoStatus:
+        """
+        lookup asks the YouTube API about the video at the given URL.
+        :param url: URL of the video.
+        :return: What the API reports about the video.
+        """
+        vid = video_id(url)
+        return self.lookup_many([vid])[vid]
+
+    def lookup_many(self, video_ids: Sequence[str]) -> dict[str, VideoStatus]:
+        """
+        lookup_many asks the YouTube API about each of the given videos, batching as many as it can into each request.
+        :param video_ids: IDs of the videos.
+        :return: What the API reports about each video, by ID.
+        """
+        results: dict[str, VideoStatus] = {}
+        video_ids = list(dict.fromkeys(video_ids))
+        for i in range(0, len(video_ids), max_ids_per_request):
+            batch = video_ids[i : i + max_ids_per_request]
+
+            # Build the query
+            params = {
+                "part": "snippet,contentDetails,status",
+                "id": ",".join(batch),
+                "key": self.__api_key,
+            }
+            response_data = httpx.get(api, params=params).raise_for_status().json()
+
+            r_page_info = response_data.get("pageInfo")
+            assert r_page_info is not None, "invalid response from YouTube API"
+            assert r_page_info.get("totalResults", None) is not None, (
+                "invalid response from YouTube API"
+            )
+
+            for item in response_data.get("items", []):
+                status = _video_status(item)
+                results[status.video_id] = status
+            # Videos that don't exist (or are private) are left out of the response.
+            for vid in batch:
+                results.setdefault(vid, VideoStatus(video_id=vid, exists=False))
+        return results
+
+
+class CachedYtBlockCheck:
+    """
+    CachedYtBlockCheck answers lookups from a cache in Redis where it can, so every worker shares what any of them has
+    looked up. Lookups of the same video at the same time are coalesced - one worker asks the API, and the rest wait
+    for its answer - and whatever has to be asked is asked in as few requests as possible.
+    """
+
+    # Seconds to wait for someone else's lookup before giving up and asking the API ourselves.
+    lock_timeout = 15.0
+    poll_interval = 0.1
+
+    def __init__(self, checker: YtBlockCheck, redis, ttl: int = 3600):
+        """
+        :param checker: Checker to look up videos that aren't cached with.
+        :param redis: Redis connection.
+        :param ttl: Seconds to cache what the API reports about each video for.
+        """
+        self.checker = checker
+        self.redis = redis
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(vid: str) -> str:
+        return f"{cache_key}:{vid}"
+
+    def check(self, url: str) -> str:
+        """check is YtBlockCheck.check, from the cache where possible."""
+        return self.lookup(url).describe()
+
+    def lookup(self, url: str) -> VideoStatus:
+        """lookup is YtBlockCheck.lookup, from the cache where possible."""
+        vid = video_id(url)
+        return self.lookup_many([vid])[vid]
+
+    def lookup_many(self, video_ids: Sequence[str]) -> dict[str, VideoStatus]:
+        """lookup_many is YtBlockCheck.lookup_many, from the cache where possible."""
+        video_ids = list(dict.fromkeys(video_ids))
+        results = self._cached(video_ids)
+        deadline = time.monotonic() + self.lock_timeout
+        while len(missing := [v for v in video_ids if v not in results]) > 0:
+            # Claim whichever of the missing videos nobody else is looking up already.
+            pipeline = self.redis.pipeline(transaction=False)
+            for vid in missing:
+                pipeline.set(
+                    f"{self._key(vid)}:lock", 1, nx=True, ex=int(self.lock_timeout)
+                )
+            claimed = [vid for vid, ok in zip(missing, pipeline.execute()) if ok]
+            if time.monotonic() > deadline:
+                # Whoever claimed the rest is taking too long - ask for them anyway.
+                claimed = missing
+
+            if len(claimed) > 0:
+                try:
+                    fetched = self.checker.lookup_many(claimed)
+                    pipeline = self.redis.pipeline(transaction=False)
+                    for vid, status in fetched.items():
+                        pipeline.set(
+                            self._key(vid), json.dumps(asdict(status)), ex=self.ttl
+                        )
+                    pipeline.execute()
+                    results |= fetched
+                finally:
+                    self.redis.delete(*[f"{self._key(vid)}:lock" for vid in claimed])
+            else:
+                time.sleep(self.poll_interval)
+                results |= self._cached(missing)
+        return results
+
+    def _cached(self, video_ids: list[str]) -> dict[str, VideoStatus]:
+        """_cached returns whatever is cached for the given videos."""
+        if len(video_ids) == 0:
+            return {}
+        return {
+            vid: VideoStatus(**json.loads(value))
+            for vid, value in zip(
+                video_ids, self.redis.mget([self._key(v) for v in video_ids])
+            )
+            if value is not None
+        }
+
+
+def _video_status(vid_obj: dict) -> VideoStatus:
+    """_video_status builds a VideoStatus from an item of a videos.list response."""
+    vid_content_details = vid_obj.get("contentDetails", {})
+    vid_meta_obj = vid_obj["snippet"]
+    vid_status = vid_obj.get("status", {})
+    # vid_author_channel_id = vid_meta_obj["channelId"]
+    vid_restriction = vid_content_details.get("regionRestriction", None)
+    return VideoStatus(
+        video_id=vid_obj["id"],
+        exists=True,
+        title=vid_meta_obj["title"],
+        author=vid_meta_obj["channelTitle"],
+        licensed=vid_content_details["licensedContent"],
+        privacy=vid_status.get("privacyStatus"),
+        upload_status=vid_status.get("uploadStatus"),
+        allowed_countries=(
+            vid_restriction.get("allowed") if vid_restriction is not None else None
+        ),
+    )
@@ -1,4 +1,8 @@
 api = "https://www.googleapis.com/youtube/v3/videos?"
+# videos.list takes at most this many IDs per request.
+max_ids_per_request = 50
+# CachedYtBlockCheck keeps what the API reports about each video under this prefix in Redis.
+cache_key = "slurp:ytcheck"
 
 hostSuffixes = [
     "youtube.com",
@@ -0,0 +1,53 @@
+import threading
+
+import fakeredis
+
+from slurp.lib.yt_block_check import CachedYtBlockCheck, VideoStatus
+
+
+class _Checker:
+    """_Checker stands in for YtBlockCheck, counting the lookups it's asked to make."""
+
+    def __init__(self, delay: float = 0):
+        self.calls: list[list[str]] = []
+        self.delay = delay
+
+    def lookup_many(self, video_ids):
+        self.calls.append(list(video_ids))
+        threading.Event().wait(self.delay)
+        return {v: VideoStatus(video_id=v, exists=v != "gone") for v in video_ids}
+
+
+def test_lookups_are_cached():
+    redis = fakeredis.FakeRedis()
+    checker = _Checker()
+    cached = CachedYtBlockCheck(checker, redis)
+    assert cached.lookup("https://youtu.be/abc").exists
+    assert not cached.lookup_many(["abc", "gone"])["gone"].exists
+    assert (
+        CachedYtBlockCheck(checker, redis).lookup("https://youtu.be/gone").exists
+        is False
+    )
+    assert checker.calls == [["abc"], ["gone"]], (
+        "only what's not cached should be asked"
+    )
+
+
+def test_concurrent_lookups_are_coalesced():
+    redis = fakeredis.FakeRedis()
+    checker = _Checker(delay=0.3)
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                CachedYtBlockCheck(checker, redis).lookup("https://youtu.be/abc")
+            )
+        )
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 5 and all(r.exists for r in results)
+    assert checker.calls == [["abc"]]
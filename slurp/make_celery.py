@@ -1,4 +1,4 @@
 from . import create_app
 
-flask_app = create_app()
+flask_app = create_app(web=False)
 celery = flask_app.extensions["celery"]
@@ -1,3 +1,3 @@
-__all__ = ["Fetch", "FetchMetadata"]
+__all__ = ["Fetch", "FetchMetadata", "FetchStage"]
 
-from slurp.models.task import Fetch, FetchMetadata
+from slurp.models.task import Fetch, FetchMetadata, FetchStage
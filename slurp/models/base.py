@@ -1,8 +1,12 @@
 from datetime import UTC, datetime
 
+from redis.client import Pipeline
 from redis_om import Field, JsonModel
+from redis_om.model.encoders import jsonable_encoder
+from redis_om.model.model import convert_datetime_to_timestamp
 
 from slurp import db
+from slurp.exceptions import VersionConflictError
 
 
 class BaseModel(JsonModel):
@@ -16,9 +20,63 @@ class BaseModel(JsonModel):
     )
     ts_updated: datetime = Field(sortable=True, default=datetime.now(UTC))
 
+    # Incremented every time the model is written, so that concurrent writers can spot each other. See save_fields.
+    version: int = 0
+
     def save(self, **kwargs):
         self.ts_updated = datetime.now(UTC)
+        self.version += 1
         super().save(**kwargs)
 
+    def save_fields(
+        self,
+        *fields: str,
+        pipeline: Pipeline | None = None,
+        check_version: bool = False,
+    ):
+        """
+        save_fields writes only the given fields to the database, rather than rewriting the whole document.
+        The fields are written with a single JSON.MSET, along with ts_updated and version.
+        :param fields: Names of the (top-level) fields to write.
+        :param pipeline: If given, the write is queued on this pipeline rather than being made immediately.
+        :param check_version: Only write if nothing else has written the document since this copy was loaded or saved.
+            Raises VersionConflictError otherwise. Can't be used with a pipeline.
+        """
+        assert not (check_version and pipeline is not None), (
+            "check_version can't be used with a pipeline"
+        )
+        expected = self.version
+        self.ts_updated = datetime.now(UTC)
+        self.version += 1
+
+        # Encode the fields the same way redis-om does when saving the whole document.
+        data = jsonable_encoder(
+            convert_datetime_to_timestamp(
+                self.model_dump(include={*fields, "ts_updated", "version"})
+            )
+        )
+        key = self.key()
+        triplets = [(key, f"$.{field}", value) for field, value in data.items()]
+
+        if not check_version:
+            (pipeline if pipeline is not None else self.db()).json().mset(triplets)
+            return
+
+        def _write(pipe: Pipeline):
+            current = pipe.json().get(key, "$.version")
+            # Documents written before versioning was introduced don't have a version yet.
+            if (current[0] if current else 0) != expected:
+                raise VersionConflictError(
+                    f"{key} has been modified since it was read (expected version {expected}, found {current})"
+                )
+            pipe.multi()
+            pipe.json().mset(triplets)
+
+        try:
+            self.db().transaction(_write, key)
+        except VersionConflictError:
+            self.version = expected
+            raise
+
     class Meta:
         database = db.redis
@@ -1,12 +1,29 @@
 import datetime
 import enum
+import itertools
+import time
 
-from flask_sse import sse
-from redis_om import Field
+from flask import current_app
+from redis.client import Pipeline
+from redis_om import EmbeddedJsonModel, Field
 
-from slurp.fetchers.types import Format
+from slurp import db
+from slurp.fetchers.types import Clip, Format, MediaMetadata
+from slurp.lease import Lease
 from slurp.models.base import BaseModel
 
+# Sorted set of fetch IDs whose output is due to be pruned, scored by when it's due.
+PRUNE_SCHEDULE_KEY = "slurp:prune_schedule"
+# Sorted set of fetch IDs whose events are due to have expired, scored by when they're due - so they can be marked purged.
+PURGE_SCHEDULE_KEY = "slurp:purge_schedule"
+# Sorted set of fetch IDs currently leased by a worker, scored by when the lease lapses.
+LEASES_KEY = "slurp:leases"
+
+
+def _config_seconds(key: str) -> int:
+    """_config_seconds returns the given configuration value, which is in hours, in seconds."""
+    return int(current_app.config.get(key, 0) * 3600)
+
 
 class FetchMetadata(BaseModel):
     name: str | None = None
@@ -24,12 +41,61 @@ class FetchMetadata(BaseModel):
     class Meta:
         embedded = True
 
+    @classmethod
+    def from_media(cls, metadata: MediaMetadata) -> "FetchMetadata":
+        """from_media returns the FetchMetadata to store for the MediaMetadata a fetcher found."""
+        return cls(
+            name=metadata.name,
+            author=metadata.author,
+            author_url=metadata.author_url,
+            ts_upload=metadata.ts_upload,
+            duration=metadata.duration,
+            format=metadata.format,
+            thumbnail_url=metadata.thumbnail_url,
+        )
+
+
+class FetchStage(EmbeddedJsonModel):
+    """
+    A FetchStage records the timing of one stage of a fetch (queueing, a fetcher attempt, finalising, etc.)
+    Unlike FetchMetadata, this deliberately doesn't carry the BaseModel timestamps, as a fetch collects quite a few.
+    """
+
+    # Stage name - one of queued, lock, attempt, metadata, download, handoff, trim, validate or finalise.
+    name: str
+
+    # The fetcher that was running during this stage, if any.
+    fetcher: str | None = None
+
+    ts_start: datetime.datetime
+
+    # Duration of the stage in seconds.
+    duration: float = 0
+
+    # Status reported at the end of the stage, if any (0 is success).
+    status: int | None = None
+
+    class Meta:
+        database = db.redis
+        embedded = True
+
 
 class Fetch(BaseModel, index=True):
     url: str = Field(index=True)
     slug: str = Field(index=True)
     target: str | None = None
     format: Format = Format.VIDEO_AUDIO
+    # Urgent fetches race a second fetcher against the first if it's slow to start delivering media.
+    urgent: bool = False
+
+    # If either is set, only part of the media is fetched - from clip_start seconds in (or the start), to clip_end
+    # seconds in (or the end).
+    clip_start: float | None = None
+    clip_end: float | None = None
+    # Cut the clip exactly where it was asked for, rather than at the nearest keyframes.
+    clip_precise: bool = False
+    # Whether the downloaded media has been cut down to the clip yet - by the fetcher, or after.
+    clipped: bool = False
 
     class TaskStatus(str, enum.Enum):
         # "created" tasks are awaiting processing or assignment to a worker.
@@ -40,6 +106,8 @@ class Fetch(BaseModel, index=True):
         success = "success"
         # "Failed" tasks failed to process for some reason.
         failed = "failed"
+        # "Cancelled" tasks were stopped on request, before or while they were fetched.
+        cancelled = "cancelled"
         # "Completed" tasks is one where it finished executing, but we don't know the outcome for some reason.
         completed = "completed"
         # "Unknown" tasks are ones where the execution state is a mystery to us.
@@ -47,6 +115,18 @@ class Fetch(BaseModel, index=True):
 
     status: TaskStatus = TaskStatus.unknown
 
+    class Priority(str, enum.Enum):
+        # "high" fetches jump the queue - and can be given workers of their own (see FETCH_RESERVED_LANE).
+        high = "high"
+        normal = "normal"
+        # "low" fetches wait until there's nothing else to do.
+        low = "low"
+
+    priority: Priority = Priority.normal
+
+    # Who submitted the fetch, if they said. Fetches are shared out between each submitter to each target.
+    submitter: str | None = None
+
     meta: FetchMetadata | None = None
 
     # The ID of the celery task.
@@ -62,10 +142,108 @@ class Fetch(BaseModel, index=True):
     # Whether this fetch has had its logs and events destroyed.
     purged: bool = Field(index=True, default=False)
 
-    def lock(self, *args, **kwargs):
-        return self.db().lock(name=self.pk, *args, **kwargs)
+    # Timing breakdown of the most recent run of this fetch, in the order the stages finished.
+    stages: list[FetchStage] = []
+
+    # Size of the fetched media in bytes, and the rate it was downloaded at in bytes/s.
+    # Only set once a fetcher has successfully produced media.
+    media_bytes: int | None = None
+    throughput: float | None = None
+
+    # How big the media is expected to be in bytes, and how long it's expected to take to download in seconds.
+    # Only set if the fetch was sized up before it was queued (see FETCH_PREFLIGHT).
+    estimated_bytes: int | None = None
+    estimated_seconds: float | None = None
 
-    def emit_event(self, typ: str, level: str, message: str, status: int = 0):
+    @property
+    def clip(self) -> Clip | None:
+        """clip is the part of the media to fetch, or None for the whole thing."""
+        if self.clip_start is None and self.clip_end is None:
+            return None
+        return Clip(self.clip_start or 0, self.clip_end, self.clip_precise)
+
+    def record_stage(
+        self,
+        name: str,
+        ts_start: datetime.datetime,
+        fetcher: str | None = None,
+        status: int | None = None,
+    ) -> FetchStage:
+        """
+        record_stage appends a stage to this fetch's timing breakdown, which ran from ts_start until now.
+        It is not persisted until the fetch is next saved.
+        :return: The recorded stage.
+        """
+        if ts_start.tzinfo is None:
+            # Naive timestamps are local time (ts_created is, until the model has been round-tripped through Redis)
+            ts_start = ts_start.astimezone(datetime.UTC)
+        stage = FetchStage(
+            name=name,
+            fetcher=fetcher,
+            ts_start=ts_start,
+            duration=round(
+                (datetime.datetime.now(datetime.UTC) - ts_start).total_seconds(), 3
+            ),
+            status=status,
+        )
+        self.stages.append(stage)
+        return stage
+
+    def save(self, **kwargs):
+        super().save(**kwargs)
+        self._expire_if_finished(kwargs.get("pipeline"))
+
+    def save_fields(self, *fields: str, pipeline: Pipeline | None = None, **kwargs):
+        super().save_fields(*fields, pipeline=pipeline, **kwargs)
+        self._expire_if_finished(pipeline)
+
+    def _expire_if_finished(self, pipeline: Pipeline | None = None):
+        """_expire_if_finished (re)sets the expiry of this fetch, and schedules it to be marked purged, if it has finished."""
+        if self.status not in (
+            Fetch.TaskStatus.success,
+            Fetch.TaskStatus.failed,
+            Fetch.TaskStatus.cancelled,
+            Fetch.TaskStatus.completed,
+        ):
+            return
+        db = pipeline if pipeline is not None else self.db()
+        if self.status == Fetch.TaskStatus.success and not self.pruned:
+            # Successful fetches are kept until their output is pruned, as the prune needs the record.
+            # Pruning writes the fetch again, which is what starts it expiring.
+            db.persist(self.key())
+        else:
+            # Other finished fetches are kept for EXPIRE_AFTER hours after they were last written, and then dropped.
+            expire_after = _config_seconds("EXPIRE_AFTER")
+            if expire_after > 0:
+                self.expire(expire_after, pipeline=pipeline)
+        purge_after = _config_seconds("PURGE_AFTER")
+        if purge_after > 0 and not self.purged:
+            # Its events expire by themselves PURGE_AFTER hours after they're written - by then, it's been purged.
+            db.zadd(PURGE_SCHEDULE_KEY, {self.pk: time.time() + purge_after})
+
+    def schedule_prune(self, pipeline: Pipeline | None = None):
+        """schedule_prune schedules the output of this fetch to be removed PRUNE_AFTER hours from now."""
+        (pipeline if pipeline is not None else self.db()).zadd(
+            PRUNE_SCHEDULE_KEY,
+            {self.pk: time.time() + _config_seconds("PRUNE_AFTER")},
+        )
+
+    def lease(self, ttl: float) -> Lease:
+        """lease returns a Lease on this fetch, which whoever is working it must hold."""
+        return Lease(self.db(), self.pk, ttl, LEASES_KEY)
+
+    def emit_event(
+        self,
+        typ: str,
+        level: str,
+        message: str,
+        status: int = 0,
+        pipeline: Pipeline | None = None,
+    ):
+        """
+        emit_event logs an event against this fetch, and publishes it to anyone listening.
+        :param pipeline: If given, the event is queued on this pipeline rather than being written immediately.
+        """
         db_log = FetchEvent(
             fetch_id=self.pk,
             typ=typ,
@@ -73,8 +251,14 @@ class Fetch(BaseModel, index=True):
             message=message,
             status=status,
         )
-        db_log.save()
-        sse.publish(db_log.model_dump_json())
+        # Writing the event, setting its expiry and publishing it is one round trip.
+        own_pipeline = pipeline is None
+        if own_pipeline:
+            pipeline = self.db().pipeline(transaction=False)
+        db_log.save(pipeline=pipeline)
+        db.publish(db_log.model_dump_json(), pipeline=pipeline)
+        if own_pipeline:
+            pipeline.execute()
 
 
 class FetchEvent(BaseModel, index=True):
@@ -83,3 +267,89 @@ class FetchEvent(BaseModel, index=True):
     level: str
     message: str
     status: int = 0
+
+    def save(self, **kwargs):
+        super().save(**kwargs)
+        # Events are never updated once written, so they expire PURGE_AFTER hours from now.
+        purge_after = _config_seconds("PURGE_AFTER")
+        if purge_after > 0:
+            self.expire(purge_after, pipeline=kwargs.get("pipeline"))
+
+
+def backfill_expiry(batch_size: int = 1000) -> tuple[int, int]:
+    """
+    backfill_expiry gives fetches and events written before they expired by themselves the expiry, and the prune and
+    purge schedule entries, they would have been given when they were written (see Fetch._expire_if_finished).
+    Anything that already has an expiry or a schedule entry is left alone, so it's safe to run more than once.
+    :param batch_size: How many records to read and update per round trip.
+    :return: How many fetches and events were updated.
+    """
+    now = time.time()
+    redis = Fetch.db()
+    expire_after = _config_seconds("EXPIRE_AFTER")
+    prune_after = _config_seconds("PRUNE_AFTER")
+    purge_after = _config_seconds("PURGE_AFTER")
+    finished = {
+        Fetch.TaskStatus.success.value,
+        Fetch.TaskStatus.failed.value,
+        Fetch.TaskStatus.cancelled.value,
+        Fetch.TaskStatus.completed.value,
+    }
+
+    def _expire(pipeline: Pipeline, key: str, due: float):
+        # Anything that's overdue goes now, more or less.
+        pipeline.expire(key, max(int(due - now), 1))
+
+    def _keys(model):
+        # Not all_pks - that filters on the key type, which not everything that speaks Redis supports.
+        prefix = model.make_primary_key("")
+        return itertools.batched(
+            (key.decode() for key in redis.scan_iter(f"{prefix}*", count=batch_size)),
+            batch_size,
+        )
+
+    fetches = 0
+    prefix = Fetch.make_primary_key("")
+    for keys in _keys(Fetch):
+        pipeline = redis.pipeline(transaction=False)
+        for key in keys:
+            pipeline.json().get(key, "$.status", "$.pruned", "$.purged", "$.ts_updated")
+            pipeline.ttl(key)
+        results = pipeline.execute()
+
+        pipeline = redis.pipeline(transaction=False)
+        for key, fields, ttl in zip(keys, results[::2], results[1::2]):
+            fields = {path: (v[0] if v else None) for path, v in (fields or {}).items()}
+            if fields.get("$.status") not in finished:
+                continue
+            pk = key.removeprefix(prefix)
+            written = fields.get("$.ts_updated") or now
+            if fields["$.status"] == Fetch.TaskStatus.success.value and not fields.get(
+                "$.pruned"
+            ):
+                pipeline.zadd(PRUNE_SCHEDULE_KEY, {pk: written + prune_after}, nx=True)
+            elif expire_after > 0 and ttl == -1:
+                _expire(pipeline, key, written + expire_after)
+            if purge_after > 0 and not fields.get("$.purged"):
+                pipeline.zadd(PURGE_SCHEDULE_KEY, {pk: written + purge_after}, nx=True)
+            fetches += 1
+        pipeline.execute()
+
+    events = 0
+    if purge_after > 0:
+        for keys in _keys(FetchEvent):
+            pipeline = redis.pipeline(transaction=False)
+            for key in keys:
+                pipeline.json().get(key, "$.ts_created")
+                pipeline.ttl(key)
+            results = pipeline.execute()
+
+            pipeline = redis.pipeline(transaction=False)
+            for key, created, ttl in zip(keys, results[::2], results[1::2]):
+                if ttl == -1:
+                    _expire(
+                        pipeline, key, (created[0] if created else now) + purge_after
+                    )
+                    events += 1
+            pipeline.execute()
+    return fetches, events
@@ -0,0 +1,37 @@
+import fakeredis
+import pytest
+
+from slurp import db
+from slurp.exceptions import VersionConflictError
+from slurp.models import Fetch
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    monkeypatch.setattr(db.redis, "_redis_client", fakeredis.FakeRedis())
+
+
+def test_save_fields_writes_only_given_fields():
+    fetch = Fetch(url="https://example.com/", slug="test")
+    fetch.save()
+
+    fetch.status = Fetch.TaskStatus.running
+    fetch.slug = "changed"
+    fetch.save_fields("status")
+
+    stored = Fetch.get(fetch.pk)
+    assert stored.status == Fetch.TaskStatus.running
+    assert stored.slug == "test", "fields not given to save_fields should be left alone"
+    assert stored.version == fetch.version == 2
+
+
+def test_save_fields_detects_conflicts():
+    fetch = Fetch(url="https://example.com/", slug="test")
+    fetch.save()
+    other = Fetch.get(fetch.pk)
+    other.save_fields("slug", check_version=True)
+
+    fetch.status = Fetch.TaskStatus.running
+    with pytest.raises(VersionConflictError):
+        fetch.save_fields("status", check_version=True)
+    assert fetch.version == 1, "a failed save shouldn't bump the version"
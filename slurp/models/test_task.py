@@ -0,0 +1,76 @@
+import time
+
+import fakeredis
+import flask
+import pytest
+
+from slurp import db
+from slurp.models import Fetch
+from slurp.models.task import (
+    PRUNE_SCHEDULE_KEY,
+    PURGE_SCHEDULE_KEY,
+    FetchEvent,
+    backfill_expiry,
+)
+
+
+@pytest.fixture(autouse=True)
+def redis(monkeypatch):
+    redis = fakeredis.FakeRedis()
+    monkeypatch.setattr(db.redis, "_redis_client", redis)
+    app = flask.Flask(__name__)
+    app.config.update(PURGE_AFTER=24, PRUNE_AFTER=168, EXPIRE_AFTER=1)
+    with app.app_context():
+        yield redis
+
+
+def test_expiry(redis):
+    failed = Fetch(url="https://example.com/", slug="failed")
+    failed.status = Fetch.TaskStatus.failed
+    failed.save()
+    assert 0 < redis.ttl(failed.key()) <= 3600
+    assert redis.zscore(PURGE_SCHEDULE_KEY, failed.pk) is not None
+
+    success = Fetch(url="https://example.com/", slug="success")
+    success.status = Fetch.TaskStatus.success
+    success.save()
+    assert redis.ttl(success.key()) == -1, (
+        "it's kept until it's pruned, however long that takes"
+    )
+
+    success.pruned = True
+    success.save_fields("pruned")
+    assert 0 < redis.ttl(success.key()) <= 3600
+
+    success.purged = True
+    redis.delete(PURGE_SCHEDULE_KEY)
+    success.save_fields("purged")
+    assert redis.zscore(PURGE_SCHEDULE_KEY, success.pk) is None
+
+
+def test_backfill_expiry(redis):
+    fetches = {}
+    for status in ("success", "failed", "running"):
+        fetch = Fetch(url="https://example.com/", slug=status)
+        fetch.status = Fetch.TaskStatus(status)
+        fetch.save()
+        fetches[status] = fetch
+    event = FetchEvent(
+        fetch_id=fetches["failed"].pk, typ="log", level="info", message=""
+    )
+    event.save()
+    # As they would have been written before they expired by themselves.
+    redis.persist(event.key())
+    redis.persist(fetches["failed"].key())
+    redis.delete(PRUNE_SCHEDULE_KEY, PURGE_SCHEDULE_KEY)
+
+    assert backfill_expiry(batch_size=2) == (2, 1)
+    assert redis.zscore(PRUNE_SCHEDULE_KEY, fetches["success"].pk) == pytest.approx(
+        time.time() + 168 * 3600, abs=60
+    )
+    assert redis.ttl(fetches["success"].key()) == -1
+    assert 0 < redis.ttl(fetches["failed"].key()) <= 3600
+    assert redis.zscore(PURGE_SCHEDULE_KEY, fetches["failed"].pk) is not None
+    assert redis.ttl(fetches["running"].key()) == -1
+    assert redis.zscore(PURGE_SCHEDULE_KEY, fetches["running"].pk) is None
+    assert 23 * 3600 < redis.ttl(event.key()) <= 24 * 3600
@@ -0,0 +1,59 @@
+import time
+
+from celery import Task
+
+from slurp.models import Fetch
+
+
+class ProgressReporter:
+    """
+    ProgressReporter is the one channel a running fetch reports its progress through.
+    Every event is logged against the fetch (which also publishes it over SSE). Celery's task state only carries a
+    compact summary of where the fetch is up to, which is coalesced and written at most once every interval seconds.
+    The state is that of the Celery task working the current stage - each stage is a task of its own if the fetch is
+    worked in stages (see FETCH_PIPELINE_STAGES).
+    """
+
+    def __init__(
+        self,
+        celery_task: Task,
+        fetch: Fetch,
+        interval: float,
+        task_id: str | None = None,
+    ):
+        """
+        :param celery_task: The Celery task working the fetch (or the current stage of it).
+        :param fetch: The fetch being worked.
+        :param interval: Minimum number of seconds between writes of the task state.
+        :param task_id: ID of the task state to write. Defaults to the request celery_task is currently running.
+        """
+        self.celery_task = celery_task
+        self.fetch = fetch
+        self.interval = interval
+        self.task_id = task_id if task_id is not None else celery_task.request.id
+
+        self.summary: dict = {"stage": None, "fetcher": None, "events": 0}
+        self._ts_flushed = 0.0
+
+    def stage(self, stage: str, fetcher: str | None = None):
+        """stage records that the fetch has moved on to the given stage. Stage changes are written straight away."""
+        self.summary |= {"stage": stage, "fetcher": fetcher}
+        self.flush()
+
+    def event(self, typ: str, level: str, message: str, status: int = 0):
+        """event logs an event against the fetch, and notes it in the task state summary."""
+        self.fetch.emit_event(typ, level, message, status)
+        self.update(events=self.summary["events"] + 1, message=message[:200])
+
+    def update(self, **summary):
+        """update adds the given fields to the task state summary, writing it if it's due."""
+        self.summary |= summary
+        if time.monotonic() - self._ts_flushed >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """flush writes the task state summary now. Call it once the stage is over, so nothing coalesced is left out."""
+        self.celery_task.update_state(
+            task_id=self.task_id, state="PROGRESS", meta=self.summary
+        )
+        self._ts_flushed = time.monotonic()
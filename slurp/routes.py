@@ -7,7 +7,7 @@ from flask import (
 )
 from flask_wtf import FlaskForm
 from redis_om import model
-from wtforms import SelectField, StringField, URLField
+from wtforms import BooleanField, SelectField, StringField, URLField
 from wtforms.validators import URL, AnyOf, DataRequired
 
 from slurp.fetchers.types import (
@@ -25,6 +25,17 @@ class DownloadForm(FlaskForm):
         validators=[DataRequired(), AnyOf([v.name for v in Format])],
     )
     target = SelectField("target", validators=[DataRequired()])
+    urgent = BooleanField("urgent")
+    force = BooleanField("force")
+    priority = SelectField(
+        "priority",
+        choices=[(p.value, p.value.capitalize()) for p in Fetch.Priority],
+        default=Fetch.Priority.normal.value,
+    )
+    # Only fetch part of the media - see CreateTaskSchema.
+    start = StringField("start")
+    end = StringField("end")
+    precise_cut = BooleanField("precise_cut")
 
 
 main_blueprint = Blueprint("main", __name__, template_folder="templates")
@@ -1,28 +1,65 @@
 import datetime
+import os
 import pathlib
-import tempfile
+import queue
+import shutil
+import threading
+import time
 
 from celery import Celery, Task, shared_task
 from celery.exceptions import InvalidTaskError
 from celery.schedules import crontab
+from celery.utils import uuid
 from flask import current_app
-from flask_sse import sse
+from redis.exceptions import RedisError
+from redis_om import NotFoundError
 from werkzeug.exceptions import BadRequest
 
+from slurp import db
+from slurp.cancellation import CancelWatcher
+from slurp.diskspace import (
+    HANDOFF_HOLD,
+    SCRATCH_PREFIX,
+    Reservation,
+    disk_ledger,
+    fetch_volumes,
+    place_scratch,
+    scratch_volumes,
+)
 from slurp.exceptions import FinaliserError
+from slurp.failures import FailureClass, FailureDiagnosis, NegativeCache
+from slurp.fairshare import FairQueue, fair_queue, tenant_of
 from slurp.fetchers.exceptions import (
+    FetchCancelledError,
+    FetchDeferredError,
     FetchersExhaustedError,
+    FetchLeaseLostError,
     FetchLockedError,
     NoFetchersAvailable,
 )
 from slurp.fetchers.types import (
+    Fetcher,
     FetcherMediaAvailable,
     FetcherMediaMetadataAvailable,
     FetcherProgressReport,
+    FetcherUpdateEvent,
+    MediaMetadata,
+)
+from slurp.fetchers import fetcher_manager
+from slurp.fetchers.limits import Limiter, Slot
+from slurp.fetchers.scoreboard import domain_of
+from slurp.finaliser import place, trim, troubleshooter, validate
+from slurp.helpers import dir_size
+from slurp.lanes import lane, record_queue_wait, size_rank
+from slurp.models import Fetch, FetchMetadata, FetchStage
+from slurp.lease import Lease
+from slurp.models.task import (
+    LEASES_KEY,
+    PRUNE_SCHEDULE_KEY,
+    PURGE_SCHEDULE_KEY,
+    FetchEvent,
 )
-from slurp.finaliser import finalise, troubleshooter
-from slurp.models import Fetch, FetchMetadata
-from slurp.models.task import FetchEvent
+from slurp.progress import ProgressReporter
 
 
 @shared_task(
@@ -31,7 +68,20 @@ from slurp.models.task import FetchEvent
     dont_autoretry_for=(BadRequest,),
     ignore_result=False,
 )
-def create_fetch(self: Task, url: str, fmt: str, target: str, slug: str) -> str:
+def create_fetch(
+    self: Task,
+    url: str,
+    fmt: str,
+    target: str,
+    slug: str,
+    urgent: bool = False,
+    force: bool = False,
+    priority: str = Fetch.Priority.normal.value,
+    submitter: str | None = None,
+    clip_start: float | None = None,
+    clip_end: float | None = None,
+    clip_precise: bool = False,
+) -> str:
     """
     Create and enqueue the given media for fetching.
     :param self: Celery task object.
@@ -39,6 +89,13 @@ def create_fetch(self: Task, url: str, fmt: str, target: str, slug: str) -> str:
     :param fmt: Format to perform the download in as defined by fetchers.types.Format.
     :param target: Target output directory. Must be configured.
     :param slug: Output filename.
+    :param urgent: Race a second fetcher against the first if it's slow to start delivering media.
+    :param force: Fetch the media even if it's been found to be unavailable recently.
+    :param priority: Priority of the fetch, as defined by models.Fetch.Priority.
+    :param submitter: Who submitted the fetch - fetches are shared out between each submitter to each target.
+    :param clip_start: Seconds into the media to fetch from, if only part of it is wanted.
+    :param clip_end: Seconds into the media to fetch to, if only part of it is wanted.
+    :param clip_precise: Cut the clip exactly where it was asked for, rather than at the nearest keyframes.
     :return: Fetch PK.
     """
     # Safety: Validate the destination is permitted
@@ -52,13 +109,31 @@ def create_fetch(self: Task, url: str, fmt: str, target: str, slug: str) -> str:
         format=fmt,
         target=target,
         slug=slug,
+        urgent=urgent,
+        priority=Fetch.Priority(priority),
+        submitter=submitter,
+        clip_start=clip_start,
+        clip_end=clip_end,
+        clip_precise=clip_precise,
     )
     task.status = Fetch.TaskStatus.created
-    task.worker_id = self.request.id
+
+    # Don't bother trying media we already know can't be fetched - unless we've been told to.
+    negative_cache = _negative_cache()
+    cached_failure = None
+    if negative_cache is not None:
+        if force:
+            negative_cache.clear(url)
+        else:
+            cached_failure = negative_cache.get(url)
+    if cached_failure is not None:
+        task.status = Fetch.TaskStatus.failed
+    # The fetch is worked under an ID chosen up front, so it can be revoked if it's cancelled before it starts.
+    task.worker_id = uuid()
     task.save()
     assert task.pk is not None, "task pk was not set by flush"
 
-    sse.publish(
+    db.publish(
         {
             "task_id": task.pk,
             "url": task.url,
@@ -69,13 +144,172 @@ def create_fetch(self: Task, url: str, fmt: str, target: str, slug: str) -> str:
         type="task_created",
     )
 
-    # Enqueue.
-    fetch.delay(
-        pk=task.pk,
-    )
+    if cached_failure is not None:
+        message = f"Fetch failed: this media was found to be unavailable at {cached_failure.ts:%Y-%m-%d %H:%M} UTC - {cached_failure.reason}. Retry with force to try again anyway."
+        db.publish(
+            {
+                "fetch_id": task.pk,
+                "state": Fetch.TaskStatus.failed.value,
+                "message": message,
+            },
+            type="fetch_updated",
+        )
+        task.emit_event("log", "error", message)
+        return task.pk
+
+    # Enqueue - sizing it up first, if we've been asked to.
+    if current_app.config.get("FETCH_PREFLIGHT"):
+        preflight.apply_async(kwargs={"pk": task.pk})
+    else:
+        _enqueue(task)
     return task.pk
 
 
+def _enqueue(task: Fetch):
+    """
+    _enqueue queues the given fetch to be worked, in the lane for its priority - and, if fetches are being sized up
+    before they're queued, for its size.
+    """
+    config = current_app.config
+    rank = 0
+    if config.get("FETCH_PREFLIGHT") and config.get("FETCH_SHORTEST_FIRST"):
+        rank = size_rank(
+            task.estimated_bytes,
+            config.get("FETCH_SMALL_JOB_BYTES"),
+            config.get("FETCH_LARGE_JOB_BYTES"),
+        )
+    large = (
+        config.get("FETCH_LARGE_LANE")
+        and task.estimated_bytes is not None
+        and task.estimated_bytes >= config.get("FETCH_LARGE_JOB_BYTES")
+    )
+    options = lane(task.priority, config.get("FETCH_RESERVED_LANE"), rank, large)
+    options["task_id"] = task.worker_id
+
+    fair = fair_queue(db.redis, config)
+    if fair is None:
+        fetch.apply_async(kwargs={"pk": task.pk}, **options)
+        return
+    # Hold it back until it's its tenant's turn - unless it's high priority, in which case it jumps the queue.
+    if fair.push(
+        task.pk,
+        tenant_of(task.target, task.submitter),
+        options,
+        options["priority"],
+        now=task.priority == Fetch.Priority.high,
+    ):
+        fetch.apply_async(kwargs={"pk": task.pk}, **options)
+    _dispatch(fair)
+
+
+def _dispatch(fair: FairQueue):
+    """_dispatch hands the workers as many fetches as they have free slots for, tenant by tenant."""
+    for pk, options in fair.dispatch():
+        fetch.apply_async(kwargs={"pk": pk}, **options)
+
+
+def _finished(task: Fetch):
+    """_finished frees the slot the given fetch was using, if fetches are being shared out, and fills it."""
+    fair = fair_queue(db.redis, current_app.config)
+    if fair is not None:
+        fair.done(task.pk)
+        _dispatch(fair)
+
+
+@shared_task(name="slurp.preflight", bind=True)
+def preflight(self: Task, pk: str):
+    """
+    Size up the given fetch from its metadata, then queue it to be worked accordingly.
+    It is not intended to call this task directly - it is automatically enqueued by create_fetch.
+    :param self: Celery task object.
+    :param pk: Primary Key of the task in the database.
+    """
+    try:
+        task = Fetch.get(pk)
+    except NotFoundError:
+        return
+    if task.status != Fetch.TaskStatus.created:
+        # Cancelled while it was being sized up.
+        return
+
+    try:
+        fetchers = current_app.extensions["fetchers"].get_for_url(task.url)
+        metadata = None
+        for fetcher in fetchers:
+            try:
+                metadata = fetcher.probe(task.url, task.format)
+            except Exception as e:
+                task.emit_event(
+                    "log", "debug", f"{fetcher.name} couldn't size up the media: {e}"
+                )
+                continue
+            if metadata is not None:
+                break
+
+        if metadata is not None:
+            task.estimated_bytes, task.estimated_seconds = _estimate(
+                task, metadata, fetchers
+            )
+            task.meta = FetchMetadata.from_media(metadata)
+            task.save_fields("meta", "estimated_bytes", "estimated_seconds")
+            db.publish(
+                {"fetch_id": task.pk, "meta": task.meta.model_dump_json()},
+                type="metadata",
+            )
+            if task.estimated_bytes is not None:
+                task.emit_event(
+                    "log",
+                    "info",
+                    f"Expecting about {task.estimated_bytes / 1024 / 1024:.0f}MiB"
+                    + (
+                        f", taking about {task.estimated_seconds:.0f}s to download"
+                        if task.estimated_seconds is not None
+                        else ""
+                    ),
+                )
+    finally:
+        # However it went, the fetch still needs doing.
+        _enqueue(task)
+
+
+def _estimate(
+    task: Fetch, metadata: MediaMetadata, fetchers: list[Fetcher]
+) -> tuple[int | None, float | None]:
+    """
+    _estimate estimates how big the given fetch's media is in bytes, from its metadata, and how long it will take to
+    download in seconds, from how fast the fetchers have been downloading from the site.
+    If only a clip of the media is wanted, and the first fetcher can download just that, it's sized up as the clip.
+    """
+    try:
+        duration = float(metadata.duration)
+    except (TypeError, ValueError):
+        duration = None
+    estimated_bytes = metadata.filesize
+    if estimated_bytes is None:
+        if duration is None:
+            return None, None
+        estimated_bytes = int(
+            duration * current_app.config.get("FETCH_ASSUMED_BITRATE")
+        )
+    clip = task.clip
+    if clip is not None and duration and len(fetchers) > 0 and fetchers[0].clips:
+        estimated_bytes = int(estimated_bytes * clip.length(duration) / duration)
+
+    scoreboard = current_app.extensions["fetchers"].scoreboard
+    if scoreboard is None:
+        return estimated_bytes, None
+    try:
+        scores = scoreboard.scores(domain_of(task.url))
+    except RedisError:
+        return estimated_bytes, None
+    # Fetchers are tried in the order they've been doing best, so go by the first that has a download rate to go on.
+    for fetcher in fetchers:
+        score = scores.get(fetcher.name)
+        if score is not None and score.throughput:
+            return estimated_bytes, round(estimated_bytes / score.throughput, 1)
+    return estimated_bytes, None
+
+
 @shared_task(
     name="slurp.fetch", bind=True, dont_autoretry_for=(BadRequest,), acks_late=True
 )
@@ -88,231 +322,977 @@ def fetch(self: Task, pk: str):
     :return: None
     """
 
-    task = Fetch.find(Fetch.pk == pk).first()
-    if not task:
+    ts_started = datetime.datetime.now(datetime.UTC)
+    try:
+        task = Fetch.get(pk)
+    except NotFoundError:
         raise BadRequest(f"Task {pk} does not exist on database")
 
     # This assertion is mainly here to clear some IDE warnings.
     assert task.target is not None, "task target must be set"
 
+    if task.status == Fetch.TaskStatus.cancelled:
+        # Cancelled while it was queued - revoking it doesn't stop every worker from picking it up.
+        # If it was deferred part way through, what it had downloaded was kept for it - it isn't needed now.
+        for volume in scratch_volumes(current_app.config):
+            shutil.rmtree(
+                os.path.join(volume.path, f"{SCRATCH_PREFIX}{task.pk}"),
+                ignore_errors=True,
+            )
+        _finished(task)
+        return None
+    if task.worker_id != self.request.id or task.status not in (
+        Fetch.TaskStatus.created,
+        Fetch.TaskStatus.running,
+    ):
+        # A stale delivery (the message is acked late, so it can be redelivered) - the fetch has since been requeued
+        # under another job, or has already finished. Working it again would duplicate (or overwrite) its output.
+        return None
+
     # Re-validate that the destination is permitted for extra safety - just in case the database has been tampered with
     if task.target not in current_app.config["OUTPUTS"]:
         raise BadRequest(
             "This target is not valid. Please refer to Slurp's configuration."
         )
 
-    # We take a lock to ensure that we're the only thing working with the given Fetch.
+    # We take a lease to ensure that we're the only thing working with the given Fetch.
     # If multiple workers were working the same fetch, not only is it a waste of resources, but
     # there's a very real possibility they may end up corrupting
     # the output file once it's written to disk.
-    lock = task.lock(blocking=False)
-    try:
-        l_success = lock.acquire(token=self.request.id)
-        if not l_success:
-            raise FetchLockedError
+    # The lease is renewed in the background while we work. If this worker dies, it lapses and the fetch is requeued.
+    lease = task.lease(current_app.config.get("FETCH_LEASE_TTL"))
+    if not lease.acquire(token=self.request.id):
+        # Someone else is working it (this may be a redelivery of a fetch that's still running) - leave them to it.
+        raise FetchLockedError
+    # Listen out for the fetch being cancelled while we work it.
+    cancel = CancelWatcher(task.db(), task.pk)
+    with _Stage(self, task, lease, cancel) as stage:
+        # Start a fresh timing breakdown - this may be a redelivery of a fetch that was previously attempted.
+        task.stages = []
+        queued = task.record_stage("queued", task.ts_created)
+        if self.request.retries == 0:
+            # Only the first time it's picked up - the wait for a retry includes its countdown.
+            record_queue_wait(task.db(), task.priority, queued.duration)
+        task.record_stage("lock", ts_started)
 
         # Update the task status
         task.status = Fetch.TaskStatus.running
         task.worker_id = self.request.id
-        task.save()
-        task.emit_event("log", "info", f"Task acquired by job {self.request.id}")
+        task.save_fields("status", "worker_id", "stages")
+        progress = stage.progress = ProgressReporter(
+            self, task, current_app.config.get("PROGRESS_STATE_INTERVAL")
+        )
+        progress.event("log", "info", f"Task acquired by job {self.request.id}")
+
+        # Find all fetchers valid for the fetch URL
+        fetchers = current_app.extensions["fetchers"].get_for_url(task.url)
+        if len(fetchers) == 0:
+            raise NoFetchersAvailable
+
+        if stage.reservation is not None and task.estimated_bytes is not None:
+            # Make sure there's room for it before we start.
+            _reserve_disk(stage.reservation, task.estimated_bytes)
+
+        media_path, download_stage = _run_fetchers(
+            task,
+            fetchers,
+            stage.scratch_dir,
+            lease,
+            cancel.cancelled,
+            progress,
+            hedge_delay=(
+                current_app.config.get("FETCH_HEDGE_DELAY") if task.urgent else None
+            ),
+            reservation=stage.reservation,
+        )
+
+        task.media_bytes = os.path.getsize(media_path)
+        if download_stage is not None and download_stage.duration > 0:
+            task.throughput = round(task.media_bytes / download_stage.duration, 1)
+        if task.clip is not None and download_stage is not None:
+            # Fetchers that can download just the clip did.
+            task.clipped = any(
+                f.clips for f in fetchers if f.name == download_stage.fetcher
+            )
+
+        if lease.lost:
+            raise FetchLeaseLostError
+        if cancel.cancelled.is_set():
+            raise FetchCancelledError
+
+        if current_app.config.get("FETCH_PIPELINE_STAGES"):
+            # Hand the media over to be post-processed elsewhere, freeing this worker up for another download.
+            stage.hand_off(postprocess, media_path)
+            return None
+        _postprocess(task, media_path, progress)
+        return _finalise(task, media_path, progress)
+    # The stage was cancelled.
+    return None
+
 
+@shared_task(name="slurp.postprocess", bind=True, acks_late=True)
+def postprocess(
+    self: Task, pk: str, worker_id: str, media_path: str, ts_handed_off: str
+):
+    """
+    Post-process a downloaded fetch (checking the media is sound), then hand it over to be finalised.
+    It is not intended to call this task directly - it is automatically enqueued by fetch, if FETCH_PIPELINE_STAGES
+    is set.
+    :param self: Celery task object.
+    :param pk: Primary Key of the task in the database.
+    :param worker_id: ID of the job that downloaded the media - if the fetch has been requeued since, this is stale.
+    :param media_path: Path to the downloaded media, in the fetch's scratch directory.
+    :param ts_handed_off: When the media was handed over, as an ISO 8601 timestamp.
+    """
+    stage = _resume(self, pk, worker_id, ts_handed_off)
+    if stage is None:
+        return None
+    with stage:
+        if stage.cancel.cancelled.is_set():
+            # Cancelled while it was waiting to be post-processed.
+            raise FetchCancelledError
+        _postprocess(stage.task, media_path, stage.progress)
+        stage.hand_off(finalise_fetch, media_path)
+    return None
+
+
+@shared_task(name="slurp.finalise", bind=True, acks_late=True)
+def finalise_fetch(
+    self: Task, pk: str, worker_id: str, media_path: str, ts_handed_off: str
+):
+    """
+    Finalise a post-processed fetch, by moving the media to the defined location.
+    It is not intended to call this task directly - it is automatically enqueued by postprocess.
+    :param self: Celery task object.
+    :param pk: Primary Key of the task in the database.
+    :param worker_id: ID of the job that downloaded the media - if the fetch has been requeued since, this is stale.
+    :param media_path: Path to the post-processed media, in the fetch's scratch directory.
+    :param ts_handed_off: When the media was handed over, as an ISO 8601 timestamp.
+    """
+    stage = _resume(self, pk, worker_id, ts_handed_off)
+    if stage is None:
+        return None
+    with stage:
+        if stage.cancel.cancelled.is_set():
+            # Cancelled while it was waiting to be finalised.
+            raise FetchCancelledError
+        return _finalise(stage.task, media_path, stage.progress)
+    # The stage was cancelled.
+    return None
+
+
+def _resume(
+    celery_task: Task, pk: str, worker_id: str, ts_handed_off: str
+) -> "_Stage | None":
+    """
+    _resume picks up a fetch handed over from its previous stage, taking its lease.
+    :return: The stage to work it under, or None if the hand-over is stale - the fetch has been requeued, or is gone.
+    """
+    try:
+        task = Fetch.get(pk)
+    except NotFoundError:
+        return None
+    if task.worker_id != worker_id or task.status != Fetch.TaskStatus.running:
+        return None
+
+    task.record_stage("handoff", datetime.datetime.fromisoformat(ts_handed_off))
+    lease = task.lease(current_app.config.get("FETCH_LEASE_TTL"))
+    stage = _Stage(celery_task, task, lease, CancelWatcher(task.db(), task.pk))
+    stage.progress = ProgressReporter(
+        celery_task, task, current_app.config.get("PROGRESS_STATE_INTERVAL")
+    )
+    # Nothing else may go wrong between taking the lease and entering the stage, which releases it however it ends.
+    if not lease.acquire(token=celery_task.request.id):
+        raise FetchLockedError
+    return stage
+
+
+class _Stage:
+    """
+    A _Stage is one stage of working a fetch - downloading it, post-processing it or finalising it - under its lease.
+    Used as a context manager, it listens out for the fetch being cancelled while the stage runs, and however the
+    stage ends, leaves the fetch in the right state: cancelled, put back in the queue (if it was deferred), failed,
+    or handed over to the next stage. The lease is always released, and the scratch directory removed once nothing
+    else needs it.
+    """
+
+    def __init__(
+        self, celery_task: Task, task: Fetch, lease: Lease, cancel: CancelWatcher
+    ):
+        self.celery_task = celery_task
+        self.task = task
+        self.lease = lease
+        self.cancel = cancel
+        self.progress: ProgressReporter | None = None
+        # The directory the fetch works in. Set once the stage starts.
+        self.scratch_dir: str | None = None
+        # The space reserved for the fetch, or None if fetches are started whether there's room or not.
+        self.reservation: Reservation | None = None
+        self._next: tuple[Task, str] | None = None
+
+    def _place(self):
+        """_place picks the directory the fetch works in, and where the space it needs is reserved."""
+        ledger = disk_ledger(db.redis, current_app.config)
+        # It's named after the fetch, so that if a worker dies mid-fetch, whoever picks the fetch up again can reuse
+        # whatever was already downloaded - and so later stages can find it.
+        self.scratch_dir = place_scratch(
+            self.task.pk,
+            scratch_volumes(current_app.config),
+            self.task.estimated_bytes,
+            current_app.config.get("FETCH_DISK_MIN_FREE"),
+            ledger,
+        )
+        if ledger is not None:
+            self.reservation = Reservation(
+                ledger,
+                self.task.pk,
+                fetch_volumes(os.path.dirname(self.scratch_dir), self.task.target),
+            )
+
+    def hand_off(self, stage: Task, media_path: str):
+        """hand_off queues the given stage task to carry on with the media once this stage is over."""
+        self.task.save_fields("stages", "media_bytes", "throughput", "clipped")
+        self._next = (stage, media_path)
+
+    def __enter__(self) -> "_Stage":
+        # The lease is already held, so whatever goes wrong getting started, it mustn't be left held.
+        try:
+            self._place()
+            os.makedirs(self.scratch_dir, exist_ok=True)
+            self.cancel.start()
+        except Exception:
+            self.lease.release()
+            raise
+        return self
+
+    def __exit__(self, typ, e: BaseException | None, tb) -> bool:
+        task = self.task
         try:
-            # Find all fetchers valid for the fetch URL
-            fetchers = current_app.extensions["fetchers"].get_for_url(task.url)
-            if len(fetchers) == 0:
-                raise NoFetchersAvailable
-
-            # Work in a temporary directory that gets torn down at the completion of this slurp run
-            with tempfile.TemporaryDirectory(
-                dir=current_app.config.get("OUTPUT_TEMP", None)
-            ) as tmp_dir:
-                success: bool = False
-                media_path: str | None = None
-                for idx, fetcher in enumerate(fetchers):
-                    # yield f"<code class='fetcher-progress-message'>🛫 {'Trying Fetch again' if idx > 0 else 'Fetching'} with {fetcher.name}...</code>"
-                    self.update_state(
-                        event=f"{'Trying Fetch again' if idx > 0 else 'Fetching'} with {fetcher.name}"
+            match e:
+                case None:
+                    return False
+                case FetchCancelledError() if not self.lease.lost:
+                    self._next = None
+                    # The download has already been stopped - just mark the task cancelled.
+                    task.status = Fetch.TaskStatus.cancelled
+                    task.save_fields("status", "stages", "media_bytes", "throughput")
+                    db.publish(
+                        {
+                            "fetch_id": task.pk,
+                            "state": Fetch.TaskStatus.cancelled.value,
+                        },
+                        type="fetch_updated",
                     )
-                    sse.publish(
+                    task.emit_event("log", "warning", "Fetch cancelled")
+                    return True
+                case FetchDeferredError() if not self.lease.lost:
+                    # Put the fetch back in the queue, to try again once there's room for it.
+                    task.status = Fetch.TaskStatus.created
+                    task.save_fields("status", "stages")
+                    db.publish(
                         {
                             "fetch_id": task.pk,
-                            "message": f"{'Trying Fetch again' if idx > 0 else 'Fetching'} with {fetcher.name}",
+                            "state": Fetch.TaskStatus.created.value,
                         },
-                        type="message",
+                        type="fetch_updated",
                     )
-                    task.emit_event(
-                        "log",
-                        "info",
-                        f"{'Trying Fetch again' if idx > 0 else 'Fetching'} with {fetcher.name}",
+                    task.emit_event("log", "info", str(e))
+                    raise self.celery_task.retry(countdown=e.delay, max_retries=None)
+                case Exception() if not self.lease.lost and not isinstance(
+                    e, (FetchCancelledError, FetchDeferredError, FetchLeaseLostError)
+                ):
+                    # Before marking the task failed, have the troubleshooter see if there's a reason the error
+                    # happened. It can take a while (it may ask YouTube about the video), so it's done elsewhere rather
+                    # than holding up this worker.
+                    task.emit_event("log", "info", "Attempting to troubleshoot...")
+                    reasons = (
+                        e.reasons if isinstance(e, FetchersExhaustedError) else [str(e)]
                     )
-                    # Call the fetcher module, and receive events from it
-                    for event in fetcher.fetch(
-                        task.url, task.format, tmp_dir, task.slug
-                    ):
-                        match event:
-                            case FetcherMediaMetadataAvailable() as e:
-                                # Metadata for this fetch now available.
-                                self.update_state(metadata=e.metadata)
-                                db_meta = FetchMetadata(
-                                    name=e.metadata.name,
-                                    author=e.metadata.author,
-                                    author_url=e.metadata.author_url,
-                                    ts_upload=e.metadata.ts_upload,
-                                    duration=e.metadata.duration,
-                                    format=e.metadata.format,
-                                    thumbnail_url=e.metadata.thumbnail_url,
-                                )
-                                task.meta = db_meta
-                                task.save()
-                                sse.publish(
-                                    {
-                                        "fetch_id": task.pk,
-                                        "meta": db_meta.model_dump_json(),
-                                    },
-                                    type="metadata",
-                                )
-                                task.emit_event(
-                                    "log",
-                                    "info",
-                                    "Metadata successfully fetched",
-                                )
-                            case FetcherMediaAvailable() as e:
-                                media_path = e.path
-                            case FetcherProgressReport() as e:
-                                self.update_state(event=e)
-                                task.emit_event(e.typ, e.level, e.message, e.status)
-
-                                if e.typ == "finish":
-                                    if e.status == 0:
-                                        # Success
-                                        success = True
-                                    else:
-                                        task.emit_event(
-                                            "log",
-                                            "error",
-                                            f"Fetcher failed: {e.message}",
-                                        )
-                                        # yield f"<code><b>🛬 Fetcher failed! Reason: {e.message}</b></code>"
-
-                    if success:
-                        break
-                if not success:
-                    # yield "<article class='fetcher-outcome fetcher-progress-message-level-error'>☹️ Slurp failed - out of available fetchers.</article>"
-                    raise FetchersExhaustedError
+                    troubleshoot.apply_async(kwargs={"pk": task.pk, "reasons": reasons})
 
-                # Safety assertion
-                assert media_path is not None, (
-                    "fetcher reported success yet media_path is None"
+                    task.status = Fetch.TaskStatus.failed
+                    task.save_fields("status", "stages", "media_bytes", "throughput")
+                    db.publish(
+                        {
+                            "fetch_id": task.pk,
+                            "state": Fetch.TaskStatus.failed.value,
+                            "message": str(e),
+                        },
+                        type="fetch_updated",
+                    )
+                    task.emit_event("log", "error", f"Fetch failed: {e}")
+                    return False
+                case _:
+                    # The lease was lost, so the fetch has been requeued, and it's not ours to mark anything.
+                    return False
+        finally:
+            self.cancel.stop()
+            # Always release the lease to avoid a deadlock.
+            self.lease.release()
+            if self.reservation is not None and not self.lease.lost:
+                if self._next is not None and e is None:
+                    # The space is still needed until the media is in place.
+                    self.reservation.hold(HANDOFF_HOLD)
+                else:
+                    self.reservation.release()
+            if self._next is not None and e is None:
+                # Only now the lease is free for the next stage to take.
+                stage, media_path = self._next
+                stage.apply_async(
+                    kwargs={
+                        "pk": task.pk,
+                        "worker_id": task.worker_id,
+                        "media_path": media_path,
+                        "ts_handed_off": datetime.datetime.now(
+                            datetime.UTC
+                        ).isoformat(),
+                    }
                 )
+            elif not self.lease.lost and not isinstance(e, FetchDeferredError):
+                # Nothing else needs it - and if the lease was lost, someone else is using it now. If the fetch was
+                # deferred, it's kept so the retry can carry on from whatever was already downloaded.
+                shutil.rmtree(self.scratch_dir, ignore_errors=True)
+            if (self._next is not None and e is None) or task.status in (
+                Fetch.TaskStatus.success,
+                Fetch.TaskStatus.failed,
+                Fetch.TaskStatus.cancelled,
+            ):
+                # Done with its slot - unless it's been deferred (it's still in the queue) or requeued (it's someone
+                # else's now).
+                _finished(task)
+            if self.celery_task.request.id != task.worker_id and not self.lease.lost:
+                # This is a later stage. The download job finished when it handed over, but it's the job the fetch's
+                # worker_id points clients at - so once the fetch is over, that job gets its outcome.
+                backend = self.celery_task.backend
+                if task.status == Fetch.TaskStatus.failed and e is not None:
+                    backend.mark_as_failure(task.worker_id, e)
+                elif task.status in (
+                    Fetch.TaskStatus.success,
+                    Fetch.TaskStatus.cancelled,
+                ):
+                    backend.mark_as_done(task.worker_id, task.output_path)
+            if self.progress is not None:
+                # Progress is coalesced, so the last of it may not have been written yet.
+                self.progress.flush()
 
-                # The fetcher seems to have worked - run the finaliser.
-                self.update_state(event="finalising")
-                final_path: str | None = None
-                try:
-                    for event in finalise(media_path, task.target):
-                        match event:
-                            case FetcherProgressReport() as e:
-                                self.update_state(event=e)
-                                task.emit_event(e.typ, e.level, e.message, e.status)
-                            case FetcherMediaAvailable() as e:
-                                final_path = e.path
-                except Exception as e:
-                    # yield f"<article class='fetcher-outcome fetcher-progress-message-level-error'>💣 Failed to finalise media: {e}</article>"
-                    raise FinaliserError(e)
-                # yield f"<article class='fetcher-outcome fetcher-progress-message-level-success'>🥤 Media slurped to {final_path}</article>"
-        except Exception as e:
-            # Catch exceptions and set the task state appropriately.
-            # Before that, run the troubleshooter to see if there's a reason the error happened.
-            task.emit_event("log", "info", "Attempting to troubleshoot...")
-            for event in troubleshooter(task):
+
+def _postprocess(task: Fetch, media_path: str, progress: ProgressReporter):
+    """
+    _postprocess trims the downloaded media down to the clip that was asked for (if the fetcher couldn't download just
+    that), then checks it is sound, reporting any problems with it.
+    """
+    progress.stage("postprocess")
+    if task.clip is not None and not task.clipped:
+        ts_trim = datetime.datetime.now(datetime.UTC)
+        progress.event("log", "info", f"Trimming the media to {task.clip}")
+        try:
+            for event in trim(media_path, task.clip):
                 match event:
-                    case FetcherProgressReport() as trbl_msg:
-                        task.emit_event(
-                            trbl_msg.typ,
-                            trbl_msg.level,
-                            trbl_msg.message,
-                            trbl_msg.status,
-                        )
-            raise e
-
-        assert final_path is not None, "final_path not properly set by fetcher routine"
-        # Update the fetch with the final state.
-        self.update_state(status=Fetch.TaskStatus.success.value, path=final_path)
-        task.status = Fetch.TaskStatus.success.value
-        task.output_path = final_path
-        task.save()
-        sse.publish(
-            {
-                "fetch_id": task.pk,
-                "state": Fetch.TaskStatus.success.value,
-                "path": final_path,
-            },
-            type="fetch_updated",
-        )
-        task.emit_event(
-            "log",
-            "success",
-            f"Fetch succeeded: file saved to {final_path}",
-        )
+                    case FetcherProgressReport() as e:
+                        progress.event(e.typ, e.level, e.message, e.status)
+        except Exception as e:
+            raise FinaliserError(e)
+        task.clipped = True
+        task.media_bytes = os.path.getsize(media_path)
+        task.record_stage("trim", ts_trim)
+    ts_validate = datetime.datetime.now(datetime.UTC)
+    try:
+        for event in validate(media_path):
+            match event:
+                case FetcherProgressReport() as e:
+                    progress.event(e.typ, e.level, e.message, e.status)
+    except Exception as e:
+        raise FinaliserError(e)
+    task.record_stage("validate", ts_validate)
 
-        return final_path
+
+def _finalise(task: Fetch, media_path: str, progress: ProgressReporter) -> str:
+    """_finalise moves the media into place, and marks the fetch a success."""
+    progress.stage("finalise")
+    ts_finalise = datetime.datetime.now(datetime.UTC)
+    final_path: str | None = None
+    try:
+        for event in place(media_path, task.target):
+            match event:
+                case FetcherMediaAvailable() as e:
+                    final_path = e.path
     except Exception as e:
-        # Mark the task failed and re-raise
-        self.update_state(status=Fetch.TaskStatus.failed.value, reason=str(e))
-        task.status = Fetch.TaskStatus.failed
-        task.save()
-        sse.publish(
-            {
-                "fetch_id": task.pk,
-                "state": Fetch.TaskStatus.failed.value,
-                "message": str(e),
-            },
-            type="fetch_updated",
+        raise FinaliserError(e)
+    task.record_stage("finalise", ts_finalise)
+
+    assert final_path is not None, "final_path not properly set by fetcher routine"
+    # Update the fetch with the final state.
+    task.status = Fetch.TaskStatus.success
+    task.output_path = final_path
+    task.save_fields(
+        "status", "output_path", "stages", "media_bytes", "throughput", "clipped"
+    )
+    task.schedule_prune()
+    if (negative_cache := _negative_cache()) is not None:
+        # It's available after all.
+        negative_cache.clear(task.url)
+    db.publish(
+        {
+            "fetch_id": task.pk,
+            "state": Fetch.TaskStatus.success.value,
+            "path": final_path,
+        },
+        type="fetch_updated",
+    )
+    task.emit_event(
+        "log",
+        "success",
+        f"Fetch succeeded: file saved to {final_path}",
+    )
+    return final_path
+
+
+def _reserve_disk(reservation: Reservation, size: int):
+    """
+    _reserve_disk reserves the given number of bytes for the fetch, deferring it if there isn't room.
+    :raises ShortOfSpace: If there'll never be room for it.
+    """
+    if (short := reservation.reserve(size)) is not None:
+        volume, wait = short
+        raise FetchDeferredError(wait, f"there isn't room for it on {volume.path}")
+
+
+def _negative_cache() -> NegativeCache | None:
+    """_negative_cache returns the cache of media found to be unavailable, or None if it's disabled."""
+    ttl = current_app.config.get("NEGATIVE_CACHE_TTL")
+    if not ttl:
+        return None
+    return NegativeCache(db.redis, int(ttl * 3600))
+
+
+@shared_task(name="slurp.troubleshoot", bind=True)
+def troubleshoot(self: Task, pk: str, reasons: list[str]):
+    """
+    troubleshoot runs the troubleshooter over a failed fetch, logging what it finds against the fetch.
+    It is not intended to call this task directly - it is automatically enqueued by fetch when it fails.
+    :param self: Celery task object.
+    :param pk: Primary Key of the fetch in the database.
+    :param reasons: Messages the fetchers failed with.
+    """
+    try:
+        task = Fetch.get(pk)
+    except NotFoundError:
+        return
+
+    for event in troubleshooter(task, reasons):
+        match event:
+            case FetcherProgressReport() as trbl_msg:
+                task.emit_event(
+                    trbl_msg.typ,
+                    trbl_msg.level,
+                    trbl_msg.message,
+                    trbl_msg.status,
+                )
+            case FailureDiagnosis() as diagnosis:
+                _record_diagnosis(task, diagnosis)
+
+
+def _record_diagnosis(task: Fetch, diagnosis: FailureDiagnosis):
+    """_record_diagnosis reports the troubleshooter's verdict, remembering the media is unavailable if it's permanent."""
+    match diagnosis.failure_class:
+        case FailureClass.permanent:
+            task.emit_event(
+                "log",
+                "warning",
+                f"This media looks to be unavailable ({diagnosis.reason}) - fetches of it will fail straight away for a while, unless they're forced.",
+            )
+            if (negative_cache := _negative_cache()) is not None:
+                negative_cache.put(task.url, diagnosis.reason, task.pk)
+        case FailureClass.transient:
+            task.emit_event(
+                "log",
+                "info",
+                f"This looks like a temporary problem ({diagnosis.reason}) - it may work if you try again later.",
+            )
+
+
+class _Attempt:
+    """An _Attempt is one fetcher's attempt at a fetch. The fetcher is run on its own thread."""
+
+    def __init__(
+        self, idx: int, fetcher: Fetcher, directory: str, slot: Slot | None = None
+    ):
+        """
+        :param slot: The slot the limiter gave the attempt, if it's limited. It's released once the attempt stops.
+        """
+        self.idx = idx
+        self.fetcher = fetcher
+        self.directory = directory
+        self.slot = slot
+
+        # The download stage runs from the end of the metadata stage (if the fetcher supports it)
+        self.ts_start = datetime.datetime.now(datetime.UTC)
+        self.ts_download = self.ts_start
+        self.status: int | None = None
+        self.media_path: str | None = None
+        self.download_stage: FetchStage | None = None
+
+        # Set to stop the attempt early - because the fetch was cancelled, or another attempt beat it.
+        self.cancel = threading.Event()
+
+        # Seconds from the start of the attempt until media started arriving, once it has.
+        self.ttfb: float | None = None
+
+        # The directory may already hold a partial download from a previous attempt.
+        self._size_start = dir_size(directory)
+        self._ts_started = time.monotonic()
+        self._ts_watched = 0.0
+        self._thread: threading.Thread | None = None
+
+    def start(self, task: Fetch, events: queue.Queue):
+        """start runs the fetcher, putting (attempt, event) on events for each event, and (attempt, None) at the end."""
+
+        def run():
+            try:
+                for event in self.fetcher.fetch(
+                    task.url,
+                    task.format,
+                    self.directory,
+                    task.slug,
+                    cancel=self.cancel,
+                    # Fetchers that can't download just the clip download the whole thing, and it's trimmed after.
+                    clip=task.clip if self.fetcher.clips else None,
+                ):
+                    events.put((self, event))
+            except Exception as e:
+                events.put(
+                    (
+                        self,
+                        FetcherProgressReport(
+                            typ="finish",
+                            level="error",
+                            status=1,
+                            message=f"Fetcher Exception: {e}",
+                        ),
+                    )
+                )
+            finally:
+                events.put((self, None))
+
+        self._thread = threading.Thread(
+            target=run, name=f"fetch-{self.fetcher.name}", daemon=True
         )
+        self._thread.start()
+
+    @property
+    def duration(self) -> float:
+        """duration is the number of seconds since the attempt started."""
+        return time.monotonic() - self._ts_started
+
+    def watch(self):
+        """watch checks (at most once a second) whether media has started arriving yet, and keeps hold of the slot."""
+        if self.slot is not None:
+            self.slot.renew()
+        now = time.monotonic()
+        if self.ttfb is not None or now - self._ts_watched < 1:
+            return
+        self._ts_watched = now
+        if dir_size(self.directory) > self._size_start:
+            self.ttfb = now - self._ts_started
+
+    def slow_to_start(self, delay: float) -> bool:
+        """slow_to_start returns whether the attempt has been running for delay seconds without receiving any media."""
+        return self.ttfb is None and self.duration >= delay
+
+    def record(self, task: Fetch):
+        """record records how the attempt went on the fetcher scoreboard."""
+        stats = {"duration": self.duration, "ttfb": self.ttfb}
+        if self.status == 0 and self.media_path is not None:
+            if stats["ttfb"] is None and self.download_stage is not None:
+                # It finished before we noticed - media started arriving once the download stage started, at the latest.
+                stats["ttfb"] = (
+                    self.download_stage.ts_start - self.ts_start
+                ).total_seconds()
+            stats["download_bytes"] = os.path.getsize(self.media_path)
+            if self.download_stage is not None:
+                stats["download_seconds"] = self.download_stage.duration
+        current_app.extensions["fetchers"].record_attempt(
+            task.url, self.fetcher, self.status == 0, **stats
+        )
+
+    def stop(self):
+        """stop stops the attempt, and waits (briefly) for it to finish."""
+        self.cancel.set()
+        if self._thread is not None:
+            self._thread.join(timeout=15)
+        self.release()
+
+    def release(self):
+        """release gives up the attempt's slot, if it has one."""
+        if self.slot is not None:
+            self.slot.release()
+
+
+def _run_fetchers(
+    task: Fetch,
+    fetchers: list[Fetcher],
+    tmp_dir: str,
+    lease: Lease,
+    cancel: threading.Event,
+    progress: ProgressReporter,
+    hedge_delay: float | None = None,
+    reservation: Reservation | None = None,
+) -> tuple[str, FetchStage | None]:
+    """
+    _run_fetchers tries each of the given fetchers in turn, until one of them fetches the media.
+    If hedge_delay is set and the running fetcher hasn't received any media after that many seconds, the next fetcher
+    is raced against it. Whichever finishes first wins, and the other is stopped and its download removed.
+    :param tmp_dir: Directory to work in. Each fetcher gets its own subdirectory.
+    :param cancel: Event set when the fetch is cancelled.
+    :param hedge_delay: Seconds to wait for media before racing the next fetcher, or None to never race.
+    :param reservation: Space reserved for the fetch, kept hold of while it downloads. If the fetch wasn't sized up
+        before it started, space is reserved once its metadata comes in - deferring it if there isn't room.
+    :return: Path to the fetched media, and the download stage of the fetcher that fetched it.
+    """
+    events: queue.Queue[tuple[_Attempt, FetcherUpdateEvent | None]] = queue.Queue()
+    pending = list(enumerate(fetchers))
+    running: list[_Attempt] = []
+    attempts: list[_Attempt] = []
+    winner: _Attempt | None = None
+    # Why each failed attempt failed.
+    reasons: list[str] = []
+    # Whether we're waiting on the limiter to try the next fetcher.
+    waiting = False
+
+    limiter: Limiter | None = current_app.extensions["fetchers"].limiter
+
+    def start_next(racing: _Attempt | None = None) -> float:
+        """
+        start_next starts the first pending fetcher the limiter has a slot for.
+        :return: 0 if one was started, otherwise roughly how many seconds until one can be.
+        """
+        slot: Slot | None = None
+        wait: float | None = None
+        for i, (idx, fetcher) in enumerate(pending):
+            if limiter is None:
+                break
+            holder = f"{task.pk}:{fetcher.name}"
+            fetcher_wait = limiter.acquire(holder, task.url, fetcher.name)
+            if fetcher_wait == 0:
+                slot = limiter.slot(holder, task.url, fetcher.name)
+                break
+            wait = fetcher_wait if wait is None else min(wait, fetcher_wait)
+        else:
+            return wait
+        idx, fetcher = pending.pop(i)
+        # yield f"<code class='fetcher-progress-message'>🛫 {'Trying Fetch again' if idx > 0 else 'Fetching'} with {fetcher.name}...</code>"
+        progress.stage("fetch", fetcher.name)
+        if racing is not None:
+            progress.event(
+                "log",
+                "info",
+                f"{racing.fetcher.name} has no media after {hedge_delay:.0f}s - racing it with {fetcher.name}",
+            )
+        else:
+            progress.event(
+                "log",
+                "info",
+                f"{'Trying Fetch again' if idx > 0 else 'Fetching'} with {fetcher.name}",
+            )
+        # Each fetcher gets its own directory, so it can pick up where it left off if the fetch is retried.
+        fetcher_dir = os.path.join(tmp_dir, fetcher.name)
+        if os.path.isdir(fetcher_dir) and len(os.listdir(fetcher_dir)) > 0:
+            progress.event(
+                "log",
+                "info",
+                "Reusing partial download from a previous attempt",
+            )
+        os.makedirs(fetcher_dir, exist_ok=True)
+        attempt = _Attempt(idx, fetcher, fetcher_dir, slot)
+        attempt.start(task, events)
+        running.append(attempt)
+        attempts.append(attempt)
+        return 0
+
+    try:
+        while winner is None:
+            if lease.lost:
+                raise FetchLeaseLostError
+            if cancel.is_set():
+                raise FetchCancelledError
+            for attempt in running:
+                attempt.watch()
+            if reservation is not None:
+                reservation.renew(tmp_dir)
+            if len(running) == 0:
+                if len(pending) == 0:
+                    # yield "<article class='fetcher-outcome fetcher-progress-message-level-error'>☹️ Slurp failed - out of available fetchers.</article>"
+                    raise FetchersExhaustedError(reasons)
+                if (wait := start_next()) > 0:
+                    if len(attempts) == 0:
+                        # Nothing has been tried yet - make way for other fetches, rather than waiting here.
+                        raise FetchDeferredError(wait)
+                    if not waiting:
+                        progress.event(
+                            "log",
+                            "info",
+                            "Waiting for a free slot to try the next fetcher",
+                        )
+                    waiting = True
+                else:
+                    waiting = False
+            elif (
+                hedge_delay is not None
+                and len(running) == 1
+                and len(pending) > 0
+                and running[0].slow_to_start(hedge_delay)
+            ):
+                # If there's no slot for it right now, it's tried again next time round.
+                start_next(racing=running[0])
+
+            try:
+                # Wake up regularly to check whether to race another fetcher, or whether we've been cancelled.
+                attempt, event = events.get(timeout=1)
+            except queue.Empty:
+                continue
+            if attempt not in running:
+                # Anything left over from an attempt that's already finished.
+                continue
+            match event:
+                case None:
+                    # The fetcher stopped without saying how it went.
+                    task.record_stage(
+                        "attempt", attempt.ts_start, attempt.fetcher.name, None
+                    )
+                    running.remove(attempt)
+                    attempt.release()
+                    attempt.record(task)
+                case FetcherMediaMetadataAvailable() as e:
+                    # Metadata for this fetch now available.
+                    task.record_stage(
+                        "metadata", attempt.ts_start, attempt.fetcher.name
+                    )
+                    attempt.ts_download = datetime.datetime.now(datetime.UTC)
+                    if len(running) > 1 and task.meta is not None:
+                        # The fetcher we're racing already found it.
+                        continue
+                    progress.update(name=e.metadata.name)
+                    db_meta = FetchMetadata.from_media(e.metadata)
+                    task.meta = db_meta
+                    task.save_fields("meta", "stages")
+                    db.publish(
+                        {
+                            "fetch_id": task.pk,
+                            "meta": db_meta.model_dump_json(),
+                        },
+                        type="metadata",
+                    )
+                    progress.event(
+                        "log",
+                        "info",
+                        "Metadata successfully fetched",
+                    )
+                    if reservation is not None and task.estimated_bytes is None:
+                        estimated_bytes, _ = _estimate(task, e.metadata, fetchers)
+                        if estimated_bytes is not None:
+                            _reserve_disk(reservation, estimated_bytes)
+                            task.estimated_bytes = estimated_bytes
+                            task.save_fields("estimated_bytes")
+                case FetcherMediaAvailable() as e:
+                    attempt.media_path = e.path
+                case FetcherProgressReport() as e:
+                    progress.event(e.typ, e.level, e.message, e.status)
+
+                    if e.typ == "finish":
+                        attempt.status = e.status
+                        attempt.download_stage = task.record_stage(
+                            "download",
+                            attempt.ts_download,
+                            attempt.fetcher.name,
+                            e.status,
+                        )
+                        task.record_stage(
+                            "attempt", attempt.ts_start, attempt.fetcher.name, e.status
+                        )
+                        running.remove(attempt)
+                        attempt.release()
+                        attempt.record(task)
+                        if e.status == 0:
+                            # Success
+                            winner = attempt
+                        else:
+                            reasons.append(e.message)
+                            progress.event(
+                                "log",
+                                "error",
+                                f"Fetcher failed: {e.message}",
+                            )
+                            # yield f"<code><b>🛬 Fetcher failed! Reason: {e.message}</b></code>"
+    finally:
+        # Stop anything still running - the fetch has been won, cancelled or has failed.
+        for attempt in running:
+            if winner is not None:
+                progress.event(
+                    "log",
+                    "info",
+                    f"{winner.fetcher.name} finished first - stopping {attempt.fetcher.name}",
+                )
+            attempt.stop()
+            if winner is not None:
+                shutil.rmtree(attempt.directory, ignore_errors=True)
+
+    # Safety assertion
+    assert winner.media_path is not None, (
+        "fetcher reported success yet media_path is None"
+    )
+    return winner.media_path, winner.download_stage
+
+
+@shared_task(name="slurp.reap_expired_leases", bind=True)
+def reap_expired_leases(self):
+    """
+    reap_expired_leases requeues fetches whose worker has stopped renewing its lease (most likely because it died).
+    :param self:
+    :return: A list of IDs requeued
+    """
+    redis = Fetch.db()
+    requeued = []
+    for pk in redis.zrangebyscore(LEASES_KEY, "-inf", time.time()):
+        pk = pk.decode()
+        if redis.exists(pk):
+            # The lease has been renewed since - the worker is just running late.
+            continue
+        if redis.zrem(LEASES_KEY, pk) == 0:
+            # Another reaper got here first.
+            continue
+        try:
+            task = Fetch.get(pk)
+        except NotFoundError:
+            continue
+        if task.status != Fetch.TaskStatus.running:
+            continue
+
+        worker_id = task.worker_id
+        task.status = Fetch.TaskStatus.created
+        task.worker_id = uuid()
+        task.save_fields("status", "worker_id")
         task.emit_event(
             "log",
-            "error",
-            f"Fetch failed: {e}",
+            "warning",
+            f"Lost contact with job {worker_id} - requeuing",
         )
-        raise e
-    finally:
-        # Always release the lock to avoid a deadlock.
-        lock.release()
+        _enqueue(task)
+        requeued.append(pk)
+    return requeued
+
+
+@shared_task(name="slurp.dispatch_fetches", bind=True)
+def dispatch_fetches(self):
+    """
+    dispatch_fetches frees the slots of fetches that finished without saying so, and hands the workers as many of the
+    fetches held back for their tenant's turn as they have free slots for. Fetches are handed over as slots free up
+    anyway, so this just makes sure nothing is left waiting.
+    :param self:
+    :return: A list of IDs whose slots were freed
+    """
+    fair = fair_queue(db.redis, current_app.config)
+    if fair is None:
+        return []
+
+    def finished(pk: str) -> bool:
+        try:
+            return Fetch.get(pk).status not in (
+                Fetch.TaskStatus.created,
+                Fetch.TaskStatus.running,
+            )
+        except NotFoundError:
+            return True
+
+    freed = fair.reconcile(finished)
+    _dispatch(fair)
+    return freed
 
 
 @shared_task(name="slurp.cleanup_stale_tasks", bind=True, ignore_result=False)
 def cleanup_stale_tasks(self):
     """
-    cleanup_stale_tasks removes persistent data about tasks that exceed the configured TASK_STALE duration.
+    cleanup_stale_tasks removes the output of tasks that are due to be pruned, and marks those whose events have
+    expired as purged.
+    Event logs and finished task records expire on their own in Redis, so this only needs to deal with files and flags.
+    Due tasks are taken from the prune and purge schedules CLEANUP_BATCH_SIZE at a time, until CLEANUP_TIME_BUDGET runs
+    out. If there's still work left, the task re-enqueues itself to carry on shortly.
     :param self:
     :return: A list of IDs affected by the task
     """
-    # Get the timestamp of the desired cutoffs.
-    # The PRUNE cutoff simply destroys the output data blob.
-    prune_cutoff = datetime.datetime.now(datetime.UTC) - datetime.timedelta(
-        hours=current_app.config.get("PRUNE_AFTER")
-    )
-    # The PURGE cutoff destroys all event data, leaving only the metadata.
-    purge_cutoff = datetime.datetime.now(datetime.UTC) - datetime.timedelta(
-        hours=current_app.config.get("PURGE_AFTER")
-    )
+    ts_start = time.monotonic()
+    budget = current_app.config.get("CLEANUP_TIME_BUDGET")
+    batch_size = current_app.config.get("CLEANUP_BATCH_SIZE")
+    redis = Fetch.db()
 
-    # Find all tasks that are OLDER than the cutoff, and that have not been purged.
-    # Purged is done as a negative to catch models without the key set
-    prune_targets = Fetch.find(
-        (Fetch.ts_created <= prune_cutoff) & ~Fetch.purged,
-    ).all()
-    for task in prune_targets:
-        # Enqueue cleanup
-        # Could do this shorthand however it's (IMO) easier to read this way
-        if task.ts_created < purge_cutoff:
-            # PURGE the task.
-            cleanup_task.delay(task.pk, events=True)
-        else:
-            # PRUNE the task.
-            cleanup_task.delay(task.pk, events=False)
-    ids = [t.pk for t in prune_targets]
+    # Only one cleanup should run at a time - the hourly run may otherwise race a continuation.
+    lock = redis.lock("slurp:cleanup", timeout=budget * 2)
+    if not lock.acquire(blocking=False):
+        current_app.logger.info("Cleanup is already running - skipping")
+        return []
+
+    def _due(key: str) -> list[str]:
+        return [
+            pk.decode()
+            for pk in redis.zrangebyscore(
+                key, "-inf", time.time(), start=0, num=batch_size
+            )
+        ]
+
+    ids = []
+    more = False
+    try:
+        while time.monotonic() - ts_start < budget:
+            due_prune = _due(PRUNE_SCHEDULE_KEY)
+            due_purge = _due(PURGE_SCHEDULE_KEY)
+            more = len(due_prune) == batch_size or len(due_purge) == batch_size
+            if len(due_prune) == 0 and len(due_purge) == 0:
+                break
+
+            to_prune = _get_fetches(due_prune)
+            for pk in set(due_prune) - set(t.pk for t in to_prune):
+                # The record has been deleted - nothing to prune it against.
+                current_app.logger.warning(
+                    "Task %s was due to be pruned, but no longer exists", pk
+                )
+            pruned = _cleanup_fetches(to_prune, purge=[])
+            # Anything that's started again since it finished will be rescheduled when it finishes again.
+            to_purge = [
+                t
+                for t in _get_fetches(due_purge)
+                if t.status
+                in (
+                    Fetch.TaskStatus.success,
+                    Fetch.TaskStatus.failed,
+                    Fetch.TaskStatus.cancelled,
+                    Fetch.TaskStatus.completed,
+                )
+            ]
+            purged = _cleanup_fetches(
+                to_purge, purge=[t.pk for t in to_purge], prune=False
+            )
+            ids += pruned + [pk for pk in purged if pk not in pruned]
+
+            pipeline = redis.pipeline(transaction=False)
+            if len(due_prune) > 0:
+                pipeline.zrem(PRUNE_SCHEDULE_KEY, *due_prune)
+            if len(due_purge) > 0:
+                pipeline.zrem(PURGE_SCHEDULE_KEY, *due_purge)
+            failed = set(t.pk for t in to_prune) - set(pruned)
+            if len(failed) > 0:
+                # Try again in an hour.
+                pipeline.zadd(
+                    PRUNE_SCHEDULE_KEY, {pk: time.time() + 3600 for pk in failed}
+                )
+            pipeline.execute()
+    finally:
+        lock.release()
+
+    if more and time.monotonic() - ts_start >= budget:
+        # Out of time - carry on later, leaving the workers free for anything queued in the meantime.
+        current_app.logger.info(
+            "Cleanup ran out of time after %d tasks - continuing shortly", len(ids)
+        )
+        cleanup_stale_tasks.apply_async(countdown=budget)
     return ids
 
 
@@ -325,41 +1305,115 @@ def cleanup_task(self, task_pk: str, events: bool = False):
     :param events: Destroy all logs and events relating to this task. This is a PURGE.
     :return:
     """
-    task = Fetch.find(Fetch.pk == task_pk).first()
-    if not task:
+    try:
+        task = Fetch.get(task_pk)
+    except NotFoundError:
         raise InvalidTaskError(f"Task {task_pk} does not exist on database")
 
-    # Destroy any events relating to the task if requested
-    if events:
-        FetchEvent.find(FetchEvent.fetch_id == task_pk).delete()
-        task.purged = True
+    if len(_cleanup_fetches([task], purge=[task_pk] if events else [])) > 0:
+        # No need to prune (or purge) it again later.
+        pipeline = Fetch.db().pipeline(transaction=False)
+        pipeline.zrem(PRUNE_SCHEDULE_KEY, task_pk)
+        if events:
+            pipeline.zrem(PURGE_SCHEDULE_KEY, task_pk)
+        pipeline.execute()
 
-    # Destroy the resultant file in the filesystem, if it's there
-    if task.output_path is not None:
-        fs_target = pathlib.Path(task.output_path)
-        if fs_target.is_file():
-            fs_target.unlink()
-        else:
-            current_app.logger.warning(
-                "Failed to destroy output - does not exist, or is not a file"
-            )
-    # Mark the task as pruned
-    task.pruned = True
-    task.save()
 
-    # Raise SSE event / add to the log that the prune occurred
-    task.emit_event(
-        ("purge" if events else "prune"),
-        "info",
-        f"Task was {'purged' if events else 'pruned'}",
-        0,
-    )
+def _get_fetches(pks: list[str]) -> list[Fetch]:
+    """_get_fetches loads the given fetches, skipping any that no longer exist."""
+    fetches = []
+    for pk in pks:
+        try:
+            fetches.append(Fetch.get(pk))
+        except NotFoundError:
+            continue
+    return fetches
+
+
+def _cleanup_fetches(
+    tasks: list[Fetch], purge: list[str], prune: bool = True
+) -> list[str]:
+    """
+    _cleanup_fetches prunes the given tasks, removing their output files, and purges the events of any in purge.
+    Database writes are batched into a single pipeline.
+    :param tasks: Tasks to clean up.
+    :param purge: IDs of tasks to also PURGE.
+    :param prune: Whether to prune the tasks - if not, they're only purged.
+    :return: IDs of the tasks that were cleaned up.
+    """
+    # Destroy any events relating to the purged tasks
+    if len(purge) > 0:
+        _delete_events(purge)
+
+    done = []
+    pipeline = Fetch.db().pipeline(transaction=False)
+    for task in tasks:
+        events = task.pk in purge
+        # Destroy the resultant file in the filesystem, if it's there
+        if prune and task.output_path is not None:
+            fs_target = pathlib.Path(task.output_path)
+            if fs_target.is_file():
+                try:
+                    fs_target.unlink()
+                except OSError as e:
+                    # Leave the task alone, so it's picked up again on the next run.
+                    current_app.logger.error(
+                        "Failed to destroy output of %s: %s", task.pk, e
+                    )
+                    continue
+            else:
+                current_app.logger.warning(
+                    "Failed to destroy output - does not exist, or is not a file"
+                )
+        # Mark the task as pruned
+        if prune:
+            task.pruned = True
+        if events:
+            task.purged = True
+        task.save_fields("pruned", "purged", pipeline=pipeline)
+
+        # Raise SSE event / add to the log that the prune occurred
+        task.emit_event(
+            ("purge" if events else "prune"),
+            "info",
+            f"Task was {'purged' if events else 'pruned'}",
+            0,
+            pipeline=pipeline,
+        )
+        done.append(task.pk)
+    pipeline.execute()
+    return done
+
+
+def _delete_events(fetch_pks: list[str], batch_size: int = 1000):
+    """_delete_events deletes every FetchEvent belonging to the given fetches, batch_size keys at a time."""
+    query = FetchEvent.find(FetchEvent.fetch_id << fetch_pks)
+    while True:
+        # Only fetch the keys - we're deleting them, so there's no need to load the events themselves.
+        # Deleted events drop out of the results, so we always read from the start.
+        result = query.copy(offset=0, limit=batch_size, nocontent=True).execute(
+            exhaust_results=False, return_raw_result=True
+        )
+        keys = result[1:]
+        if len(keys) == 0:
+            return
+        FetchEvent.db().delete(*keys)
 
 
 def _init_periodic_tasks(sender: Celery, **kwargs):
+    # Requeue fetches abandoned by dead workers.
+    sender.add_periodic_task(15.0, reap_expired_leases.s())
+    # Keep the workers busy with fetches held back for their tenant's turn.
+    sender.add_periodic_task(15.0, dispatch_fetches.s())
     # Clean up stale tasks every hour.
     sender.add_periodic_task(
         # Run hourly, on the hour.
         crontab(minute=0),
         cleanup_stale_tasks.s(),
     )
+
+
+def _init_worker_process(**kwargs):
+    # Warm the fetchers once per worker process, so that only the first job on a worker pays for it.
+    # Pools without child processes never send this signal; the fetchers warm up lazily on their first job instead.
+    fetcher_manager.warm_up()
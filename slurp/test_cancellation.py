@@ -0,0 +1,41 @@
+import fakeredis
+import pytest
+
+from slurp.cancellation import CancelWatcher, request_cancel
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeRedis()
+
+
+def test_watcher_hears_request(redis):
+    watcher = CancelWatcher(redis, "fetch")
+    watcher.start()
+    try:
+        assert not watcher.cancelled.is_set()
+        request_cancel(redis, "fetch")
+        assert watcher.cancelled.wait(2), "the request should have been heard"
+    finally:
+        watcher.stop()
+    assert not redis.exists("slurp:cancel:fetch"), "stop should clear the request"
+
+
+def test_watcher_sees_earlier_request(redis):
+    request_cancel(redis, "fetch")
+    watcher = CancelWatcher(redis, "fetch")
+    watcher.start()
+    try:
+        assert watcher.cancelled.is_set()
+    finally:
+        watcher.stop()
+
+
+def test_watcher_ignores_other_fetches(redis):
+    watcher = CancelWatcher(redis, "fetch")
+    watcher.start()
+    try:
+        request_cancel(redis, "other")
+        assert not watcher.cancelled.wait(1.5)
+    finally:
+        watcher.stop()
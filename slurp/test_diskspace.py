@@ -0,0 +1,83 @@
+import os
+import shutil
+
+import fakeredis
+import pytest
+
+from slurp import diskspace
+from slurp.diskspace import (
+    DiskLedger,
+    Reservation,
+    ScratchVolume,
+    ShortOfSpace,
+    fetch_volumes,
+    place_scratch,
+)
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    # Every volume is 1000 bytes, with 600 free.
+    monkeypatch.setattr(
+        diskspace, "_usage", lambda path: shutil._ntuple_diskusage(1000, 400, 600)
+    )
+    return DiskLedger(fakeredis.FakeRedis(), min_free=100)
+
+
+def test_reserve(ledger):
+    volumes = fetch_volumes("/scratch", "/media")
+    a = Reservation(ledger, "a", volumes)
+    b = Reservation(ledger, "b", volumes)
+    assert a.reserve(300) is None
+    short = b.reserve(300)
+    assert short is not None and short[0] == volumes[0], "only 200 bytes are left"
+    assert b.reserve(200) is None
+    assert Reservation(ledger, "c", fetch_volumes("/scratch", "/other")).reserve(1) == (
+        volumes[0],
+        pytest.approx(67.5, abs=7.5),
+    )
+
+    a.hold(60)
+    usage = {u["volume"]: u for u in ledger.usage()}
+    assert usage[volumes[0].name]["reserved"] == 200, (
+        "the scratch space is given back on hand-off"
+    )
+    assert usage[volumes[1].name]["reserved"] == 500
+    assert usage[volumes[1].name]["reservations"] == 2
+
+    a.release()
+    assert b.reserve(500) is None
+
+    with pytest.raises(ShortOfSpace):
+        b.reserve(901)
+
+
+def test_place_scratch(tmp_path, monkeypatch):
+    free = {"shm": 100, "nvme": 1000, "bulk": 5000}
+    monkeypatch.setattr(
+        diskspace,
+        "_usage",
+        lambda path: shutil._ntuple_diskusage(10000, 0, free[os.path.basename(path)]),
+    )
+    volumes = [
+        ScratchVolume(str(tmp_path / "shm"), max_bytes=50),
+        ScratchVolume(str(tmp_path / "nvme")),
+        ScratchVolume(str(tmp_path / "bulk")),
+    ]
+
+    def place(pk, size):
+        return os.path.relpath(place_scratch(pk, volumes, size, 0), tmp_path)
+
+    assert place("a", 10) == "shm/slurp-a", (
+        "small fetches go to the volume kept for them"
+    )
+    assert place("b", None) == "bulk/slurp-b", (
+        "a fetch of unknown size can't be kept to a limit, so it goes where there's most room"
+    )
+    os.makedirs(tmp_path / "bulk" / "slurp-b")
+    assert place("c", 500) == "nvme/slurp-c", "bulk is already busy"
+    assert place("d", 2000) == "bulk/slurp-d", "only bulk has room"
+    assert place("e", 9000) == "bulk/slurp-e", (
+        "nothing has room, so it waits on the roomiest"
+    )
+    assert place("b", 10) == "bulk/slurp-b", "a fetch stays where it started"
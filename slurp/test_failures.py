@@ -0,0 +1,73 @@
+import fakeredis
+import pytest
+
+from slurp.failures import (
+    FailureClass,
+    NegativeCache,
+    canonical_media_id,
+    classify,
+    diagnose,
+)
+from slurp.lib.yt_block_check import VideoStatus
+
+
+@pytest.mark.parametrize(
+    "message,expected",
+    [
+        (
+            "ERROR: [youtube] abc: Private video. Sign in if you've been granted access",
+            FailureClass.permanent,
+        ),
+        (
+            "ERROR: [youtube] abc: Video unavailable. This video has been removed by the uploader",
+            FailureClass.permanent,
+        ),
+        ("error.api.content.video.region", FailureClass.permanent),
+        ("No programmes match your search", FailureClass.permanent),
+        ("HTTP Error 429: Too Many Requests", FailureClass.transient),
+        ("Sign in to confirm you're not a bot", FailureClass.transient),
+        ("Download stalled - no data received for 300s", FailureClass.transient),
+        ("something odd happened", FailureClass.unknown),
+    ],
+)
+def test_classify(message, expected):
+    assert classify(message) == expected
+
+
+def test_diagnose():
+    assert (
+        diagnose(["timed out", "Private video"]).failure_class == FailureClass.permanent
+    )
+    assert diagnose(["timed out", "oops"]).failure_class == FailureClass.transient
+    assert diagnose([]).failure_class == FailureClass.unknown
+    gone = VideoStatus(video_id="abc", exists=False)
+    assert diagnose(["timed out"], gone).failure_class == FailureClass.permanent, (
+        "YouTube saying the video doesn't exist should win out"
+    )
+
+
+def test_canonical_media_id():
+    for url in [
+        "https://www.youtube.com/watch?v=eVrYbKBrI7o&t=10s",
+        "https://youtu.be/eVrYbKBrI7o?si=xyz",
+        "https://www.youtube.com/shorts/eVrYbKBrI7o",
+    ]:
+        assert canonical_media_id(url) == "youtube:eVrYbKBrI7o"
+    assert (
+        canonical_media_id("https://www.bbc.co.uk/iplayer/episode/m001bzq8/some-show")
+        == "bbc:m001bzq8"
+    )
+    assert (
+        canonical_media_id("https://www.example.com/clip/?utm_source=x&id=1")
+        == "url:example.com/clip?id=1"
+    )
+
+
+def test_negative_cache():
+    cache = NegativeCache(fakeredis.FakeRedis(), 60)
+    assert cache.get("https://youtu.be/eVrYbKBrI7o") is None
+    cache.put("https://youtu.be/eVrYbKBrI7o", "Private video", "fetch")
+    entry = cache.get("https://www.youtube.com/watch?v=eVrYbKBrI7o")
+    assert entry.reason == "Private video" and entry.fetch_id == "fetch"
+    cache.clear("https://www.youtube.com/watch?v=eVrYbKBrI7o")
+    assert cache.get("https://youtu.be/eVrYbKBrI7o") is None
@@ -0,0 +1,40 @@
+import fakeredis
+
+from slurp.fairshare import FairQueue, tenant_of
+
+
+def test_share():
+    fair = FairQueue(
+        fakeredis.FakeRedis(), 4, {"*": 2, "archive": 0.5, "news by bob": 3}
+    )
+    assert fair.share(tenant_of("news", "bob")) == 3
+    assert fair.share(tenant_of("news", "archive")) == 0.5
+    assert fair.share(tenant_of("news")) == 2
+
+
+def test_turns_are_shared():
+    fair = FairQueue(fakeredis.FakeRedis(), 2, {"bulk": 1, "news": 2})
+    for i in range(10):
+        fair.push(f"b{i}", "bulk", {"n": i}, 3)
+    for i in range(4):
+        fair.push(f"n{i}", "news", {"n": i}, 3)
+    position = fair.position("n0")
+    assert (position["tenant"], position["position"]) == ("news", 1)
+
+    # The bulk backlog was first in, but news gets twice the turns as soon as it's waiting.
+    started = [pk for pk, _ in fair.dispatch()]
+    assert started == ["b0", "n0"]
+    assert fair.dispatch() == [], "there are no free slots"
+    for pk in started:
+        fair.done(pk)
+    started += [pk for pk, _ in fair.dispatch()]
+    assert started == ["b0", "n0", "n1", "b1"]
+
+    assert fair.push("n1", "news", {}, 3), (
+        "a fetch that's already been handed over should be requeued straight away"
+    )
+    fair.done("b2")
+    assert {t["tenant"]: t["waiting"] for t in fair.tenants()} == {
+        "bulk": 7,
+        "news": 2,
+    }
@@ -0,0 +1,43 @@
+import fakeredis
+
+from slurp.lanes import lane, queue_waits, record_queue_wait, size_rank
+from slurp.models import Fetch
+
+
+def test_lane():
+    assert lane(Fetch.Priority.high) == {"queue": "fetch", "priority": 0}
+    assert lane(Fetch.Priority.high, reserved=True)["queue"] == "fetch_high"
+    assert lane(Fetch.Priority.low, reserved=True) == {"queue": "fetch", "priority": 6}
+
+
+def test_lane_by_size():
+    assert [size_rank(b, 100, 1000) for b in (None, 10, 100, 999, 1000)] == [
+        1,
+        0,
+        1,
+        1,
+        2,
+    ]
+    assert lane(Fetch.Priority.normal, size_rank=2)["priority"] == 5
+    assert (
+        lane(Fetch.Priority.high, size_rank=2)["priority"]
+        < lane(Fetch.Priority.normal)["priority"]
+    ), "a large high priority fetch should still go before a small normal one"
+    assert lane(Fetch.Priority.high, reserved=True, size_rank=2, large=True) == {
+        "queue": "fetch_large",
+        "priority": 2,
+    }
+
+
+def test_queue_waits():
+    redis = fakeredis.FakeRedis()
+    for seconds in range(1, 101):
+        record_queue_wait(redis, Fetch.Priority.normal, seconds)
+    record_queue_wait(redis, Fetch.Priority.high, 2)
+    waits = {w["priority"]: w for w in queue_waits(redis)}
+    assert waits["normal"]["samples"] == 100
+    assert waits["normal"]["p50"] == 51
+    assert waits["normal"]["p95"] == 96
+    assert waits["normal"]["max"] == 100
+    assert waits["high"]["mean"] == 2
+    assert waits["low"] == {"priority": "low", "samples": 0}
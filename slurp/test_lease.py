@@ -0,0 +1,43 @@
+import time
+
+import fakeredis
+import pytest
+
+from slurp.lease import Lease
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeRedis()
+
+
+def test_lease_is_renewed_while_held(redis):
+    lease = Lease(redis, "fetch", 0.3, "leases")
+    assert lease.acquire()
+    try:
+        time.sleep(0.6)
+        assert not Lease(redis, "fetch", 0.3, "leases").acquire(), (
+            "the lease should have been renewed past its ttl"
+        )
+        assert redis.zscore("leases", "fetch") > time.time()
+    finally:
+        lease.release()
+    assert not lease.lost
+    assert redis.zscore("leases", "fetch") is None
+
+
+def test_lease_notices_when_lost(redis):
+    lease = Lease(redis, "fetch", 0.3, "leases")
+    assert lease.acquire()
+    redis.delete("fetch")
+    other = Lease(redis, "fetch", 0.3, "leases")
+    assert other.acquire()
+    try:
+        time.sleep(0.2)
+        assert lease.lost
+        lease.release()
+        assert redis.exists("fetch"), (
+            "a lost lease shouldn't release the new holder's lock"
+        )
+    finally:
+        other.release()
@@ -0,0 +1,60 @@
+import types
+
+import fakeredis
+import flask
+import pytest
+
+from slurp import db
+from slurp.cancellation import CancelWatcher
+from slurp.models import Fetch
+from slurp.progress import ProgressReporter
+from slurp.tasks import _Stage
+
+
+class _CeleryTask:
+    """A stand-in for the Celery task working a fetch, which keeps the states written to it."""
+
+    def __init__(self, task_id: str):
+        self.request = types.SimpleNamespace(id=task_id)
+        self.states: list[tuple[str, str, dict]] = []
+
+    def update_state(self, task_id=None, state=None, meta=None):
+        self.states.append((task_id, state, dict(meta)))
+
+
+@pytest.fixture
+def redis(monkeypatch, tmp_path):
+    redis = fakeredis.FakeRedis()
+    monkeypatch.setattr(db.redis, "_redis_client", redis)
+    app = flask.Flask(__name__)
+    app.config.update(OUTPUT_TEMP=str(tmp_path), FETCH_DISK_MIN_FREE=0)
+    with app.app_context():
+        yield redis
+
+
+def test_coalesced(redis):
+    fetch = Fetch(url="https://example.com/", slug="test")
+    celery_task = _CeleryTask("job")
+    progress = ProgressReporter(celery_task, fetch, interval=3600)
+    progress.stage("download")
+    progress.event("log", "info", "one")
+    progress.event("log", "info", "two")
+    assert len(celery_task.states) == 1, "events are held back until the interval is up"
+    assert celery_task.states[0][0] == "job"
+
+
+def test_stage_flushes_on_exit(redis):
+    fetch = Fetch(url="https://example.com/", slug="test", worker_id="job")
+    fetch.save()
+    celery_task = _CeleryTask("job")
+    stage = _Stage(celery_task, fetch, fetch.lease(60), CancelWatcher(redis, fetch.pk))
+    assert stage.lease.acquire(token="job")
+    with stage:
+        stage.progress = ProgressReporter(celery_task, fetch, interval=3600)
+        stage.progress.stage("download")
+        stage.progress.event("log", "info", "last words")
+    assert celery_task.states[-1] == (
+        "job",
+        "PROGRESS",
+        {"stage": "download", "fetcher": None, "events": 1, "message": "last words"},
+    )
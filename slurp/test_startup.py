@@ -0,0 +1,35 @@
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+_root = pathlib.Path(__file__).parent.parent
+
+# Modules imported on startup, and the heavyweight modules they must not drag in with them.
+_cases = [
+    ("slurp", ["yt_dlp", "pymediainfo", "flask_restx", "flask_wtf"]),
+    ("slurp.tasks", ["yt_dlp", "pymediainfo", "flask_restx", "flask_wtf"]),
+    ("slurp.fetchers", ["yt_dlp", "pymediainfo"]),
+    ("slurp.api", ["yt_dlp", "pymediainfo"]),
+    ("slurp.routes", ["yt_dlp", "pymediainfo"]),
+]
+
+
+@pytest.mark.parametrize(("module", "forbidden"), _cases)
+def test_no_heavy_imports(module: str, forbidden: list[str]):
+    # This has to happen in a fresh interpreter, as the test run will have imported everything already.
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, {module}; print(','.join(m for m in {forbidden!r} if m in sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        cwd=_root,
+        check=True,
+    )
+    assert proc.stdout.strip() == "", (
+        f"importing {module} also imported {proc.stdout.strip()}"
+    )
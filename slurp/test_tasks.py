@@ -0,0 +1,38 @@
+import fakeredis
+import flask
+import pytest
+
+from slurp import db
+from slurp.models import Fetch
+from slurp.tasks import fetch
+
+
+@pytest.fixture(autouse=True)
+def redis(monkeypatch):
+    redis = fakeredis.FakeRedis()
+    monkeypatch.setattr(db.redis, "_redis_client", redis)
+    with flask.Flask(__name__).app_context():
+        yield redis
+
+
+@pytest.mark.parametrize(
+    "worker_id,status",
+    [
+        ("requeued", Fetch.TaskStatus.running),
+        ("job", Fetch.TaskStatus.success),
+        ("job", Fetch.TaskStatus.failed),
+    ],
+)
+def test_stale_delivery(redis, worker_id, status):
+    task = Fetch(
+        url="https://example.com/",
+        slug="test",
+        target="media",
+        worker_id=worker_id,
+        status=status,
+    )
+    task.save()
+    result = fetch.apply(kwargs={"pk": task.pk}, task_id="job")
+    assert result.successful() and result.result is None
+    assert not redis.exists(task.pk), "it shouldn't have been leased"
+    assert Fetch.get(task.pk).status == status